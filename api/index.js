@@ -23,6 +23,43 @@ const pool = new Pool({
     port: parseInt(process.env.DB_PORT || '5432'),
 });
 
+// --- Data-Version Cache ---
+// Same cache as backend/src/server.ts. The data only changes when the ETL
+// commits a load, and every committed load bumps MAX(data_version) in
+// sync_runs (see etl/sync_runs_db.sql). Query results are cached per route and
+// served from memory until the version moves. Entries also expire after
+// CACHE_MAX_AGE_SECONDS, since windows such as "last 30 days" move on even when
+// no new data arrives. The cache lives as long as the warm function instance.
+const responseCache = new Map();
+const CACHE_MAX_AGE_MS = parseInt(process.env.CACHE_MAX_AGE_SECONDS || '3600') * 1000;
+
+async function getDataVersion() {
+    try {
+        const result = await pool.query('SELECT MAX(data_version) AS version FROM sync_runs;');
+        return String(result.rows[0].version ?? 0);
+    } catch (error) {
+        // sync_runs has not been created yet, so there is nothing to key on
+        return null;
+    }
+}
+
+async function cached(key, compute) {
+    // Read the version before computing: if a load lands mid-query, the result
+    // is stored under the older version and recomputed on the next request.
+    const version = await getDataVersion();
+    const entry = responseCache.get(key);
+    if (version !== null && entry && entry.version === version
+        && Date.now() - entry.storedAt < CACHE_MAX_AGE_MS) {
+        return entry.value;
+    }
+
+    const value = await compute();
+    if (version !== null) {
+        responseCache.set(key, { version, value, storedAt: Date.now() });
+    }
+    return value;
+}
+
 // --- API Routes ---
 
 /**
@@ -59,8 +96,12 @@ app.get('/api/health', (req, res) => {
 app.get('/api/products', async (req, res) => {
     console.log("Received request for /api/products");
     try {
-        const result = await pool.query('SELECT id, title, vendor, status FROM products ORDER BY created_at DESC');
-        res.status(200).json(result.rows);
+        const products = await cached('products', async () => {
+            const result = await pool.query(
+                'SELECT id, title, vendor, status FROM products WHERE deleted_at IS NULL ORDER BY created_at DESC');
+            return result.rows;
+        });
+        res.status(200).json(products);
     } catch (error) {
         console.error('Error executing query for products', error);
         res.status(500).json({ error: "Internal Server Error" });
@@ -75,57 +116,60 @@ app.get('/api/products', async (req, res) => {
 app.get('/api/kpis', async (req, res) => {
     console.log("Received request for /api/kpis");
     try {
-        // Check if orders and customers tables exist
-        const checkTablesQuery = `
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name IN ('orders', 'customers');
-        `;
+        const payload = await cached('kpis', async () => {
+            // Check if orders and customers tables exist
+            const checkTablesQuery = `
+                SELECT table_name 
+                FROM information_schema.tables 
+                WHERE table_schema = 'public' 
+                AND table_name IN ('orders', 'customers');
+            `;
         
-        console.log("Checking for tables existence...");
-        const tablesResult = await pool.query(checkTablesQuery);
-        const existingTables = tablesResult.rows.map(row => row.table_name);
-        console.log("Found tables:", existingTables);
+            console.log("Checking for tables existence...");
+            const tablesResult = await pool.query(checkTablesQuery);
+            const existingTables = tablesResult.rows.map(row => row.table_name);
+            console.log("Found tables:", existingTables);
         
-        let kpis = {
-            total_sales: 0,
-            total_orders: 0,
-            new_customers_past_30_days: 0
-        };
-
-        // Only query tables that exist
-        if (existingTables.includes('orders')) {
-            console.log("Querying orders table for sales and order count...");
-            const totalSalesQuery = `SELECT SUM(total_price::numeric) AS total_sales FROM orders;`;
-            const totalOrdersQuery = `SELECT COUNT(*) AS total_orders FROM orders;`;
-
-            const [salesResult, ordersResult] = await Promise.all([
-                pool.query(totalSalesQuery),
-                pool.query(totalOrdersQuery)
-            ]);
+            let kpis = {
+                total_sales: 0,
+                total_orders: 0,
+                new_customers_past_30_days: 0
+            };
+
+            // Only query tables that exist
+            if (existingTables.includes('orders')) {
+                console.log("Querying orders table for sales and order count...");
+                const totalSalesQuery = `SELECT SUM(total_price::numeric) AS total_sales FROM orders WHERE cancelled_at IS NULL;`;
+                const totalOrdersQuery = `SELECT COUNT(*) AS total_orders FROM orders WHERE cancelled_at IS NULL;`;
+
+                const [salesResult, ordersResult] = await Promise.all([
+                    pool.query(totalSalesQuery),
+                    pool.query(totalOrdersQuery)
+                ]);
             
-            console.log("Sales query result:", salesResult.rows[0]);
-            console.log("Orders count result:", ordersResult.rows[0]);
+                console.log("Sales query result:", salesResult.rows[0]);
+                console.log("Orders count result:", ordersResult.rows[0]);
             
-            kpis.total_sales = parseFloat(salesResult.rows[0].total_sales) || 0;
-            kpis.total_orders = parseInt(ordersResult.rows[0].total_orders) || 0;
-        } else {
-            console.log("Orders table not found!");
-        }
-
-        if (existingTables.includes('customers')) {
-            console.log("Querying customers table for new customers...");
-            const newCustomersQuery = `SELECT COUNT(*) AS new_customers_past_30_days FROM customers WHERE created_at >= NOW() - INTERVAL '30 days';`;
-            const customersResult = await pool.query(newCustomersQuery);
-            console.log("New customers result:", customersResult.rows[0]);
-            kpis.new_customers_past_30_days = parseInt(customersResult.rows[0].new_customers_past_30_days) || 0;
-        } else {
-            console.log("Customers table not found!");
-        }
-
-        console.log("Final KPIs:", kpis);
-        res.status(200).json(kpis);
+                kpis.total_sales = parseFloat(salesResult.rows[0].total_sales) || 0;
+                kpis.total_orders = parseInt(ordersResult.rows[0].total_orders) || 0;
+            } else {
+                console.log("Orders table not found!");
+            }
+
+            if (existingTables.includes('customers')) {
+                console.log("Querying customers table for new customers...");
+                const newCustomersQuery = `SELECT COUNT(*) AS new_customers_past_30_days FROM customers WHERE created_at >= NOW() - INTERVAL '30 days' AND deleted_at IS NULL;`;
+                const customersResult = await pool.query(newCustomersQuery);
+                console.log("New customers result:", customersResult.rows[0]);
+                kpis.new_customers_past_30_days = parseInt(customersResult.rows[0].new_customers_past_30_days) || 0;
+            } else {
+                console.log("Customers table not found!");
+            }
+
+            console.log("Final KPIs:", kpis);
+            return kpis;
+        });
+        res.status(200).json(payload);
     } catch (error) {
         console.error('Error executing query for KPIs', error);
         res.status(500).json({ error: "Internal Server Error" });
@@ -140,34 +184,37 @@ app.get('/api/kpis', async (req, res) => {
 app.get('/api/recent-sales', async (req, res) => {
     console.log("Received request for /api/recent-sales");
     try {
-        // Check if orders table exists
-        const checkTableQuery = `
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name = 'orders';
-        `;
+        const payload = await cached('recent-sales', async () => {
+            // Check if orders table exists
+            const checkTableQuery = `
+                SELECT table_name 
+                FROM information_schema.tables 
+                WHERE table_schema = 'public' 
+                AND table_name = 'orders';
+            `;
         
-        const tableResult = await pool.query(checkTableQuery);
+            const tableResult = await pool.query(checkTableQuery);
         
-        if (tableResult.rows.length === 0) {
-            // Orders table doesn't exist, return empty array
-            console.log("Orders table doesn't exist, returning empty sales data");
-            res.status(200).json([]);
-            return;
-        }
-
-        const salesQuery = `
-            SELECT 
-                DATE(created_at) as date, 
-                SUM(total_price::numeric) as daily_sales
-            FROM orders
-            WHERE created_at >= NOW() - INTERVAL '30 days'
-            GROUP BY DATE(created_at)
-            ORDER BY date ASC;
-        `;
-        const result = await pool.query(salesQuery);
-        res.status(200).json(result.rows);
+            if (tableResult.rows.length === 0) {
+                // Orders table doesn't exist, return empty array
+                console.log("Orders table doesn't exist, returning empty sales data");
+                return [];
+            }
+
+            const salesQuery = `
+                SELECT 
+                    DATE(created_at) as date, 
+                    SUM(total_price::numeric) as daily_sales
+                FROM orders
+                WHERE created_at >= NOW() - INTERVAL '30 days'
+                  AND cancelled_at IS NULL
+                GROUP BY DATE(created_at)
+                ORDER BY date ASC;
+            `;
+            const result = await pool.query(salesQuery);
+            return result.rows;
+        });
+        res.status(200).json(payload);
     } catch (error) {
         console.error('Error executing query for recent sales', error);
         res.status(500).json({ error: "Internal Server Error" });
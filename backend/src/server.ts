@@ -23,6 +23,43 @@ const pool = new Pool({
     port: parseInt(process.env.DB_PORT || '5432'),
 });
 
+// --- Data-Version Cache ---
+// The data only changes when the ETL commits a load, and every committed load
+// bumps MAX(data_version) in sync_runs (see etl/sync_runs_db.sql). Query
+// results are cached per route and served from memory until the version moves.
+// Entries also expire after CACHE_MAX_AGE_SECONDS, since windows such as
+// "last 30 days" move on even when no new data arrives.
+type CacheEntry = { version: string; value: unknown; storedAt: number };
+const responseCache = new Map<string, CacheEntry>();
+const CACHE_MAX_AGE_MS = parseInt(process.env.CACHE_MAX_AGE_SECONDS || '3600') * 1000;
+
+async function getDataVersion(): Promise<string | null> {
+    try {
+        const result = await pool.query('SELECT MAX(data_version) AS version FROM sync_runs;');
+        return String(result.rows[0].version ?? 0);
+    } catch (error) {
+        // sync_runs has not been created yet, so there is nothing to key on
+        return null;
+    }
+}
+
+async function cached<T>(key: string, compute: () => Promise<T>): Promise<T> {
+    // Read the version before computing: if a load lands mid-query, the result
+    // is stored under the older version and recomputed on the next request.
+    const version = await getDataVersion();
+    const entry = responseCache.get(key);
+    if (version !== null && entry && entry.version === version
+        && Date.now() - entry.storedAt < CACHE_MAX_AGE_MS) {
+        return entry.value as T;
+    }
+
+    const value = await compute();
+    if (version !== null) {
+        responseCache.set(key, { version, value, storedAt: Date.now() });
+    }
+    return value;
+}
+
 // --- API Routes ---
 
 /**
@@ -59,9 +96,12 @@ app.get('/api/health', (req: Request, res: Response) => {
 app.get('/api/products', async (req: Request, res: Response) => {
     console.log("Received request for /api/products");
     try {
-        const result = await pool.query(
-            'SELECT id, title, vendor, product_type, handle, tags,status FROM products ORDER BY created_at DESC');
-        res.status(200).json(result.rows);
+        const products = await cached('products', async () => {
+            const result = await pool.query(
+                'SELECT id, title, vendor, product_type, handle, tags,status FROM products WHERE deleted_at IS NULL ORDER BY created_at DESC');
+            return result.rows;
+        });
+        res.status(200).json(products);
     } catch (error) {
         console.error('Error executing query for products', error);
         res.status(500).json({ error: "Internal Server Error" });
@@ -77,57 +117,60 @@ app.get('/api/products', async (req: Request, res: Response) => {
 app.get('/api/kpis', async (req: Request, res: Response) => {
     console.log("Received request for /api/kpis");
     try {
-        // Check if orders and customers tables exist
-        const checkTablesQuery = `
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name IN ('orders', 'customers');
-        `;
+        const payload = await cached('kpis', async () => {
+            // Check if orders and customers tables exist
+            const checkTablesQuery = `
+                SELECT table_name 
+                FROM information_schema.tables 
+                WHERE table_schema = 'public' 
+                AND table_name IN ('orders', 'customers');
+            `;
         
-        console.log("Checking for tables existence...");
-        const tablesResult = await pool.query(checkTablesQuery);
-        const existingTables = tablesResult.rows.map(row => row.table_name);
-        console.log("Found tables:", existingTables);
+            console.log("Checking for tables existence...");
+            const tablesResult = await pool.query(checkTablesQuery);
+            const existingTables = tablesResult.rows.map(row => row.table_name);
+            console.log("Found tables:", existingTables);
         
-        let kpis = {
-            total_sales: 0,
-            total_orders: 0,
-            new_customers_past_30_days: 0
-        };
+            let kpis = {
+                total_sales: 0,
+                total_orders: 0,
+                new_customers_past_30_days: 0
+            };
 
-        // Only query tables that exist
-        if (existingTables.includes('orders')) {
-            console.log("Querying orders table for sales and order count...");
-            const totalSalesQuery = `SELECT SUM(total_price::numeric) AS total_sales FROM orders;`;
-            const totalOrdersQuery = `SELECT COUNT(*) AS total_orders FROM orders;`;
+            // Only query tables that exist
+            if (existingTables.includes('orders')) {
+                console.log("Querying orders table for sales and order count...");
+                const totalSalesQuery = `SELECT SUM(total_price::numeric) AS total_sales FROM orders WHERE cancelled_at IS NULL;`;
+                const totalOrdersQuery = `SELECT COUNT(*) AS total_orders FROM orders WHERE cancelled_at IS NULL;`;
 
-            const [salesResult, ordersResult] = await Promise.all([
-                pool.query(totalSalesQuery),
-                pool.query(totalOrdersQuery)
-            ]);
+                const [salesResult, ordersResult] = await Promise.all([
+                    pool.query(totalSalesQuery),
+                    pool.query(totalOrdersQuery)
+                ]);
             
-            console.log("Sales query result:", salesResult.rows[0]);
-            console.log("Orders count result:", ordersResult.rows[0]);
+                console.log("Sales query result:", salesResult.rows[0]);
+                console.log("Orders count result:", ordersResult.rows[0]);
             
-            kpis.total_sales = parseFloat(salesResult.rows[0].total_sales) || 0;
-            kpis.total_orders = parseInt(ordersResult.rows[0].total_orders) || 0;
-        } else {
-            console.log("Orders table not found!");
-        }
+                kpis.total_sales = parseFloat(salesResult.rows[0].total_sales) || 0;
+                kpis.total_orders = parseInt(ordersResult.rows[0].total_orders) || 0;
+            } else {
+                console.log("Orders table not found!");
+            }
 
-        if (existingTables.includes('customers')) {
-            console.log("Querying customers table for new customers...");
-            const newCustomersQuery = `SELECT COUNT(*) AS new_customers_past_30_days FROM customers WHERE created_at >= NOW() - INTERVAL '30 days';`;
-            const customersResult = await pool.query(newCustomersQuery);
-            console.log("New customers result:", customersResult.rows[0]);
-            kpis.new_customers_past_30_days = parseInt(customersResult.rows[0].new_customers_past_30_days) || 0;
-        } else {
-            console.log("Customers table not found!");
-        }
+            if (existingTables.includes('customers')) {
+                console.log("Querying customers table for new customers...");
+                const newCustomersQuery = `SELECT COUNT(*) AS new_customers_past_30_days FROM customers WHERE created_at >= NOW() - INTERVAL '30 days' AND deleted_at IS NULL;`;
+                const customersResult = await pool.query(newCustomersQuery);
+                console.log("New customers result:", customersResult.rows[0]);
+                kpis.new_customers_past_30_days = parseInt(customersResult.rows[0].new_customers_past_30_days) || 0;
+            } else {
+                console.log("Customers table not found!");
+            }
 
-        console.log("Final KPIs:", kpis);
-        res.status(200).json(kpis);
+            console.log("Final KPIs:", kpis);
+            return kpis;
+        });
+        res.status(200).json(payload);
     } catch (error) {
         console.error('Error executing query for KPIs', error);
         res.status(500).json({ error: "Internal Server Error" });
@@ -143,34 +186,37 @@ app.get('/api/kpis', async (req: Request, res: Response) => {
 app.get('/api/recent-sales', async (req: Request, res: Response) => {
     console.log("Received request for /api/recent-sales");
     try {
-        // Check if orders table exists
-        const checkTableQuery = `
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name = 'orders';
-        `;
+        const payload = await cached('recent-sales', async () => {
+            // Check if orders table exists
+            const checkTableQuery = `
+                SELECT table_name 
+                FROM information_schema.tables 
+                WHERE table_schema = 'public' 
+                AND table_name = 'orders';
+            `;
         
-        const tableResult = await pool.query(checkTableQuery);
+            const tableResult = await pool.query(checkTableQuery);
         
-        if (tableResult.rows.length === 0) {
-            // Orders table doesn't exist, return empty array
-            console.log("Orders table doesn't exist, returning empty sales data");
-            res.status(200).json([]);
-            return;
-        }
+            if (tableResult.rows.length === 0) {
+                // Orders table doesn't exist, return empty array
+                console.log("Orders table doesn't exist, returning empty sales data");
+                return [];
+            }
 
-        const salesQuery = `
-            SELECT 
-                DATE(created_at) as date, 
-                SUM(total_price::numeric) as daily_sales
-            FROM orders
-            WHERE created_at >= NOW() - INTERVAL '30 days'
-            GROUP BY DATE(created_at)
-            ORDER BY date ASC;
-        `;
-        const result = await pool.query(salesQuery);
-        res.status(200).json(result.rows);
+            const salesQuery = `
+                SELECT 
+                    DATE(created_at) as date, 
+                    SUM(total_price::numeric) as daily_sales
+                FROM orders
+                WHERE created_at >= NOW() - INTERVAL '30 days'
+                  AND cancelled_at IS NULL
+                GROUP BY DATE(created_at)
+                ORDER BY date ASC;
+            `;
+            const result = await pool.query(salesQuery);
+            return result.rows;
+        });
+        res.status(200).json(payload);
     } catch (error) {
         console.error('Error executing query for recent sales', error);
         res.status(500).json({ error: "Internal Server Error" });
@@ -185,39 +231,42 @@ app.get('/api/recent-sales', async (req: Request, res: Response) => {
 app.get('/api/customers', async (req: Request, res: Response) => {
     console.log("Received request for /api/customers");
     try {
-        // Check if customers table exists
-        const checkTableQuery = `
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name = 'customers';
-        `;
+        const payload = await cached('customers', async () => {
+            // Check if customers table exists
+            const checkTableQuery = `
+                SELECT table_name 
+                FROM information_schema.tables 
+                WHERE table_schema = 'public' 
+                AND table_name = 'customers';
+            `;
         
-        const tableResult = await pool.query(checkTableQuery);
+            const tableResult = await pool.query(checkTableQuery);
         
-        if (tableResult.rows.length === 0) {
-            console.log("Customers table doesn't exist, returning empty array");
-            res.status(200).json([]);
-            return;
-        }
+            if (tableResult.rows.length === 0) {
+                console.log("Customers table doesn't exist, returning empty array");
+                return [];
+            }
 
-        const customersQuery = `
-            SELECT 
-                id, 
-                first_name, 
-                last_name, 
-                email,
-                COALESCE(total_spent::numeric, 0) as total_spent,
-                COALESCE(orders_count, 0) as orders_count,
-                created_at
-            FROM customers 
-            ORDER BY created_at DESC 
-            LIMIT 100;
-        `;
+            const customersQuery = `
+                SELECT 
+                    id, 
+                    first_name, 
+                    last_name, 
+                    email,
+                    COALESCE(total_spent::numeric, 0) as total_spent,
+                    COALESCE(orders_count, 0) as orders_count,
+                    created_at
+                FROM customers 
+                WHERE deleted_at IS NULL
+                ORDER BY created_at DESC 
+                LIMIT 100;
+            `;
         
-        const result = await pool.query(customersQuery);
-        console.log(`Found ${result.rows.length} customers`);
-        res.status(200).json(result.rows);
+            const result = await pool.query(customersQuery);
+            console.log(`Found ${result.rows.length} customers`);
+            return result.rows;
+        });
+        res.status(200).json(payload);
     } catch (error) {
         console.error('Error executing query for customers', error);
         res.status(500).json({ error: "Internal Server Error" });
@@ -232,57 +281,59 @@ app.get('/api/customers', async (req: Request, res: Response) => {
 app.get('/api/orders', async (req: Request, res: Response) => {
     console.log("Received request for /api/orders");
     try {
-        // Check if orders table exists
-        const checkTableQuery = `
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name = 'orders';
-        `;
+        const payload = await cached('orders', async () => {
+            // Check if orders table exists
+            const checkTableQuery = `
+                SELECT table_name 
+                FROM information_schema.tables 
+                WHERE table_schema = 'public' 
+                AND table_name = 'orders';
+            `;
         
-        const tableResult = await pool.query(checkTableQuery);
+            const tableResult = await pool.query(checkTableQuery);
         
-        if (tableResult.rows.length === 0) {
-            console.log("Orders table doesn't exist, returning empty array");
-            res.status(200).json([]);
-            return;
-        }
+            if (tableResult.rows.length === 0) {
+                console.log("Orders table doesn't exist, returning empty array");
+                return [];
+            }
 
-        const ordersQuery = `
-            SELECT 
-                o.id,
-                o.total_price::numeric as total_price,
-                o.created_at,
-                o.financial_status,
-                o.fulfillment_status,
-                o.number_of_items,
-                c.first_name,
-                c.last_name
-            FROM orders o
-            LEFT JOIN customers c ON o.customer_id = c.id
-            ORDER BY o.created_at DESC 
-            LIMIT 100;
-        `;
+            const ordersQuery = `
+                SELECT 
+                    o.id,
+                    o.total_price::numeric as total_price,
+                    o.created_at,
+                    o.financial_status,
+                    o.fulfillment_status,
+                    o.number_of_items,
+                    c.first_name,
+                    c.last_name
+                FROM orders o
+                LEFT JOIN customers c ON o.customer_id = c.id AND c.deleted_at IS NULL
+                ORDER BY o.created_at DESC 
+                LIMIT 100;
+            `;
         
-        const result = await pool.query(ordersQuery);
+            const result = await pool.query(ordersQuery);
         
-        // Format the response to match frontend expectations
-        const formattedOrders = result.rows.map(row => ({
-            id: row.id,
-            order_number: `#${row.id}`, // Generate order number from ID since no order_number column exists
-            total_price: parseFloat(row.total_price) || 0,
-            created_at: row.created_at,
-            customer: {
-                first_name: row.first_name || 'Unknown',
-                last_name: row.last_name || 'Customer'
-            },
-            financial_status: row.financial_status || 'pending',
-            fulfillment_status: row.fulfillment_status || 'unfulfilled',
-            number_of_items: row.number_of_items || 0
-        }));
+            // Format the response to match frontend expectations
+            const formattedOrders = result.rows.map(row => ({
+                id: row.id,
+                order_number: `#${row.id}`, // Generate order number from ID since no order_number column exists
+                total_price: parseFloat(row.total_price) || 0,
+                created_at: row.created_at,
+                customer: {
+                    first_name: row.first_name || 'Unknown',
+                    last_name: row.last_name || 'Customer'
+                },
+                financial_status: row.financial_status || 'pending',
+                fulfillment_status: row.fulfillment_status || 'unfulfilled',
+                number_of_items: row.number_of_items || 0
+            }));
         
-        console.log(`Found ${formattedOrders.length} orders`);
-        res.status(200).json(formattedOrders);
+            console.log(`Found ${formattedOrders.length} orders`);
+            return formattedOrders;
+        });
+        res.status(200).json(payload);
     } catch (error) {
         console.error('Error executing query for orders', error);
         res.status(500).json({ error: "Internal Server Error" });
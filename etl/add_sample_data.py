@@ -120,7 +120,7 @@ def add_sample_data():
     finally:
         conn.close()
 
-if __name__ == "__main__":
+def main():
     print("Adding sample data for testing...")
     success = add_sample_data()
     
@@ -130,4 +130,7 @@ if __name__ == "__main__":
     else:
         print("\nFailed to add sample data.")
     
-    print("Done.")
\ No newline at end of file
+    print("Done.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Offline analytics over the Parquet snapshots written by export_parquet.py.
+
+Runs the dashboard KPIs from backend/src/server.ts (total sales, order count,
+new customers in the last 30 days, daily sales), plus a few richer queries, on
+an embedded DuckDB database instead of the production Postgres.
+
+Every export keeps the versions of rows it saw, so the snapshot can be read
+"as of" any earlier moment: each table view keeps, per id, the newest version
+synced at or before that moment.
+
+Requires duckdb (pip install duckdb).
+"""
+import argparse
+import os
+from datetime import datetime, timezone
+
+import duckdb
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports"))
+
+SNAPSHOT_TABLES = ["products", "customers", "orders", "order_line_items"]
+
+# Queries are shared with bench_analytics.py, which runs them on Postgres too.
+# {as_of} is the reference time parameter, written in each engine's syntax.
+QUERIES = {
+    "total_sales": """
+        SELECT COALESCE(SUM(total_price), 0) AS total_sales
+        FROM orders
+        WHERE created_at <= {as_of}
+          AND cancelled_at IS NULL;
+    """,
+    "total_orders": """
+        SELECT COUNT(*) AS total_orders
+        FROM orders
+        WHERE created_at <= {as_of}
+          AND cancelled_at IS NULL;
+    """,
+    "new_customers_past_30_days": """
+        SELECT COUNT(*) AS new_customers_past_30_days
+        FROM customers
+        WHERE created_at >= {as_of} - INTERVAL '30 days'
+          AND created_at <= {as_of}
+          AND deleted_at IS NULL;
+    """,
+    "daily_sales": """
+        SELECT CAST(created_at AS DATE) AS date, SUM(total_price) AS daily_sales
+        FROM orders
+        WHERE created_at >= {as_of} - INTERVAL '30 days'
+          AND created_at <= {as_of}
+          AND cancelled_at IS NULL
+        GROUP BY CAST(created_at AS DATE)
+        ORDER BY date ASC;
+    """,
+    "monthly_revenue": """
+        SELECT date_trunc('month', created_at) AS month,
+               COUNT(*) AS orders,
+               SUM(total_price) AS revenue,
+               ROUND(AVG(total_price), 2) AS average_order_value
+        FROM orders
+        WHERE created_at <= {as_of}
+          AND cancelled_at IS NULL
+        GROUP BY 1
+        ORDER BY 1 ASC;
+    """,
+    "top_products": """
+        SELECT li.product_id,
+               MAX(li.title) AS title,
+               SUM(li.quantity) AS units,
+               SUM(li.quantity * li.price) AS revenue
+        FROM order_line_items li
+        JOIN orders o ON o.id = li.order_id
+        WHERE o.created_at <= {as_of}
+          AND o.cancelled_at IS NULL
+        GROUP BY li.product_id
+        ORDER BY revenue DESC NULLS LAST
+        LIMIT 10;
+    """,
+    "sales_by_vendor": """
+        SELECT COALESCE(li.vendor, 'Unknown') AS vendor,
+               SUM(li.quantity * li.price) AS revenue
+        FROM order_line_items li
+        JOIN orders o ON o.id = li.order_id
+        WHERE o.created_at <= {as_of}
+          AND o.cancelled_at IS NULL
+        GROUP BY 1
+        ORDER BY revenue DESC NULLS LAST;
+    """,
+    "repeat_customer_rate": """
+        SELECT COUNT(*) AS customers_with_orders,
+               COUNT(*) FILTER (WHERE orders > 1) AS repeat_customers,
+               ROUND(COUNT(*) FILTER (WHERE orders > 1) * 100.0 / NULLIF(COUNT(*), 0), 2) AS repeat_rate_percent
+        FROM (
+            SELECT customer_id, COUNT(*) AS orders
+            FROM orders
+            WHERE customer_id IS NOT NULL AND created_at <= {as_of}
+              AND cancelled_at IS NULL
+            GROUP BY customer_id
+        ) per_customer;
+    """,
+}
+
+KPI_QUERIES = ["total_sales", "total_orders", "new_customers_past_30_days"]
+
+DUCKDB_PARAMETER = "$as_of"
+
+def _snapshot_relation(export_dir, table, as_of):
+    """
+    SQL for the latest version of each row of a table synced at or before as_of.
+    """
+    pattern = os.path.join(export_dir, table, "*", "*.parquet").replace("'", "''")
+    as_of_filter = f"WHERE last_synced_at <= TIMESTAMPTZ '{as_of.isoformat()}'" if as_of else ""
+    return f"""
+        SELECT * EXCLUDE (version_rank, date) FROM (
+            SELECT *, row_number() OVER (PARTITION BY id ORDER BY last_synced_at DESC) AS version_rank
+            FROM read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)
+            {as_of_filter}
+        )
+        WHERE version_rank = 1
+    """
+
+def connect(export_dir=EXPORT_DIR, database=":memory:", as_of=None, materialize=True):
+    """
+    Opens a DuckDB database over the Parquet snapshot in export_dir.
+
+    With materialize=True the deduplicated tables are loaded once into DuckDB's
+    columnar storage, which makes repeated queries much faster; otherwise they
+    are views that re-read the Parquet files on every query.
+    """
+    con = duckdb.connect(database)
+    con.execute("SET TimeZone = 'UTC';")
+    kind = "TABLE" if materialize else "VIEW"
+    existing = dict(con.execute("SELECT table_name, table_type FROM information_schema.tables;").fetchall())
+    for table in SNAPSHOT_TABLES:
+        if not os.path.isdir(os.path.join(export_dir, table)):
+            print(f"No {table} snapshot in {export_dir}; run export_parquet.py first.")
+            continue
+        # A persistent database may hold the other kind from an earlier run
+        if table in existing:
+            con.execute(f"DROP {'VIEW' if existing[table] == 'VIEW' else 'TABLE'} {table};")
+        con.execute(f"CREATE {kind} {table} AS {_snapshot_relation(export_dir, table, as_of)};")
+    return con
+
+def run_query(con, name, as_of=None):
+    """
+    Runs one of QUERIES and returns its rows as a list of dicts.
+    """
+    as_of = as_of or datetime.now(timezone.utc)
+    cur = con.execute(QUERIES[name].format(as_of=DUCKDB_PARAMETER), {"as_of": as_of})
+    columns = [column[0] for column in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+def kpis(con, as_of=None):
+    """
+    Returns the dashboard KPIs in the same shape as GET /api/kpis.
+    """
+    result = {}
+    for name in KPI_QUERIES:
+        result.update(run_query(con, name, as_of)[0])
+    result["total_sales"] = float(result["total_sales"] or 0)
+    return result
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run dashboard analytics on the local Parquet snapshot.")
+    parser.add_argument("queries", nargs="*", metavar="query",
+                        help=f"queries to run: {', '.join(QUERIES)} (default: KPIs and daily sales)")
+    parser.add_argument("--export-dir", default=EXPORT_DIR, help="snapshot directory (default: %(default)s)")
+    parser.add_argument("--database", default=":memory:", help="DuckDB file to build (default: in memory)")
+    parser.add_argument("--as-of", type=datetime.fromisoformat,
+                        help="ISO timestamp to evaluate the snapshot at (default: now)")
+    args = parser.parse_args()
+    unknown = [name for name in args.queries if name not in QUERIES]
+    if unknown:
+        parser.error(f"unknown queries: {', '.join(unknown)}")
+
+    as_of = args.as_of
+    if as_of and as_of.tzinfo is None:
+        as_of = as_of.replace(tzinfo=timezone.utc)
+
+    con = connect(args.export_dir, args.database, as_of=as_of)
+
+    print("=" * 60)
+    print(f"ANALYTICS AS OF {(as_of or datetime.now(timezone.utc)).isoformat()}")
+    print("=" * 60)
+
+    for name in args.queries or KPI_QUERIES + ["daily_sales"]:
+        rows = run_query(con, name, as_of)
+        print(f"\n{name}:")
+        for row in rows:
+            print("   " + ", ".join(f"{key}={value}" for key, value in row.items()))
+
+    con.close()
@@ -0,0 +1,82 @@
+"""
+Latency benchmark of the analytics queries on DuckDB versus Postgres.
+
+Runs every query in analytics_duckdb.QUERIES against the local Parquet
+snapshot (through DuckDB) and against the live database, and prints the median
+latency of each side. Run export_parquet.py first so both hold the same data.
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timezone
+
+import analytics_duckdb
+from sync_all_data import get_db_connection
+
+POSTGRES_PARAMETER = "%(as_of)s"
+
+def time_call(fn, repeat):
+    """
+    Calls fn once to warm up, then `repeat` times; returns the median in ms.
+    """
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def bench(queries, repeat, export_dir):
+    as_of = datetime.now(timezone.utc)
+
+    start = time.perf_counter()
+    duck = analytics_duckdb.connect(export_dir)
+    load_ms = (time.perf_counter() - start) * 1000
+    print(f"Loaded DuckDB snapshot in {load_ms:.1f} ms")
+
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    results = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET TIME ZONE 'UTC';")
+
+            for name in queries:
+                sql = analytics_duckdb.QUERIES[name]
+
+                def run_postgres():
+                    cur.execute(sql.format(as_of=POSTGRES_PARAMETER), {"as_of": as_of})
+                    cur.fetchall()
+
+                def run_duckdb():
+                    analytics_duckdb.run_query(duck, name, as_of)
+
+                results.append((name, time_call(run_postgres, repeat), time_call(run_duckdb, repeat)))
+        conn.rollback()
+    finally:
+        conn.close()
+        duck.close()
+
+    print(f"\n{'query':<30}{'postgres ms':>14}{'duckdb ms':>12}{'speedup':>10}")
+    for name, postgres_ms, duckdb_ms in results:
+        speedup = postgres_ms / duckdb_ms if duckdb_ms else float('inf')
+        print(f"{name:<30}{postgres_ms:>14.2f}{duckdb_ms:>12.2f}{speedup:>9.1f}x")
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare analytics query latency on DuckDB and Postgres.")
+    parser.add_argument("queries", nargs="*", metavar="query",
+                        help="queries to benchmark (default: all)")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per query (default: %(default)s)")
+    parser.add_argument("--export-dir", default=analytics_duckdb.EXPORT_DIR,
+                        help="snapshot directory (default: %(default)s)")
+    args = parser.parse_args()
+    unknown = [name for name in args.queries if name not in analytics_duckdb.QUERIES]
+    if unknown:
+        parser.error(f"unknown queries: {', '.join(unknown)}")
+
+    bench(args.queries or list(analytics_duckdb.QUERIES), args.repeat, args.export_dir)
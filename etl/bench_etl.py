@@ -0,0 +1,359 @@
+"""
+Regression benchmark for the ETL's decode and transform stages.
+
+Builds synthetic Shopify pages shaped like real API responses (addresses,
+nested line items, images, body_html), then measures records/sec and peak
+memory of decoding them into records.py types and transforming them. Results
+are compared against a saved baseline and the script exits non-zero when
+throughput drops, or peak memory grows, by more than the tolerance.
+
+Absolute records/sec moves by tens of percent with machine load and CPU
+frequency, so throughput is compared relative to a reference workload (plain
+json.loads of the same pages) timed in the same run, interleaved with the
+pipeline, and each is the median of --repeat runs.
+
+    python bench_etl.py --save-baseline   # record the current numbers
+    python bench_etl.py                   # compare against them
+    python bench_etl.py --compare-records # raw dicts vs compact records
+    python bench_etl.py --compare-transfer # full vs fields= projected pages
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import sync_all_data
+from records import RECORD_TYPES, projection
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+DEFAULT_TOLERANCE = 0.20
+DEFAULT_REPEAT = 7
+PAGE_SIZE = 250
+
+def _address(rng):
+    return {
+        "first_name": rng.choice(["Ada", "Grace", "Linus", "Barbara"]),
+        "last_name": rng.choice(["Lovelace", "Hopper", "Torvalds", "Liskov"]),
+        "address1": f"{rng.randint(1, 999)} Main Street",
+        "address2": None,
+        "city": "Springfield",
+        "province": "Ontario",
+        "country": "Canada",
+        "zip": "K1A 0B1",
+        "phone": "+1-555-0100",
+        "company": None,
+        "latitude": rng.uniform(-90, 90),
+        "longitude": rng.uniform(-180, 180),
+        "country_code": "CA",
+        "province_code": "ON",
+    }
+
+def make_product(rng, product_id):
+    variants = [{
+        "id": product_id * 10 + v,
+        "product_id": product_id,
+        "title": f"Size {v}",
+        "price": f"{rng.uniform(5, 200):.2f}",
+        "sku": f"SKU-{product_id}-{v}",
+        "position": v + 1,
+        "compare_at_price": None,
+        "inventory_item_id": product_id * 100 + v,
+        "inventory_quantity": rng.randint(0, 500),
+        "created_at": "2025-08-01T12:00:00-04:00",
+        "updated_at": "2025-08-02T12:00:00-04:00",
+        "weight": 0.5,
+        "weight_unit": "kg",
+        "requires_shipping": True,
+    } for v in range(rng.randint(1, 4))]
+    return {
+        "id": product_id,
+        "title": f"Product {product_id}",
+        "body_html": "<p>" + "Lorem ipsum dolor sit amet. " * 40 + "</p>",
+        "vendor": rng.choice(["Acme", "Globex", "Initech"]),
+        "product_type": rng.choice(["Shirts", "Shoes", "Hats"]),
+        "created_at": "2025-08-01T12:00:00-04:00",
+        "updated_at": "2025-08-02T12:00:00-04:00",
+        "published_at": "2025-08-01T12:00:00-04:00",
+        "handle": f"product-{product_id}",
+        "status": "active",
+        "tags": "summer, sale",
+        "variants": variants,
+        "options": [{"name": "Size", "values": [v["title"] for v in variants]}],
+        "images": [{"id": product_id * 7 + i, "src": f"https://cdn.example.com/{product_id}/{i}.jpg",
+                    "width": 1024, "height": 1024} for i in range(3)],
+    }
+
+def make_customer(rng, customer_id):
+    return {
+        "id": customer_id,
+        "email": f"customer{customer_id}@example.com",
+        "first_name": "Ada",
+        "last_name": "Lovelace",
+        "orders_count": rng.randint(0, 20),
+        "total_spent": f"{rng.uniform(0, 2000):.2f}",
+        "state": "enabled",
+        "created_at": "2025-08-01T12:00:00-04:00",
+        "updated_at": "2025-08-02T12:00:00-04:00",
+        "note": None,
+        "verified_email": True,
+        "tags": "vip",
+        "currency": "CAD",
+        "phone": None,
+        "addresses": [_address(rng) for _ in range(2)],
+        "default_address": _address(rng),
+    }
+
+def make_order(rng, order_id):
+    line_items = [{
+        "id": order_id * 10 + i,
+        "product_id": rng.randint(1, 5000),
+        "variant_id": rng.randint(1, 50000),
+        "title": f"Product {i}",
+        "sku": f"SKU-{i}",
+        "vendor": "Acme",
+        "quantity": rng.randint(1, 3),
+        "price": f"{rng.uniform(5, 200):.2f}",
+        "grams": 500,
+        "taxable": True,
+        "properties": [],
+        "tax_lines": [{"title": "HST", "price": "1.30", "rate": 0.13}],
+        "discount_allocations": [],
+    } for i in range(rng.randint(1, 5))]
+    return {
+        "id": order_id,
+        "name": f"#{order_id}",
+        "email": "customer@example.com",
+        "created_at": "2025-08-01T12:00:00-04:00",
+        "updated_at": "2025-08-02T12:00:00-04:00",
+        "total_price": f"{rng.uniform(10, 500):.2f}",
+        "subtotal_price": "90.00",
+        "total_tax": "10.00",
+        "currency": "CAD",
+        "financial_status": rng.choice(["paid", "pending", "refunded"]),
+        "fulfillment_status": rng.choice([None, "fulfilled"]),
+        "cancelled_at": None,
+        "customer": make_customer(rng, rng.randint(10000, 20000)),
+        "billing_address": _address(rng),
+        "shipping_address": _address(rng),
+        "line_items": line_items,
+        "shipping_lines": [{"title": "Standard", "price": "5.00"}],
+        "note_attributes": [],
+    }
+
+GENERATORS = {
+    "products": (make_product, sync_all_data.product_row),
+    "customers": (make_customer, sync_all_data.customer_row),
+    "orders": (make_order, sync_all_data.order_row),
+}
+
+def make_pages(entity, records, seed=42, fields=None):
+    """
+    Returns the JSON bodies of synthetic pages holding `records` records,
+    keeping only `fields` (a fields= string) when given, as Shopify would.
+    """
+    rng = random.Random(seed)
+    make_record = GENERATORS[entity][0]
+    keep = fields.split(",") if fields else None
+    bodies = []
+    for start in range(0, records, PAGE_SIZE):
+        page = [make_record(rng, 10000 + i) for i in range(start, min(start + PAGE_SIZE, records))]
+        if keep:
+            page = [{field: record[field] for field in keep if field in record} for record in page]
+        bodies.append(json.dumps({entity: page}).encode())
+    return bodies
+
+def run_pipeline(entity, bodies):
+    """
+    Decodes and transforms the pages the way a sync does and keeps the
+    decoded records alive, as the loaders need them.
+    """
+    row_fn = GENERATORS[entity][1]
+    records = []
+    rows = []
+    for body in bodies:
+        page = sync_all_data.decode_page(entity, body, RECORD_TYPES[entity])
+        records.extend(page)
+        rows.extend(row_fn(record) for record in page)
+    return records, rows
+
+def run_reference(bodies):
+    """
+    The reference workload: parsing the pages with nothing of the ETL's own
+    code, so its speed tracks the machine rather than the code under test.
+    """
+    for body in bodies:
+        json.loads(body)
+
+def measure(entity, records, repeat):
+    """
+    Returns records/sec of the pipeline and of the reference workload
+    (medians of `repeat` interleaved runs), the median ratio of their
+    throughput over the pairs of runs, and peak traced memory in bytes.
+    """
+    bodies = make_pages(entity, records)
+
+    pipeline_times = []
+    reference_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_reference(bodies)
+        reference_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        run_pipeline(entity, bodies)
+        pipeline_times.append(time.perf_counter() - start)
+    pipeline_seconds = statistics.median(pipeline_times)
+    reference_seconds = statistics.median(reference_times)
+    # Each pair of runs saw about the same machine, so their ratio cancels
+    # out most of the drift that absolute timings pick up between runs.
+    relative = statistics.median(reference / pipeline for reference, pipeline in zip(reference_times, pipeline_times))
+
+    tracemalloc.start()
+    result = run_pipeline(entity, bodies)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {
+        "records_per_sec": round(records / pipeline_seconds, 1),
+        "reference_per_sec": round(records / reference_seconds, 1),
+        "relative": round(relative, 4),
+        "peak_bytes": peak,
+    }
+
+def retained_bytes(entity, bodies, record_type):
+    """
+    Returns the memory still held once every page is decoded, with the
+    records kept either as raw dicts (record_type=None) or compact records.
+    """
+    tracemalloc.start()
+    records = [record for body in bodies for record in sync_all_data.decode_page(entity, body, record_type)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return current
+
+def compare_records(entity, records):
+    """
+    Measures per-record memory of raw Shopify dicts against records.py types.
+    """
+    bodies = make_pages(entity, records)
+    dict_bytes = retained_bytes(entity, bodies, None)
+    record_bytes = retained_bytes(entity, bodies, RECORD_TYPES[entity])
+    return dict_bytes / records, record_bytes / records
+
+def compare_transfer(entity, records):
+    """
+    Compares full and projected pages: (label, raw bytes, gzip bytes,
+    decode ms) per page, averaged over the synthetic pages.
+    """
+    results = []
+    for label, fields in (("full", None), ("projected", projection(RECORD_TYPES[entity]))):
+        bodies = make_pages(entity, records, fields=fields)
+        raw = sum(len(body) for body in bodies) / len(bodies)
+        compressed = sum(len(gzip.compress(body)) for body in bodies) / len(bodies)
+        start = time.perf_counter()
+        for body in bodies:
+            sync_all_data.decode_page(entity, body, RECORD_TYPES[entity])
+        decode_ms = (time.perf_counter() - start) * 1000 / len(bodies)
+        results.append((label, raw, compressed, decode_ms))
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a list of regression messages; empty when within tolerance.
+    Throughput is compared relative to the reference workload; baselines
+    saved before it was measured fall back to absolute records/sec.
+    """
+    failures = []
+    for entity, result in results.items():
+        expected = baseline.get(entity)
+        if not expected:
+            continue
+        if "relative" in expected:
+            floor = expected["relative"] * (1 - tolerance)
+            if result["relative"] < floor:
+                failures.append(f"{entity}: throughput is {result['relative']:.3f}x the reference workload, "
+                                f"below {floor:.3f}x (baseline {expected['relative']:.3f}x)")
+        else:
+            floor = expected["records_per_sec"] * (1 - tolerance)
+            if result["records_per_sec"] < floor:
+                failures.append(f"{entity}: {result['records_per_sec']:.0f} records/sec is below "
+                                f"{floor:.0f} (baseline {expected['records_per_sec']:.0f})")
+        ceiling = expected["peak_bytes"] * (1 + tolerance)
+        if result["peak_bytes"] > ceiling:
+            failures.append(f"{entity}: peak memory {result['peak_bytes'] / 2**20:.1f} MiB is above "
+                            f"{ceiling / 2**20:.1f} MiB (baseline {expected['peak_bytes'] / 2**20:.1f} MiB)")
+    return failures
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ETL decode/transform throughput and memory.")
+    parser.add_argument("entities", nargs="*", metavar="entity",
+                        help=f"entities to benchmark: {', '.join(GENERATORS)} (default: all)")
+    parser.add_argument("--records", type=int, default=10000, help="records per entity (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="timed runs, the median is kept (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed regression as a fraction (default: %(default)s)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--compare-records", action="store_true",
+                        help="report per-record memory of raw dicts versus compact records and exit")
+    parser.add_argument("--compare-transfer", action="store_true",
+                        help="report page size and decode time with and without fields= projection and exit")
+    args = parser.parse_args()
+    unknown = [entity for entity in args.entities if entity not in GENERATORS]
+    if unknown:
+        parser.error(f"unknown entities: {', '.join(unknown)}")
+
+    if args.compare_records:
+        print(f"{'entity':<12}{'dict B/rec':>12}{'record B/rec':>14}{'ratio':>8}")
+        for entity in args.entities or GENERATORS:
+            dict_size, record_size = compare_records(entity, args.records)
+            print(f"{entity:<12}{dict_size:>12.0f}{record_size:>14.0f}{dict_size / record_size:>7.1f}x")
+        sys.exit(0)
+
+    if args.compare_transfer:
+        print(f"{'entity':<12}{'mode':<11}{'page KiB':>10}{'gzip KiB':>10}{'decode ms':>11}")
+        for entity in args.entities or GENERATORS:
+            for label, raw, compressed, decode_ms in compare_transfer(entity, args.records):
+                print(f"{entity:<12}{label:<11}{raw / 1024:>10.1f}{compressed / 1024:>10.1f}{decode_ms:>11.2f}")
+        sys.exit(0)
+
+    results = {}
+    print(f"{'entity':<12}{'records/s':>12}{'reference/s':>13}{'relative':>10}{'peak MiB':>10}")
+    for entity in args.entities or GENERATORS:
+        results[entity] = measure(entity, args.records, args.repeat)
+        print(f"{entity:<12}{results[entity]['records_per_sec']:>12.0f}"
+              f"{results[entity]['reference_per_sec']:>13.0f}{results[entity]['relative']:>10.3f}"
+              f"{results[entity]['peak_bytes'] / 2**20:>10.1f}")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline first.")
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        failures = compare(results, json.load(f), args.tolerance)
+    if failures:
+        print("\nREGRESSION:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"\nWithin {args.tolerance:.0%} of baseline.")
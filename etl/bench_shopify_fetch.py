@@ -0,0 +1,90 @@
+"""
+Live benchmark of Shopify fetches with and without field projection and gzip.
+
+Fetches the first pages of each endpoint three ways - full records without
+compression, full records with gzip, and the records.py fields= projection
+with gzip - and prints bytes on the wire, decoded body size, fetch time and
+decode time per page. Needs the Shopify credentials in .env.
+"""
+import argparse
+import gzip
+import statistics
+import time
+
+import requests
+
+import sync_all_data
+from records import RECORD_TYPES, projection
+
+MODES = [
+    ("full", False, False),
+    ("full+gzip", False, True),
+    ("projected+gzip", True, True),
+]
+
+def fetch_page(url, params, compress):
+    """
+    Returns (wire_bytes, body, seconds, next_url) for one page.
+    """
+    start = time.perf_counter()
+    response = requests.get(url, headers=sync_all_data.shopify_headers(compress),
+                            params=params, stream=True)
+    response.raise_for_status()
+    raw = response.raw.read(decode_content=False)
+    seconds = time.perf_counter() - start
+
+    if response.headers.get("Content-Encoding") == "gzip":
+        body = gzip.decompress(raw)
+    else:
+        body = raw
+    return len(raw), body, seconds, sync_all_data.next_page_url(response.headers.get("Link"))
+
+def bench_endpoint(endpoint, pages, limit):
+    record_type = RECORD_TYPES[endpoint]
+    results = []
+
+    for mode, projected, compress in MODES:
+        url = sync_all_data.shopify_api_url(endpoint)
+        params = {"limit": limit}
+        if projected:
+            params["fields"] = projection(record_type)
+
+        wire, body_bytes, fetch_times, decode_times = [], [], [], []
+        for _ in range(pages):
+            wire_bytes, body, seconds, next_url = fetch_page(url, params, compress)
+            start = time.perf_counter()
+            records = sync_all_data.decode_page(endpoint, body, record_type)
+            decode_times.append(time.perf_counter() - start)
+
+            wire.append(wire_bytes)
+            body_bytes.append(len(body))
+            fetch_times.append(seconds)
+            if not records or not next_url:
+                break
+            fields = params.get("fields")
+            url = next_url
+            params = {"fields": fields} if fields and "fields=" not in next_url else {}
+
+        results.append((mode, statistics.mean(wire), statistics.mean(body_bytes),
+                        statistics.median(fetch_times) * 1000, statistics.median(decode_times) * 1000))
+
+    print(f"\n{endpoint} (per page, {limit} records)")
+    print(f"{'mode':<16}{'wire KiB':>10}{'body KiB':>10}{'fetch ms':>10}{'decode ms':>11}")
+    for mode, wire, body, fetch_ms, decode_ms in results:
+        print(f"{mode:<16}{wire / 1024:>10.1f}{body / 1024:>10.1f}{fetch_ms:>10.1f}{decode_ms:>11.2f}")
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Shopify fetch cost with and without projection and gzip.")
+    parser.add_argument("entities", nargs="*", metavar="entity",
+                        help=f"entities to fetch: {', '.join(RECORD_TYPES)} (default: all)")
+    parser.add_argument("--pages", type=int, default=3, help="pages per mode (default: %(default)s)")
+    parser.add_argument("--limit", type=int, default=250, help="records per page (default: %(default)s)")
+    args = parser.parse_args()
+    unknown = [entity for entity in args.entities if entity not in RECORD_TYPES]
+    if unknown:
+        parser.error(f"unknown entities: {', '.join(unknown)}")
+
+    for entity in args.entities or RECORD_TYPES:
+        bench_endpoint(entity, args.pages, args.limit)
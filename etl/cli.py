@@ -0,0 +1,138 @@
+"""
+Single entry point for the ETL scripts.
+
+    python cli.py sync [--if-running wait ...]   full Shopify sync (sync_all_data.py)
+    python cli.py backfill                       rebuild aggregates and sketches over all orders
+    python cli.py summary                        database summary (show_data_summary.py)
+    python cli.py migrate                        create tables and apply migrations (update_database.py)
+    python cli.py sample-data                    insert sample records (add_sample_data.py)
+    python cli.py affinity [--full ...]          product affinities (product_affinity.py)
+    python cli.py inventory --at 2025-07-01      inventory levels (inventory_history.py)
+    python cli.py probe [--sslmode disable ...]  database link probe (test_connection.py --probe)
+    python cli.py startup-times                  measure the cold start of every subcommand
+
+Only the standard library is imported up front. Each subcommand imports its
+script, and with it requests, psycopg2 and friends, only once it is chosen,
+after the configuration it needs has been checked.
+"""
+import argparse
+import importlib
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ETL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DB_SETTINGS = ("DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT")
+SHOPIFY_SETTINGS = ("SHOPIFY_STORE_URL", "SHOPIFY_API_VERSION", "SHOPIFY_ACCESS_TOKEN")
+
+# Subcommand -> (module, function, settings it needs, argv prefix, help). Functions
+# with a prefix of None take no arguments; the others are passed the prefix plus
+# the rest of the command line as argv.
+COMMANDS = {
+    "sync": ("sync_all_data", "main", DB_SETTINGS + SHOPIFY_SETTINGS, [],
+             "sync products, customers and orders from Shopify"),
+    "backfill": ("sync_all_data", "backfill_derived_data", DB_SETTINGS, None,
+                 "rebuild customer aggregates and order sketches over all orders"),
+    "summary": ("show_data_summary", "main", DB_SETTINGS, None,
+                "show what is in the database"),
+    "migrate": ("update_database", "main", DB_SETTINGS, None,
+                "create the tables and apply the schema migrations"),
+    "sample-data": ("add_sample_data", "main", DB_SETTINGS, None,
+                    "insert sample products, customers and orders"),
+    "affinity": ("product_affinity", "main", DB_SETTINGS, [],
+                 "update 'frequently bought together' product affinities"),
+    "inventory": ("inventory_history", "main", DB_SETTINGS, [],
+                  "stock levels at a point in time, variant history and stock-outs"),
+    "probe": ("test_connection", "main", ("DB_HOST", "DB_PORT", "DB_NAME", "DB_USER"), ["--probe"],
+              "measure the database link and recommend batch and pool sizes"),
+}
+
+STARTUP_REPEAT = 5
+
+def load_config(settings):
+    """
+    Reads .env once and returns the names of required settings that are
+    unset. The scripts' own load_dotenv() calls then find the environment
+    already populated.
+    """
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(ETL_DIR, ".env"))
+    return [name for name in settings if not os.getenv(name)]
+
+def load_command(name):
+    """
+    Imports the module of a subcommand and returns its entry function.
+    """
+    module_name, function_name = COMMANDS[name][:2]
+    if ETL_DIR not in sys.path:
+        sys.path.insert(0, ETL_DIR)
+    return getattr(importlib.import_module(module_name), function_name)
+
+def startup_times(repeat):
+    """
+    Times, in fresh interpreters, how long each subcommand takes to be ready
+    to run: interpreter start, config check and imports, without doing
+    any work.
+    """
+    def cold_start(code):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=ETL_DIR, check=True)
+            times.append(time.perf_counter() - start)
+        return statistics.median(times)
+
+    baseline = cold_start("pass")
+    print(f"{'subcommand':<14}{'cold start ms':>15}{'over bare python ms':>21}")
+    print(f"{'(python)':<14}{baseline * 1000:>15.0f}{0:>21.0f}")
+    for name, (_, _, settings, _, _) in COMMANDS.items():
+        code = f"import cli; cli.load_config({settings!r}); cli.load_command({name!r})"
+        try:
+            seconds = cold_start(code)
+        except subprocess.CalledProcessError:
+            print(f"{name:<14}{'import failed':>15}")
+            continue
+        print(f"{name:<14}{seconds * 1000:>15.0f}{(seconds - baseline) * 1000:>21.0f}")
+
+# --- Main Execution ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cli.py", description="Shopify ETL commands.")
+    parser.add_argument("--timings", action="store_true", help="print import and run time of the subcommand")
+    subparsers = parser.add_subparsers(dest="command", metavar="command", required=True)
+    for name, (_, _, _, prefix, help_text) in COMMANDS.items():
+        # Scripts that parse their own arguments also get their own --help
+        subparsers.add_parser(name, help=help_text, add_help=prefix is None)
+    startup_parser = subparsers.add_parser("startup-times", help="measure the cold start of every subcommand")
+    startup_parser.add_argument("--repeat", type=int, default=STARTUP_REPEAT,
+                                help="runs per subcommand (default: %(default)s)")
+    args, rest = parser.parse_known_args(argv)
+    if rest and (args.command == "startup-times" or COMMANDS[args.command][3] is None):
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+
+    if args.command == "startup-times":
+        startup_times(args.repeat)
+        return
+
+    _, _, settings, prefix, _ = COMMANDS[args.command]
+    missing = load_config(settings)
+    # --help needs no configuration
+    if missing and not {"-h", "--help"} & set(rest):
+        parser.error(f"{args.command} needs {', '.join(missing)} (set them in {os.path.join(ETL_DIR, '.env')})")
+
+    start = time.perf_counter()
+    command = load_command(args.command)
+    imported = time.perf_counter()
+    if prefix is None:
+        command()
+    else:
+        command(prefix + rest)
+    if args.timings:
+        print(f"\n[{args.command}] imports {(imported - start) * 1000:.0f} ms, "
+              f"run {time.perf_counter() - imported:.2f} s")
+
+if __name__ == "__main__":
+    main()
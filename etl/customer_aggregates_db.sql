@@ -0,0 +1,10 @@
+-- customer_aggregates_db.sql
+-- Lets the post-load recomputation of customer aggregates find each
+-- customer's orders with an index scan, and leave cancelled orders out.
+-- Safe to run more than once.
+
+CREATE INDEX IF NOT EXISTS orders_customer_id_idx ON orders (customer_id);
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS cancelled_at TIMESTAMP WITH TIME ZONE;
+
+COMMENT ON COLUMN orders.cancelled_at IS 'Set when the order was cancelled in Shopify.';
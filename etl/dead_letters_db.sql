@@ -0,0 +1,21 @@
+-- dead_letters_db.sql
+-- Rows a load could not apply (see staging.merge_staged_isolated), with the
+-- database error and the staged row as JSON, so the rest of the load can
+-- commit. A later load that merges the same record marks it resolved.
+-- Safe to run more than once.
+
+CREATE TABLE IF NOT EXISTS etl_dead_letters (
+    id BIGSERIAL PRIMARY KEY,
+    table_name VARCHAR(100) NOT NULL, -- e.g., 'orders', 'order_line_items'
+    record_id BIGINT,
+    error TEXT NOT NULL,
+    sqlstate VARCHAR(5), -- e.g., '23503' for a foreign key violation
+    payload JSONB, -- The staged row as it failed to merge
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    resolved_at TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE etl_dead_letters IS 'Stores rows that failed to load, for inspection and retry.';
+
+CREATE INDEX IF NOT EXISTS etl_dead_letters_unresolved_idx ON etl_dead_letters (table_name, record_id)
+    WHERE resolved_at IS NULL;
@@ -0,0 +1,278 @@
+"""
+Incremental, date-partitioned Parquet export of the synced tables.
+
+Heavy ad-hoc analysis should not run against the production database, so this
+command streams products, customers, orders and order line items out of
+Postgres with server-side cursors and writes them as Parquet files laid out as
+
+    <export_dir>/<table>/date=YYYY-MM-DD/part-<run_id>.parquet
+
+Only rows whose last_synced_at moved past the previous export's watermark are
+read, and memory stays bounded by ROW_GROUP_SIZE rows at a time. Syncs and
+reconcile_deletions.py move last_synced_at only for rows that changed or were
+tombstoned, so an incremental export holds just those. A changed row appears
+again in a later part file; readers keep the copy with the latest
+last_synced_at per id.
+
+Requires pyarrow (pip install pyarrow).
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from operator import itemgetter
+
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sync_all_data import get_db_connection
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports"))
+STATE_FILE = "_export_state.json"
+
+ROW_GROUP_SIZE = 50000
+COMPRESSION = "zstd"
+
+# Rows are stamped with NOW() at the start of the sync transaction, so a load
+# that commits while an export runs can carry a timestamp just below the new
+# watermark. Re-reading a short window each run picks those rows up.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+MONEY = pa.decimal128(10, 2)
+
+# Table name -> source query (without WHERE/ORDER BY), the timestamp used for
+# date partitioning, the watermark column, and the Parquet schema whose field
+# names match the query's output columns. "expressions" overrides how a column
+# is selected where its Postgres type has no direct Parquet equivalent.
+EXPORT_TABLES = {
+    "products": {
+        "source": "products",
+        "partition_by": "created_at",
+        "watermark": "last_synced_at",
+        "expressions": {"variants": "variants::text"},
+        "schema": pa.schema([
+            ("id", pa.int64()),
+            ("title", pa.string()),
+            ("vendor", pa.string()),
+            ("product_type", pa.string()),
+            ("created_at", TIMESTAMP),
+            ("handle", pa.string()),
+            ("status", pa.string()),
+            ("tags", pa.string()),
+            ("variants", pa.string()),  # JSON text
+            ("deleted_at", TIMESTAMP),
+            ("last_synced_at", TIMESTAMP),
+        ]),
+    },
+    "customers": {
+        "source": "customers",
+        "partition_by": "created_at",
+        "watermark": "last_synced_at",
+        "schema": pa.schema([
+            ("id", pa.int64()),
+            ("email", pa.string()),
+            ("first_name", pa.string()),
+            ("last_name", pa.string()),
+            ("orders_count", pa.int32()),
+            ("total_spent", MONEY),
+            ("state", pa.string()),
+            ("created_at", TIMESTAMP),
+            ("deleted_at", TIMESTAMP),
+            ("last_synced_at", TIMESTAMP),
+        ]),
+    },
+    "orders": {
+        "source": "orders",
+        "partition_by": "created_at",
+        "watermark": "last_synced_at",
+        "schema": pa.schema([
+            ("id", pa.int64()),
+            ("customer_id", pa.int64()),
+            ("total_price", MONEY),
+            ("financial_status", pa.string()),
+            ("fulfillment_status", pa.string()),
+            ("number_of_items", pa.int32()),
+            ("created_at", TIMESTAMP),
+            ("cancelled_at", TIMESTAMP),
+            ("last_synced_at", TIMESTAMP),
+        ]),
+    },
+    "order_line_items": {
+        # Line items are partitioned by the date of their order.
+        "source": """(
+            SELECT li.*, o.created_at AS order_created_at
+            FROM order_line_items li
+            JOIN orders o ON o.id = li.order_id
+        ) line_items""",
+        "partition_by": "order_created_at",
+        "watermark": "last_synced_at",
+        "schema": pa.schema([
+            ("id", pa.int64()),
+            ("order_id", pa.int64()),
+            ("product_id", pa.int64()),
+            ("variant_id", pa.int64()),
+            ("title", pa.string()),
+            ("sku", pa.string()),
+            ("vendor", pa.string()),
+            ("product_type", pa.string()),
+            ("quantity", pa.int32()),
+            ("price", MONEY),
+            ("order_created_at", TIMESTAMP),
+            ("last_synced_at", TIMESTAMP),
+        ]),
+    },
+}
+
+def load_state(export_dir):
+    """
+    Returns the per-table watermarks of previous exports.
+    """
+    path = os.path.join(export_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_state(export_dir, state):
+    path = os.path.join(export_dir, STATE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def build_query(spec):
+    expressions = spec.get("expressions", {})
+    columns = [
+        f"{expressions[field.name]} AS {field.name}" if field.name in expressions else field.name
+        for field in spec["schema"]
+    ]
+
+    return f"""
+        SELECT ({spec['partition_by']} AT TIME ZONE 'UTC')::date AS partition_date, {', '.join(columns)}
+        FROM {spec['source']}
+        WHERE {spec['watermark']} > %s
+        ORDER BY partition_date, id;
+    """
+
+def rows_to_table(rows, schema):
+    """
+    Converts a list of row tuples (in schema order) into a pyarrow Table.
+    """
+    columns = {field.name: [row[i] for row in rows] for i, field in enumerate(schema)}
+    return pa.Table.from_pydict(columns, schema=schema)
+
+def export_table(conn, name, export_dir, since, run_id):
+    """
+    Streams the rows of one table changed after `since` into date-partitioned
+    Parquet files. Returns (rows_written, new_watermark).
+    """
+    spec = EXPORT_TABLES[name]
+    schema = spec["schema"]
+    watermark_index = schema.get_field_index(spec["watermark"])
+
+    rows_written = 0
+    watermark = since
+    writer = None
+    tmp_path = None
+    current_partition = None
+
+    def close_writer():
+        # Part files only get their final name once complete, so readers
+        # globbing *.parquet never see a half-written file.
+        if writer is not None:
+            writer.close()
+            os.replace(tmp_path, tmp_path[:-len(".tmp")])
+
+    try:
+        with conn.cursor(name=f"export_{name}") as cur:
+            cur.itersize = ROW_GROUP_SIZE
+            cur.execute(build_query(spec), (since,))
+            while True:
+                rows = cur.fetchmany(ROW_GROUP_SIZE)
+                if not rows:
+                    break
+
+                for partition, group in groupby(rows, key=itemgetter(0)):
+                    if partition != current_partition or writer is None:
+                        close_writer()
+                        partition_name = partition.isoformat() if partition else NULL_PARTITION
+                        partition_dir = os.path.join(export_dir, name, f"date={partition_name}")
+                        os.makedirs(partition_dir, exist_ok=True)
+                        tmp_path = os.path.join(partition_dir, f"part-{run_id}.parquet.tmp")
+                        writer = pq.ParquetWriter(tmp_path, schema, compression=COMPRESSION)
+                        current_partition = partition
+
+                    group_rows = [row[1:] for row in group]
+                    writer.write_table(rows_to_table(group_rows, schema))
+                    rows_written += len(group_rows)
+                    batch_max = max(row[watermark_index] for row in group_rows)
+                    if batch_max is not None and batch_max > watermark:
+                        watermark = batch_max
+        close_writer()
+        writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+        conn.rollback()
+
+    return rows_written, watermark
+
+def export_all(tables=None, export_dir=EXPORT_DIR, full=False):
+    """
+    Exports the given tables (default: all) incrementally.
+    Pass full=True to ignore previous watermarks and export everything again.
+    """
+    tables = tables or list(EXPORT_TABLES)
+    os.makedirs(export_dir, exist_ok=True)
+    state = {} if full else load_state(export_dir)
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    try:
+        for name in tables:
+            previous = state.get(name)
+            since = datetime.fromisoformat(previous) - WATERMARK_OVERLAP if previous else EPOCH
+            print(f"Exporting {name} synced after {since.isoformat()}...")
+
+            rows_written, watermark = export_table(conn, name, export_dir, since, run_id)
+            if rows_written:
+                state[name] = watermark.isoformat()
+                save_state(export_dir, state)
+            print(f"Exported {rows_written} {name}.")
+        return True
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(f"Error during export: {error}")
+        return False
+    finally:
+        conn.close()
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export synced tables to date-partitioned Parquet files.")
+    parser.add_argument("tables", nargs="*", metavar="table",
+                        help=f"tables to export: {', '.join(EXPORT_TABLES)} (default: all)")
+    parser.add_argument("--output", default=EXPORT_DIR, help="export directory (default: %(default)s)")
+    parser.add_argument("--full", action="store_true", help="ignore previous watermarks and export everything")
+    args = parser.parse_args()
+    unknown = [table for table in args.tables if table not in EXPORT_TABLES]
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(unknown)}")
+
+    print("=" * 60)
+    print("EXPORTING TABLES TO PARQUET")
+    print("=" * 60)
+
+    if export_all(args.tables, args.output, args.full):
+        print(f"\nExport written to {args.output}")
+    else:
+        print("\nExport failed.")
@@ -0,0 +1,117 @@
+"""
+Queries over the delta-encoded inventory history in 'inventory_snapshots'.
+
+A variant only gets a row when a sync sees its inventory_quantity change, so
+the level at any time is the latest row at or before that time:
+
+    python inventory_history.py --at 2025-07-01T00:00:00+00:00      all variants
+    python inventory_history.py --at 2025-07-01 --variant 4412 4413
+    python inventory_history.py --history 4412                      every change of one variant
+    python inventory_history.py --stockouts                         periods at zero or below
+
+In SQL, inventory_level_at(variant_id, at) answers the same for one variant.
+"""
+import argparse
+from datetime import datetime, timezone
+
+import psycopg2
+
+from sync_all_data import get_db_connection
+
+def stock_levels_at(cur, at, variant_ids=None):
+    """
+    Returns {variant_id: (inventory_quantity, observed_at)} as of `at`, for
+    the given variants or all of them. Variants first seen after `at` are
+    absent; variants removed by then have a quantity of None.
+    """
+    variant_filter = "AND variant_id = ANY(%s)" if variant_ids else ""
+    cur.execute(f"""
+        SELECT DISTINCT ON (variant_id) variant_id, inventory_quantity, observed_at
+        FROM inventory_snapshots
+        WHERE observed_at <= %s {variant_filter}
+        ORDER BY variant_id, observed_at DESC;
+    """, (at, list(variant_ids)) if variant_ids else (at,))
+    return {variant_id: (quantity, observed_at) for variant_id, quantity, observed_at in cur.fetchall()}
+
+def inventory_history(cur, variant_id):
+    """
+    Returns the (observed_at, inventory_quantity) changes of one variant, oldest first.
+    """
+    cur.execute("""
+        SELECT observed_at, inventory_quantity FROM inventory_snapshots
+        WHERE variant_id = %s
+        ORDER BY observed_at;
+    """, (variant_id,))
+    return cur.fetchall()
+
+def stockout_periods(cur):
+    """
+    Returns (variant_id, sku, out_at, back_at) for every period a variant
+    was at zero or below; back_at is None if it still is.
+    """
+    # A period starts at a change to <= 0 from above zero (or from nothing) and
+    # lasts until the next change back above zero, which may be several rows
+    # later if the quantity went further negative first, or until the variant
+    # was removed (a NULL quantity).
+    cur.execute("""
+        SELECT changes.variant_id, v.sku, changes.observed_at, back.observed_at
+        FROM (
+            SELECT variant_id, observed_at, inventory_quantity,
+                   LAG(inventory_quantity) OVER (PARTITION BY variant_id ORDER BY observed_at) AS previous_quantity
+            FROM inventory_snapshots
+        ) changes
+        LEFT JOIN LATERAL (
+            SELECT observed_at FROM inventory_snapshots later
+            WHERE later.variant_id = changes.variant_id
+              AND later.observed_at > changes.observed_at
+              AND (later.inventory_quantity > 0 OR later.inventory_quantity IS NULL)
+            ORDER BY later.observed_at
+            LIMIT 1
+        ) back ON TRUE
+        LEFT JOIN product_variants v ON v.id = changes.variant_id
+        WHERE changes.inventory_quantity <= 0
+          AND (changes.previous_quantity IS NULL OR changes.previous_quantity > 0)
+        ORDER BY changes.observed_at;
+    """)
+    return cur.fetchall()
+
+def parse_time(value):
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+# --- Main Execution ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconstruct variant inventory levels from the snapshot history.")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--at", type=parse_time, help="stock levels at this time (ISO 8601, UTC if no offset)")
+    mode.add_argument("--history", type=int, metavar="VARIANT_ID", help="every recorded change of one variant")
+    mode.add_argument("--stockouts", action="store_true", help="periods variants spent at zero or below")
+    parser.add_argument("--variant", type=int, nargs="+", metavar="VARIANT_ID", help="limit --at to these variants")
+    args = parser.parse_args(argv)
+
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        with conn.cursor() as cur:
+            if args.at:
+                levels = stock_levels_at(cur, args.at, args.variant)
+                print(f"\n{'variant':>16}{'quantity':>10}  since")
+                for variant_id, (quantity, observed_at) in sorted(levels.items()):
+                    print(f"{variant_id:>16}{quantity if quantity is not None else '-':>10}  {observed_at}")
+                print(f"{len(levels)} variants")
+            elif args.history:
+                for observed_at, quantity in inventory_history(cur, args.history):
+                    print(f"{observed_at}  {quantity}")
+            else:
+                for variant_id, sku, out_at, back_at in stockout_periods(cur):
+                    print(f"{variant_id:>16}  {sku or '-':<20}{out_at}  ->  {back_at or 'still out'}")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(f"Error during database operation: {error}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+-- inventory_snapshots_db.sql
+-- Inventory history of every variant, delta-encoded: a product sync adds a
+-- row only for variants whose inventory_quantity changed since their last
+-- row, and a row with a NULL quantity when a variant is removed. The level at
+-- any time is the latest row at or before it, see inventory_level_at() and
+-- inventory_history.py. Safe to run more than once.
+
+CREATE TABLE IF NOT EXISTS inventory_snapshots (
+    variant_id BIGINT NOT NULL, -- No foreign key: history outlives deleted variants
+    observed_at TIMESTAMP WITH TIME ZONE NOT NULL, -- Time of the sync that saw the change
+    inventory_quantity INT,
+    PRIMARY KEY (variant_id, observed_at)
+);
+
+COMMENT ON TABLE inventory_snapshots IS 'Stores each change in variant inventory_quantity seen by a sync.';
+
+CREATE OR REPLACE FUNCTION inventory_level_at(p_variant_id BIGINT, p_at TIMESTAMP WITH TIME ZONE)
+RETURNS INT AS $$
+    SELECT inventory_quantity FROM inventory_snapshots
+    WHERE variant_id = p_variant_id AND observed_at <= p_at
+    ORDER BY observed_at DESC
+    LIMIT 1;
+$$ LANGUAGE sql STABLE;
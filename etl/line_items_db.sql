@@ -0,0 +1,22 @@
+-- line_items_db.sql
+-- Stores order line items, denormalized with the product attributes the
+-- ETL looks up in its in-memory product catalog. Safe to run more than once.
+
+CREATE TABLE IF NOT EXISTS order_line_items (
+    id BIGINT PRIMARY KEY, -- Using the Shopify line item ID as the primary key
+    order_id BIGINT NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+    product_id BIGINT, -- No foreign key: the product may since have been deleted
+    variant_id BIGINT,
+    title VARCHAR(255),
+    sku VARCHAR(255),
+    vendor VARCHAR(255),
+    product_type VARCHAR(255),
+    quantity INT,
+    price NUMERIC(10, 2),
+    last_synced_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE order_line_items IS 'Stores order line items synced from Shopify, enriched with product attributes.';
+
+CREATE INDEX IF NOT EXISTS order_line_items_order_id_idx ON order_line_items (order_id);
+CREATE INDEX IF NOT EXISTS order_line_items_product_id_idx ON order_line_items (product_id);
@@ -0,0 +1,17 @@
+-- order_sketches_db.sql
+-- Per-day approximate sketches of the orders table, rebuilt by the ETL for
+-- every day it loads orders for (see sketches.py). Date ranges are answered
+-- by merging the sketches of their days. Safe to run more than once.
+
+CREATE TABLE IF NOT EXISTS order_day_sketches (
+    day DATE PRIMARY KEY, -- UTC day of orders.created_at
+    order_count INT NOT NULL,
+    customers_hll BYTEA NOT NULL, -- HyperLogLog of customer ids
+    order_value_kll BYTEA NOT NULL, -- KLL sketch of total_price
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE order_day_sketches IS 'Stores one HyperLogLog and one KLL sketch of the orders of each day.';
+
+-- Lets a day's orders be re-read without scanning the whole table
+CREATE INDEX IF NOT EXISTS orders_created_day_idx ON orders (((created_at AT TIME ZONE 'UTC')::date));
@@ -0,0 +1,21 @@
+-- product_affinities_db.sql
+-- Top "frequently bought together" products per product, written by
+-- product_affinity.py. The table is rebuilt and swapped in as a whole on
+-- every run, so it deliberately has no foreign keys. Safe to run more than once.
+
+CREATE TABLE IF NOT EXISTS product_affinities (
+    product_id BIGINT NOT NULL,
+    related_product_id BIGINT NOT NULL,
+    rank INT NOT NULL, -- 1 = strongest association of product_id
+    pair_count INT NOT NULL, -- Orders containing both products
+    support DOUBLE PRECISION NOT NULL,
+    confidence DOUBLE PRECISION NOT NULL, -- P(related_product_id | product_id)
+    lift DOUBLE PRECISION NOT NULL,
+    computed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (product_id, rank)
+);
+
+COMMENT ON TABLE product_affinities IS 'Stores the top associated products of each product, from order line items.';
+
+-- Lets incremental runs read only the line items synced since the last run
+CREATE INDEX IF NOT EXISTS order_line_items_last_synced_at_idx ON order_line_items (last_synced_at);
@@ -0,0 +1,235 @@
+"""
+"Frequently bought together" product affinities from order line items.
+
+Orders and their products form a binary sparse matrix X (orders x products);
+X.T @ X is then the product x product co-occurrence matrix, with each
+product's order count on the diagonal. From it, for every pair (a, b):
+
+    support      orders with a and b / all orders
+    confidence   orders with a and b / orders with a       (a -> b)
+    lift         confidence / (orders with b / all orders)
+
+The co-occurrence counts are kept in a state file with the ids of the orders
+counted so far and a last_synced_at watermark, so a run after a sync only
+reads line items synced since the previous run (plus SYNC_LOOKBACK_SECONDS
+for loads that were still committing) and adds the counts of orders it has
+not counted yet. Orders that arrive late with lower ids, e.g. from a
+backfill, are picked up as well. The top-N associations of every product are
+written to 'product_affinities' (see product_affinities_db.sql), which is
+replaced as a whole with staging.swap_in_staged.
+
+Orders are counted once, when first seen; run with --full to recount after
+orders were edited or deleted.
+
+Requires numpy and scipy (pip install numpy scipy).
+"""
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+import psycopg2
+from scipy import sparse
+
+from staging import stage_rows, swap_in_staged
+from sync_all_data import get_db_connection, publish_data_version
+
+STATE_PATH = os.getenv("AFFINITY_STATE_PATH",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "affinity_state.npz"))
+
+TOP_N = 10
+# Pairs bought together in fewer orders than this are noise, whatever their lift
+MIN_PAIR_COUNT = 3
+RANK_BY = ("lift", "confidence")
+# How far before the watermark line items are read again. A load stamps its
+# rows with the time its transaction started, so rows of a load that commits
+# after a run can carry a time before that run's watermark.
+SYNC_LOOKBACK_SECONDS = 3600
+
+AFFINITY_COLUMNS = ('product_id', 'related_product_id', 'rank', 'pair_count', 'support', 'confidence', 'lift')
+
+class AffinityState:
+    """
+    Co-occurrence counts so far: product_ids maps matrix index -> product id,
+    counted_orders holds the sorted ids of the orders counted, and
+    synced_until is the last_synced_at (epoch seconds) read up to.
+    """
+
+    def __init__(self, product_ids=None, counts=None, counted_orders=None, synced_until=0.0):
+        self.product_ids = product_ids if product_ids is not None else np.empty(0, dtype=np.int64)
+        self.counts = counts if counts is not None else sparse.csr_matrix((0, 0), dtype=np.int64)
+        self.counted_orders = counted_orders if counted_orders is not None else np.empty(0, dtype=np.int64)
+        self.synced_until = synced_until
+
+    @property
+    def order_count(self):
+        return len(self.counted_orders)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path) as data:
+            if "counted_orders" not in data:
+                print(f"{path} does not record which orders were counted; recounting all orders.")
+                return cls()
+            counts = sparse.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=tuple(data["shape"]))
+            return cls(data["product_ids"], counts, data["counted_orders"], float(data["synced_until"]))
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, product_ids=self.product_ids, data=self.counts.data, indices=self.counts.indices,
+                 indptr=self.counts.indptr, shape=np.array(self.counts.shape),
+                 counted_orders=self.counted_orders, synced_until=self.synced_until)
+        os.replace(tmp_path, path)
+
+    def add_orders(self, order_ids, product_ids):
+        """
+        Adds the (order id, product id) pairs of orders not counted yet to
+        the counts; pairs of orders already counted are skipped. A product
+        appearing on several line items of one order counts once.
+        Returns the number of orders added.
+        """
+        new = ~np.isin(order_ids, self.counted_orders)
+        order_ids, product_ids = order_ids[new], product_ids[new]
+        if len(order_ids) == 0:
+            return 0
+        new_products = np.setdiff1d(product_ids, self.product_ids)
+        self.product_ids = np.concatenate([self.product_ids, new_products])
+        size = len(self.product_ids)
+
+        orders, order_rows = np.unique(order_ids, return_inverse=True)
+        product_cols = index_of(self.product_ids, product_ids)
+        x = sparse.csr_matrix((np.ones(len(order_rows), dtype=np.int64), (order_rows, product_cols)),
+                              shape=(len(orders), size))
+        x.data[:] = 1  # duplicates were summed on construction
+
+        counts = self.counts.copy()
+        counts.resize((size, size))
+        self.counts = (counts + (x.T @ x)).tocsr()
+        self.counted_orders = np.union1d(self.counted_orders, orders)
+        return len(orders)
+
+def index_of(ids, values):
+    """
+    Returns the position in `ids` of each of `values`, all of which must be present.
+    """
+    sorter = np.argsort(ids, kind="stable")
+    return sorter[np.searchsorted(ids, values, sorter=sorter)]
+
+def top_associations(state, top_n=TOP_N, min_pair_count=MIN_PAIR_COUNT, rank_by="lift"):
+    """
+    Returns a dict of equal-length arrays, one per AFFINITY_COLUMNS entry,
+    holding the top_n related products of every product by `rank_by`.
+    """
+    counts = state.counts.tocoo()
+    order_totals = state.counts.diagonal().astype(np.float64)
+    keep = (counts.row != counts.col) & (counts.data >= min_pair_count)
+    rows, cols, pairs = counts.row[keep], counts.col[keep], counts.data[keep].astype(np.float64)
+
+    total = float(state.order_count)
+    support = pairs / total
+    confidence = pairs / order_totals[rows]
+    lift = pairs * total / (order_totals[rows] * order_totals[cols])
+    score = lift if rank_by == "lift" else confidence
+
+    # Sort by product, then best score first, with the pair count as tie-break;
+    # a pair's rank is its offset from the first entry of its product.
+    order = np.lexsort((-pairs, -score, rows))
+    sorted_rows = rows[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_rows, sorted_rows, side="left") + 1
+    top = order[rank <= top_n]
+
+    return {
+        'product_id': state.product_ids[rows[top]],
+        'related_product_id': state.product_ids[cols[top]],
+        'rank': rank[rank <= top_n],
+        'pair_count': pairs[top].astype(np.int64),
+        'support': support[top],
+        'confidence': confidence[top],
+        'lift': lift[top],
+    }
+
+def fetch_order_products(conn, synced_after):
+    """
+    Returns (order ids, product ids, read time) for the line items synced
+    after synced_after (epoch seconds), or all of them if it is None, with
+    the database time of the read as epoch seconds for the next watermark.
+    Cancelled orders are left out; one cancelled after it was counted stays
+    in the state until the next --full rebuild. COPY's text output is parsed
+    by numpy in one go rather than row by row.
+    """
+    synced_filter = "AND li.last_synced_at > to_timestamp(%s)" if synced_after is not None else ""
+    buffer = io.StringIO()
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXTRACT(EPOCH FROM NOW());")
+        read_at = float(cur.fetchone()[0])
+        cur.copy_expert(cur.mogrify(f"""
+            COPY (
+                SELECT DISTINCT li.order_id, li.product_id
+                FROM order_line_items li
+                JOIN orders o ON o.id = li.order_id
+                WHERE li.product_id IS NOT NULL AND o.cancelled_at IS NULL {synced_filter}
+            ) TO STDOUT
+        """, (synced_after,) if synced_after is not None else None).decode(), buffer)
+    conn.commit()
+    values = np.array(buffer.getvalue().split(), dtype=np.int64).reshape(-1, 2)
+    return values[:, 0], values[:, 1], read_at
+
+def write_affinities(conn, associations):
+    columns = [associations[name].tolist() for name in AFFINITY_COLUMNS]
+    stage_rows(conn, 'product_affinities', AFFINITY_COLUMNS, zip(*columns))
+    count = swap_in_staged(conn, 'product_affinities', AFFINITY_COLUMNS)
+    with conn.cursor() as cur:
+        publish_data_version(cur, 'product_affinities', count)
+    conn.commit()
+    return count
+
+def update_affinities(state_path=STATE_PATH, full=False, top_n=TOP_N, min_pair_count=MIN_PAIR_COUNT,
+                      rank_by="lift"):
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    state = AffinityState() if full else AffinityState.load(state_path)
+    try:
+        start = time.perf_counter()
+        synced_after = state.synced_until - SYNC_LOOKBACK_SECONDS if state.synced_until else None
+        order_ids, product_ids, read_at = fetch_order_products(conn, synced_after)
+        fetched = time.perf_counter()
+        new_orders = state.add_orders(order_ids, product_ids)
+        state.synced_until = read_at
+        associations = top_associations(state, top_n, min_pair_count, rank_by)
+        computed = time.perf_counter()
+        print(f"Read {len(order_ids)} order/product pairs from {new_orders} new orders "
+              f"in {fetched - start:.2f}s; counted and ranked in {computed - fetched:.2f}s "
+              f"({state.order_count} orders, {len(state.product_ids)} products in total).")
+
+        count = write_affinities(conn, associations)
+        print(f"Wrote {count} associations to product_affinities.")
+        state.save(state_path)
+        return True
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(f"Error during database operation: {error}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+# --- Main Execution ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update 'frequently bought together' product affinities.")
+    parser.add_argument("--full", action="store_true", help="recount all orders instead of only new ones")
+    parser.add_argument("--top", type=int, default=TOP_N, help="associations kept per product (default: %(default)s)")
+    parser.add_argument("--min-pair-count", type=int, default=MIN_PAIR_COUNT,
+                        help="orders a pair must share to be kept (default: %(default)s)")
+    parser.add_argument("--rank-by", choices=RANK_BY, default="lift", help="ranking metric (default: %(default)s)")
+    parser.add_argument("--state", default=STATE_PATH, help="state file (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    update_affinities(args.state, args.full, args.top, args.min_pair_count, args.rank_by)
+
+if __name__ == "__main__":
+    main()
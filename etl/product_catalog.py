@@ -0,0 +1,113 @@
+"""
+In-process product catalog used to enrich order line items during the ETL.
+
+Looking up vendor and product_type per line item in the database would cost a
+round trip each. Instead the catalog is preloaded in bulk from the 'products'
+table, kept in sync as products are upserted in the same run, and bounded by
+an LRU policy so memory stays flat however large the store is.
+"""
+from collections import OrderedDict, namedtuple
+
+CatalogEntry = namedtuple('CatalogEntry', ['title', 'vendor', 'product_type'])
+
+DEFAULT_MAX_ENTRIES = 100000
+PRELOAD_FETCH_SIZE = 5000
+
+class ProductCatalog:
+    """
+    LRU-bounded mapping of product id -> CatalogEntry with hit/miss counters.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, product_id):
+        return product_id in self._entries
+
+    def get(self, product_id):
+        """
+        Returns the CatalogEntry for product_id, or None if it is not cached.
+        """
+        entry = self._entries.get(product_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(product_id)
+        self.hits += 1
+        return entry
+
+    def put(self, product_id, title, vendor, product_type):
+        """
+        Adds or refreshes a product, evicting the least recently used one
+        when the catalog is full.
+        """
+        self._entries[product_id] = CatalogEntry(title, vendor, product_type)
+        self._entries.move_to_end(product_id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def update_from_products(self, products):
+        """
+        Refreshes the catalog from Product records that were just upserted.
+        """
+        for product in products:
+            self.put(product.id, product.title, product.vendor, product.product_type)
+
+    def preload(self, conn):
+        """
+        Bulk loads the most recently synced products that are not tombstoned
+        from the database with a server-side cursor. Returns the number of products loaded.
+        """
+        loaded = 0
+        with conn.cursor(name="product_catalog_preload") as cur:
+            cur.itersize = PRELOAD_FETCH_SIZE
+            # Oldest first, so the most recently synced products end up as
+            # the most recently used entries.
+            cur.execute("""
+                SELECT id, title, vendor, product_type FROM (
+                    SELECT id, title, vendor, product_type, last_synced_at
+                    FROM products
+                    WHERE deleted_at IS NULL
+                    ORDER BY last_synced_at DESC NULLS LAST
+                    LIMIT %s
+                ) recent
+                ORDER BY last_synced_at ASC NULLS FIRST;
+            """, (self.max_entries,))
+            for product_id, title, vendor, product_type in cur:
+                self.put(product_id, title, vendor, product_type)
+                loaded += 1
+        conn.commit()
+        return loaded
+
+    def enrich_line_item(self, line_item):
+        """
+        Returns (vendor, product_type) for a LineItem record, falling back
+        to the vendor Shopify puts on the line item itself on a cache miss.
+        """
+        product_id = line_item.product_id
+        entry = self.get(product_id) if product_id is not None else None
+        if entry is None:
+            return line_item.vendor, None
+        return entry.vendor or line_item.vendor, entry.product_type
+
+    def stats(self):
+        """
+        Returns cache statistics as a dict.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,188 @@
+"""
+Memory and CPU profiling harness for the ETL stages.
+
+Runs the sync of one or more entities split into its stages - fetch (HTTP),
+decode (JSON), transform (rows) and load (database) - and wraps each stage
+with tracemalloc (peak memory and the allocation sites that grew) and
+cProfile. Every run writes its reports to profiles/<run_id>/:
+
+    summary.json          duration, records/sec and peak memory per stage
+    <stage>.prof          cProfile data, e.g. for snakeviz or pstats
+    <stage>.txt           top functions by cumulative time and top allocations
+
+Pages can be read from saved Shopify responses with --from-file, so a large
+page can be profiled repeatedly without hitting the API.
+"""
+import argparse
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import sync_all_data
+from records import RECORD_TYPES
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+TOP_ENTRIES = 25
+
+# Endpoint -> (row transform, child row transform or None, loader)
+ENTITIES = {
+    "products": (sync_all_data.product_row, sync_all_data.variant_rows, sync_all_data.insert_products_into_db),
+    "customers": (sync_all_data.customer_row, None, sync_all_data.insert_customers_into_db),
+    "orders": (sync_all_data.order_row, sync_all_data.line_item_rows, sync_all_data.insert_orders_into_db),
+}
+
+class StageProfiler:
+    """
+    Profiles named stages and writes one report per stage plus a summary.
+    """
+
+    def __init__(self, report_dir, cpu=True, top=TOP_ENTRIES):
+        self.report_dir = report_dir
+        self.cpu = cpu
+        self.top = top
+        self.results = []
+        os.makedirs(report_dir, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profiles the enclosed block. The yielded dict can be filled with
+        'records' (and any other counters) to be included in the summary.
+        """
+        counters = {}
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        baseline, _ = tracemalloc.get_traced_memory()
+
+        profiler = cProfile.Profile() if self.cpu else None
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield counters
+        finally:
+            if profiler:
+                profiler.disable()
+            duration = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+
+            result = {
+                "stage": name,
+                "seconds": round(duration, 4),
+                "peak_bytes": peak - baseline,
+                "retained_bytes": current - baseline,
+                **counters,
+            }
+            if counters.get("records") and duration > 0:
+                result["records_per_sec"] = round(counters["records"] / duration, 1)
+            self.results.append(result)
+            self._write_stage_report(name, profiler, before, after)
+
+    def _write_stage_report(self, name, profiler, before, after):
+        lines = [f"== {name} ==", ""]
+
+        if profiler:
+            profiler.dump_stats(os.path.join(self.report_dir, f"{name}.prof"))
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(self.top)
+            lines += ["-- CPU (cumulative) --", out.getvalue()]
+
+        lines.append("-- Allocations grown during stage --")
+        for stat in after.compare_to(before, "lineno")[:self.top]:
+            lines.append(str(stat))
+
+        with open(os.path.join(self.report_dir, f"{name}.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def write_summary(self):
+        with open(os.path.join(self.report_dir, "summary.json"), "w") as f:
+            json.dump(self.results, f, indent=2)
+
+        print(f"\n{'stage':<24}{'seconds':>10}{'records/s':>12}{'peak MiB':>10}{'retained MiB':>14}")
+        for result in self.results:
+            print(f"{result['stage']:<24}{result['seconds']:>10.3f}"
+                  f"{result.get('records_per_sec', 0):>12.0f}"
+                  f"{result['peak_bytes'] / 2**20:>10.1f}{result['retained_bytes'] / 2**20:>14.1f}")
+
+def fetch_bodies(endpoint, from_files=None):
+    """
+    Returns the raw JSON bodies of every page, from the API (requested like
+    the sync requests them) or saved files.
+    """
+    if from_files:
+        bodies = []
+        for path in from_files:
+            with open(path, "rb") as f:
+                bodies.append(f.read())
+        return bodies
+    endpoint, params, fields = sync_all_data.shopify_request(endpoint)
+    return [response.content
+            for response in sync_all_data.iter_shopify_responses(endpoint, fields=fields, params=params)]
+
+def profile_entity(profiler, endpoint, from_files=None, load=True):
+    row_fn, child_rows_fn, load_fn = ENTITIES[endpoint]
+
+    with profiler.stage(f"{endpoint}.fetch") as stage:
+        bodies = fetch_bodies(endpoint, from_files)
+        stage["pages"] = len(bodies)
+        stage["bytes"] = sum(len(body) for body in bodies)
+
+    with profiler.stage(f"{endpoint}.decode") as stage:
+        record_type = RECORD_TYPES[endpoint]
+        records = [record for body in bodies for record in sync_all_data.decode_page(endpoint, body, record_type)]
+        stage["records"] = len(records)
+    del bodies
+
+    with profiler.stage(f"{endpoint}.transform") as stage:
+        rows = [row_fn(record) for record in records]
+        child_rows = child_rows_fn(records) if child_rows_fn else []
+        stage["records"] = len(rows)
+        stage["child_rows"] = len(child_rows)
+    del rows, child_rows
+
+    if load:
+        # The loaders build their own rows, so this stage includes that work
+        # plus the database round trips.
+        with profiler.stage(f"{endpoint}.load") as stage:
+            load_fn(records)
+            stage["records"] = len(records)
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile memory and CPU of each ETL stage.")
+    parser.add_argument("entities", nargs="*", metavar="entity",
+                        help=f"entities to profile: {', '.join(ENTITIES)} (default: all)")
+    parser.add_argument("--from-file", nargs="+", metavar="PATH",
+                        help="saved Shopify JSON pages to use instead of fetching (one entity only)")
+    parser.add_argument("--no-load", action="store_true", help="skip the database load stage")
+    parser.add_argument("--no-cpu", action="store_true", help="only trace memory, without cProfile")
+    parser.add_argument("--output", default=PROFILE_DIR, help="report directory (default: %(default)s)")
+    args = parser.parse_args()
+    unknown = [entity for entity in args.entities if entity not in ENTITIES]
+    if unknown:
+        parser.error(f"unknown entities: {', '.join(unknown)}")
+    if args.from_file and len(args.entities) != 1:
+        parser.error("--from-file needs exactly one entity")
+
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    profiler = StageProfiler(os.path.join(args.output, run_id), cpu=not args.no_cpu)
+
+    for entity in args.entities or ENTITIES:
+        print(f"\nProfiling {entity}...")
+        profile_entity(profiler, entity, args.from_file, load=not args.no_load)
+
+    profiler.write_summary()
+    print(f"\nReports written to {profiler.report_dir}")
@@ -0,0 +1,9 @@
+-- reconcile_db.sql
+-- Adds tombstone columns used by reconcile_deletions.py to mark products and
+-- customers that no longer exist in Shopify. Safe to run more than once.
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE customers ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+
+COMMENT ON COLUMN products.deleted_at IS 'Set when the product was found to be deleted in Shopify.';
+COMMENT ON COLUMN customers.deleted_at IS 'Set when the customer was found to be deleted in Shopify.';
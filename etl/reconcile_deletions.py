@@ -0,0 +1,209 @@
+"""
+Deletion reconciliation between Shopify and the database.
+
+sync_all_data.py only upserts, so products and customers deleted in Shopify
+would otherwise stay in our tables forever. This pass fetches just the current
+id set from Shopify (fields=id), diffs it against the ids stored in the
+database as two sorted int64 arrays, and tombstones (or deletes) the rows that
+are missing in bulk. Full records are never fetched, so it scales to millions
+of ids.
+
+Run update_database.py first so the deleted_at columns exist.
+"""
+import argparse
+from array import array
+
+import psycopg2
+import requests
+
+from sync_all_data import get_db_connection, iter_shopify_pages, publish_data_version, record_removed_variants
+
+# Shopify endpoint -> table holding its records
+RECONCILED_TABLES = {
+    "products": "products",
+    "customers": "customers",
+}
+
+# Table -> (referencing table, column) pairs whose foreign key has no ON DELETE
+# action. A hard delete clears those links first, e.g. orders of a deleted
+# customer are kept without a customer.
+UNLINKED_ON_DELETE = {
+    "customers": [("orders", "customer_id")],
+}
+
+# Rows below this id are the sample records from add_sample_data.py and
+# never exist in Shopify.
+SAMPLE_ID_CEILING = 10000
+
+DB_FETCH_SIZE = 10000
+UPDATE_BATCH_SIZE = 5000
+
+# Refuse to remove more than this share of a table in one run unless forced;
+# a half-empty id set from Shopify is far more likely an API problem.
+MAX_MISSING_FRACTION = 0.5
+
+def fetch_shopify_ids(endpoint):
+    """
+    Fetches only the ids of an endpoint and returns them as a sorted,
+    de-duplicated int64 array.
+    """
+    print(f"Fetching {endpoint} ids from Shopify...")
+    ids = array('q')
+    for items in iter_shopify_pages(endpoint, fields="id"):
+        ids.extend(item['id'] for item in items)
+    print(f"Fetched {len(ids)} {endpoint} ids.")
+    return sorted_unique(ids)
+
+def fetch_db_ids(conn, table, include_sample=False):
+    """
+    Streams the ids of live (not tombstoned) rows with a server-side cursor
+    into a sorted int64 array.
+    """
+    min_id = 0 if include_sample else SAMPLE_ID_CEILING
+    ids = array('q')
+    with conn.cursor(name=f"reconcile_{table}_ids") as cur:
+        cur.itersize = DB_FETCH_SIZE
+        cur.execute(
+            f"SELECT id FROM {table} WHERE deleted_at IS NULL AND id >= %s ORDER BY id;",
+            (min_id,)
+        )
+        while True:
+            rows = cur.fetchmany(DB_FETCH_SIZE)
+            if not rows:
+                break
+            ids.extend(row[0] for row in rows)
+    return ids
+
+def sorted_unique(ids):
+    """
+    Returns the values of ids as a sorted int64 array without duplicates.
+    """
+    result = array('q')
+    previous = None
+    for value in sorted(ids):
+        if value != previous:
+            result.append(value)
+            previous = value
+    return result
+
+def missing_ids(db_ids, shopify_ids):
+    """
+    Returns the ids present in db_ids but not in shopify_ids.
+    Both arrays must be sorted ascending, so a single merge pass suffices.
+    """
+    missing = array('q')
+    j = 0
+    n = len(shopify_ids)
+    for value in db_ids:
+        while j < n and shopify_ids[j] < value:
+            j += 1
+        if j == n or shopify_ids[j] != value:
+            missing.append(value)
+    return missing
+
+def remove_rows(conn, table, ids, hard_delete=False):
+    """
+    Tombstones (or deletes) the given ids in batches inside one transaction.
+    A hard delete first clears the references listed in UNLINKED_ON_DELETE.
+    The inventory history of the variants of removed products is closed
+    first, since a hard delete also deletes the variants.
+    """
+    unlink_queries = []
+    if hard_delete:
+        query = f"DELETE FROM {table} WHERE id = ANY(%s);"
+        unlink_queries = [f"UPDATE {referencing} SET {column} = NULL WHERE {column} = ANY(%s);"
+                          for referencing, column in UNLINKED_ON_DELETE.get(table, [])]
+    else:
+        # last_synced_at moves too, so incremental exports pick the tombstone up
+        query = (f"UPDATE {table} SET deleted_at = NOW(), last_synced_at = NOW() "
+                 f"WHERE id = ANY(%s) AND deleted_at IS NULL;")
+
+    removed = 0
+    with conn.cursor() as cur:
+        for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+            batch = ids[start:start + UPDATE_BATCH_SIZE].tolist()
+            if table == "products":
+                record_removed_variants(cur, product_ids=batch)
+            for unlink_query in unlink_queries:
+                cur.execute(unlink_query, (batch,))
+            cur.execute(query, (batch,))
+            removed += cur.rowcount
+    return removed
+
+def reconcile(endpoint, hard_delete=False, dry_run=False, force=False, include_sample=False):
+    """
+    Reconciles one endpoint. Returns the number of rows removed, or None if
+    the run was aborted.
+    """
+    table = RECONCILED_TABLES[endpoint]
+
+    try:
+        shopify_ids = fetch_shopify_ids(endpoint)
+    except requests.exceptions.RequestException as e:
+        # A partial id set would make live rows look deleted, so never go on.
+        print(f"Error fetching ids from Shopify API: {e}")
+        return None
+
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        db_ids = fetch_db_ids(conn, table, include_sample)
+        missing = missing_ids(db_ids, shopify_ids)
+        print(f"{table}: {len(db_ids)} in database, {len(shopify_ids)} in Shopify, {len(missing)} missing.")
+
+        if not missing:
+            return 0
+
+        if not force and len(missing) > MAX_MISSING_FRACTION * len(db_ids):
+            print(f"Refusing to remove {len(missing)} of {len(db_ids)} {table}; "
+                  f"re-run with --force if this is expected.")
+            return None
+
+        if dry_run:
+            print(f"Dry run: would remove ids {missing[:20].tolist()}{' ...' if len(missing) > 20 else ''}")
+            return 0
+
+        removed = remove_rows(conn, table, missing, hard_delete)
+        if removed:
+            with conn.cursor() as cur:
+                publish_data_version(cur, f"{table}_deletions", removed)
+        conn.commit()
+        action = "Deleted" if hard_delete else "Tombstoned"
+        print(f"{action} {removed} {table}.")
+        return removed
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(f"Error during database operation: {error}")
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove rows deleted in Shopify from the database.")
+    parser.add_argument("entities", nargs="*", metavar="entity",
+                        help=f"entities to reconcile: {', '.join(RECONCILED_TABLES)} (default: all)")
+    parser.add_argument("--delete", action="store_true",
+                        help="delete missing rows instead of setting deleted_at "
+                             "(orders of deleted customers are kept without a customer)")
+    parser.add_argument("--dry-run", action="store_true", help="report missing rows without changing anything")
+    parser.add_argument("--force", action="store_true",
+                        help=f"allow removing more than {MAX_MISSING_FRACTION:.0%}% of a table")
+    parser.add_argument("--include-sample", action="store_true",
+                        help=f"also reconcile sample rows with ids below {SAMPLE_ID_CEILING}")
+    args = parser.parse_args()
+    unknown = [entity for entity in args.entities if entity not in RECONCILED_TABLES]
+    if unknown:
+        parser.error(f"unknown entities: {', '.join(unknown)}")
+
+    print("=" * 60)
+    print("RECONCILING DELETIONS")
+    print("=" * 60)
+
+    for entity in args.entities or RECONCILED_TABLES:
+        print(f"\n{entity.upper()}...")
+        reconcile(entity, hard_delete=args.delete, dry_run=args.dry_run,
+                  force=args.force, include_sample=args.include_sample)
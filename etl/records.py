@@ -0,0 +1,164 @@
+"""
+Compact record types for the Shopify data the ETL keeps.
+
+A raw Shopify record carries addresses, images, body_html and other nested
+objects the tables never use. These slotted classes are built as soon as a
+page is decoded and keep only the fields the loaders read, so the dicts can be
+freed page by page. Low-cardinality strings (vendor, status, ...) are interned
+so repeated values share one object. bench_etl.py --compare-records measures
+the per-record saving.
+
+Each type also declares SHOPIFY_FIELDS, the top-level fields its from_shopify
+reads, which the fetch sends as a fields= projection so Shopify never sends
+the rest.
+"""
+import json
+import sys
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+class Record:
+    """
+    Base class: fields are the __slots__ of the subclass, set positionally.
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+class ProductVariant(Record):
+    # Fetched as part of Product's 'variants' field
+    __slots__ = ('id', 'title', 'sku', 'price', 'compare_at_price', 'inventory_quantity',
+                 'inventory_item_id', 'position', 'created_at', 'updated_at')
+
+    @classmethod
+    def from_shopify(cls, variant):
+        return cls(
+            variant['id'],
+            variant.get('title'),
+            variant.get('sku') or None,
+            variant.get('price'),
+            variant.get('compare_at_price'),
+            variant.get('inventory_quantity'),
+            variant.get('inventory_item_id'),
+            variant.get('position'),
+            variant.get('created_at'),
+            variant.get('updated_at')
+        )
+
+class Product(Record):
+    # variants_json keeps the variants exactly as Shopify sent them for the
+    # products.variants JSONB column; variants holds the parsed records.
+    __slots__ = ('id', 'title', 'vendor', 'product_type', 'created_at', 'handle',
+                 'status', 'tags', 'variants', 'variants_json')
+    SHOPIFY_FIELDS = ('id', 'title', 'vendor', 'product_type', 'created_at', 'handle',
+                      'status', 'tags', 'variants')
+
+    @classmethod
+    def from_shopify(cls, product):
+        variants = product.get('variants') or []
+        return cls(
+            product['id'],
+            product.get('title'),
+            _intern(product.get('vendor')),
+            _intern(product.get('product_type')),
+            product.get('created_at'),
+            product.get('handle'),
+            _intern(product.get('status')),
+            product.get('tags'),
+            tuple(ProductVariant.from_shopify(variant) for variant in variants),
+            json.dumps(variants)
+        )
+
+class Customer(Record):
+    __slots__ = ('id', 'email', 'first_name', 'last_name', 'orders_count',
+                 'total_spent', 'state', 'created_at')
+    SHOPIFY_FIELDS = ('id', 'email', 'first_name', 'last_name', 'orders_count',
+                      'total_spent', 'state', 'created_at')
+
+    @classmethod
+    def from_shopify(cls, customer):
+        return cls(
+            customer['id'],
+            customer.get('email'),
+            customer.get('first_name'),
+            customer.get('last_name'),
+            customer.get('orders_count', 0),
+            customer.get('total_spent', '0.00'),
+            _intern(customer.get('state', 'enabled')),
+            customer.get('created_at')
+        )
+
+class LineItem(Record):
+    # Fetched as part of Order's 'line_items' field
+    __slots__ = ('id', 'product_id', 'variant_id', 'title', 'sku', 'vendor', 'quantity', 'price')
+
+    @classmethod
+    def from_shopify(cls, item):
+        return cls(
+            item['id'],
+            item.get('product_id'),
+            item.get('variant_id'),
+            item.get('title'),
+            item.get('sku') or None,
+            _intern(item.get('vendor')),
+            item.get('quantity', 0),
+            item.get('price')
+        )
+
+class Order(Record):
+    __slots__ = ('id', 'customer_id', 'total_price', 'financial_status',
+                 'fulfillment_status', 'created_at', 'cancelled_at', 'line_items')
+    SHOPIFY_FIELDS = ('id', 'customer', 'total_price', 'financial_status',
+                      'fulfillment_status', 'created_at', 'cancelled_at', 'line_items')
+
+    @classmethod
+    def from_shopify(cls, order):
+        customer = order.get('customer')
+        return cls(
+            order['id'],
+            customer.get('id') if customer else None,
+            order.get('total_price', '0.00'),
+            _intern(order.get('financial_status')),
+            _intern(order.get('fulfillment_status')),
+            order.get('created_at'),
+            order.get('cancelled_at'),
+            tuple(LineItem.from_shopify(item) for item in order.get('line_items') or [])
+        )
+
+    @property
+    def number_of_items(self):
+        return sum(item.quantity for item in self.line_items)
+
+# Shopify endpoint -> record type built from its pages
+RECORD_TYPES = {
+    'products': Product,
+    'customers': Customer,
+    'orders': Order,
+}
+
+def projection(record_type):
+    """
+    Returns the fields= parameter that fetches exactly what record_type reads.
+    """
+    return ",".join(record_type.SHOPIFY_FIELDS)
+
+def missing_fields(record_type, fields):
+    """
+    Returns the fields record_type reads that are absent from `fields`, which
+    may be a fields= string or the keys of a fetched item.
+    """
+    if isinstance(fields, str):
+        fields = {field.strip() for field in fields.split(",")}
+    return [field for field in record_type.SHOPIFY_FIELDS if field not in fields]
@@ -40,14 +40,14 @@ def show_data_summary():
             print("=" * 60)
             
             # Products summary
-            cur.execute("SELECT COUNT(*) FROM products;")
+            cur.execute("SELECT COUNT(*) FROM products WHERE deleted_at IS NULL;")
             product_count = cur.fetchone()[0]
-            cur.execute("SELECT COUNT(*) FROM products WHERE status = 'active';")
+            cur.execute("SELECT COUNT(*) FROM products WHERE status = 'active' AND deleted_at IS NULL;")
             active_products = cur.fetchone()[0]
             print(f"📦 PRODUCTS: {product_count} total ({active_products} active)")
             
             if product_count > 0:
-                cur.execute("SELECT title, vendor, status FROM products ORDER BY created_at DESC LIMIT 5;")
+                cur.execute("SELECT title, vendor, status FROM products WHERE deleted_at IS NULL ORDER BY created_at DESC LIMIT 5;")
                 products = cur.fetchall()
                 for product in products:
                     status_emoji = "✅" if product[2] == "active" else "📝" if product[2] == "draft" else "📁"
@@ -56,12 +56,12 @@ def show_data_summary():
             print()
             
             # Customers summary
-            cur.execute("SELECT COUNT(*) FROM customers;")
+            cur.execute("SELECT COUNT(*) FROM customers WHERE deleted_at IS NULL;")
             customer_count = cur.fetchone()[0]
             print(f"👥 CUSTOMERS: {customer_count}")
             
             if customer_count > 0:
-                cur.execute("SELECT first_name, last_name, email, orders_count, total_spent FROM customers ORDER BY created_at DESC LIMIT 5;")
+                cur.execute("SELECT first_name, last_name, email, orders_count, total_spent FROM customers WHERE deleted_at IS NULL ORDER BY created_at DESC LIMIT 5;")
                 customers = cur.fetchall()
                 for customer in customers:
                     print(f"   👤 {customer[0]} {customer[1]} ({customer[2]}) - {customer[3]} orders, ${customer[4]}")
@@ -69,9 +69,9 @@ def show_data_summary():
             print()
             
             # Orders summary
-            cur.execute("SELECT COUNT(*) FROM orders;")
+            cur.execute("SELECT COUNT(*) FROM orders WHERE cancelled_at IS NULL;")
             order_count = cur.fetchone()[0]
-            cur.execute("SELECT SUM(total_price::numeric) FROM orders;")
+            cur.execute("SELECT SUM(total_price::numeric) FROM orders WHERE cancelled_at IS NULL;")
             total_sales = cur.fetchone()[0] or 0
             print(f"🛍️  ORDERS: {order_count} orders, ${total_sales:.2f} total sales")
             
@@ -85,11 +85,11 @@ def show_data_summary():
             print()
             
             # Real-time vs Sample data
-            cur.execute("SELECT COUNT(*) FROM orders WHERE id < 10000;")
+            cur.execute("SELECT COUNT(*) FROM orders WHERE id < 10000 AND cancelled_at IS NULL;")
             sample_orders = cur.fetchone()[0]
             real_orders = order_count - sample_orders
             
-            cur.execute("SELECT COUNT(*) FROM customers WHERE id < 10000;")
+            cur.execute("SELECT COUNT(*) FROM customers WHERE id < 10000 AND deleted_at IS NULL;")
             sample_customers = cur.fetchone()[0]
             real_customers = customer_count - sample_customers
             
@@ -106,5 +106,8 @@ def show_data_summary():
     finally:
         conn.close()
 
+def main():
+    show_data_summary()
+
 if __name__ == "__main__":
-    show_data_summary()
\ No newline at end of file
+    main()
@@ -0,0 +1,89 @@
+"""
+Answers order analytics for a date range from the per-day sketches.
+
+Merges the HyperLogLog and KLL sketches of every day in the range from
+'order_day_sketches' and prints the distinct customers and order value
+quantiles, without touching the orders table. --exact also runs the exact
+COUNT(DISTINCT) / percentile_cont query over orders for comparison.
+
+    python sketch_report.py 2024-01-01 2024-01-07
+    python sketch_report.py 2024-01-01 2024-03-31 --weekly --exact
+"""
+import argparse
+from datetime import date, timedelta
+
+import psycopg2
+
+from sketches import merge_day_sketches
+from sync_all_data import get_db_connection
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+def sketch_summary(cur, start, end):
+    """
+    Returns (orders, distinct customers, [p50, p95, p99]) for the UTC days
+    start..end inclusive, merged from their sketches.
+    """
+    cur.execute("""
+        SELECT order_count, customers_hll, order_value_kll FROM order_day_sketches
+        WHERE day BETWEEN %s AND %s;
+    """, (start, end))
+    order_count, customers, order_values = merge_day_sketches(cur.fetchall())
+    return order_count, customers.count(), order_values.quantiles(QUANTILES)
+
+def exact_summary(cur, start, end):
+    cur.execute("""
+        SELECT COUNT(*), COUNT(DISTINCT customer_id),
+               percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY total_price::float8)
+        FROM orders
+        WHERE (created_at AT TIME ZONE 'UTC')::date BETWEEN %s AND %s
+          AND cancelled_at IS NULL;
+    """, (list(QUANTILES), start, end))
+    order_count, customers, values = cur.fetchone()
+    return order_count, customers, values or [None] * len(QUANTILES)
+
+def ranges(start, end, weekly):
+    if not weekly:
+        yield start, end
+        return
+    while start <= end:
+        week_end = min(start + timedelta(days=6), end)
+        yield start, week_end
+        start = week_end + timedelta(days=1)
+
+def format_row(label, order_count, customers, values):
+    quantiles = "".join(f"{value:>10.2f}" if value is not None else f"{'-':>10}" for value in values)
+    return f"{label:<26}{order_count:>9}{customers:>11}{quantiles}"
+
+def sketch_report(start, end, weekly=False, exact=False):
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        with conn.cursor() as cur:
+            header = "".join(f"{'p' + format(q * 100, 'g'):>10}" for q in QUANTILES)
+            print(f"\n{'range':<26}{'orders':>9}{'customers':>11}{header}")
+            for range_start, range_end in ranges(start, end, weekly):
+                label = f"{range_start} .. {range_end}"
+                print(format_row(label, *sketch_summary(cur, range_start, range_end)))
+                if exact:
+                    print(format_row("  exact", *exact_summary(cur, range_start, range_end)))
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(f"Error during database operation: {error}")
+    finally:
+        conn.close()
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distinct customers and order value quantiles from the day sketches.")
+    parser.add_argument("start", type=date.fromisoformat, help="first UTC day (YYYY-MM-DD)")
+    parser.add_argument("end", type=date.fromisoformat, help="last UTC day, inclusive (YYYY-MM-DD)")
+    parser.add_argument("--weekly", action="store_true", help="one row per 7-day window instead of one total")
+    parser.add_argument("--exact", action="store_true", help="also compute the exact values from orders")
+    args = parser.parse_args()
+    if args.end < args.start:
+        parser.error("end is before start")
+
+    sketch_report(args.start, args.end, args.weekly, args.exact)
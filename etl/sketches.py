@@ -0,0 +1,244 @@
+"""
+Mergeable approximate sketches for the per-day order analytics.
+
+HyperLogLog counts distinct customers and KLL estimates order value
+quantiles. Both are kept per day in 'order_day_sketches' (see
+order_sketches_db.sql), and an arbitrary date range is answered by merging
+the sketches of its days instead of scanning orders:
+
+    HyperLogLog (p=14)    ~0.8% standard error on distinct counts at any
+                          cardinality, 16 KiB of registers per day
+                          (zlib-compressed when stored)
+    KLL (k=200)           ~1% rank error on quantiles, a few KiB per day
+
+Serialized sketches start with a format version byte so the layout can
+change without misreading old rows.
+"""
+import hashlib
+import math
+import random
+import struct
+import zlib
+from array import array
+
+HLL_PRECISION = 14
+KLL_K = 200
+
+HLL_FORMAT_VERSION = 1
+KLL_FORMAT_VERSION = 1
+
+def _hash64(value):
+    # Stable across processes, unlike hash() on strings
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+def _hll_sigma(x):
+    # Corrects for empty registers; infinite when all are empty (count 0)
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous, z = z, z + x * y
+        y += y
+        if z == previous:
+            return z
+
+def _hll_tau(x):
+    # Corrects for registers at the maximum rank
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter over 2**precision one-byte registers.
+    """
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    def add(self, value):
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rest = h & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge HyperLogLog precision {other.precision} into {self.precision}")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """
+        Estimates the distinct count from the register histogram with Ertl's
+        improved estimator ("New cardinality estimation algorithms for
+        HyperLogLog sketches", 2017). Unlike the classic raw estimate with a
+        switch to linear counting below 2.5 * m, which overestimates by ~2.5%
+        around the switch (~41k distinct at p=14), it is unbiased over the
+        whole range without HLL++'s empirical bias tables.
+        """
+        m = len(self.registers)
+        max_rank = 64 - self.precision + 1
+        histogram = [0] * (max_rank + 1)
+        for register in self.registers:
+            histogram[register] += 1
+
+        z = m * _hll_tau(1 - histogram[max_rank] / m)
+        for rank in range(max_rank - 1, 0, -1):
+            z = 0.5 * (z + histogram[rank])
+        z += m * _hll_sigma(histogram[0] / m)
+        return round(m * m / (2 * math.log(2)) / z)
+
+    def to_bytes(self):
+        return struct.pack("<BB", HLL_FORMAT_VERSION, self.precision) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, precision = struct.unpack_from("<BB", data)
+        if version != HLL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported HyperLogLog format version {version}")
+        return cls(precision, bytearray(zlib.decompress(data[2:])))
+
+class KLL:
+    """
+    KLL quantile sketch: a stack of compactors where an item at level h
+    stands for 2**h inputs. Full levels are sorted and every other item is
+    promoted, so memory stays O(k) however many values are added.
+    """
+
+    def __init__(self, k=KLL_K, seed=None):
+        self.k = k
+        self.count = 0
+        self.compactors = [[]]
+        self._random = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil((2 / 3) ** depth * self.k)) + 1
+
+    def _size(self):
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def _max_size(self):
+        return sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _compress(self):
+        while self._size() >= self._max_size():
+            for level, compactor in enumerate(self.compactors):
+                if len(compactor) >= self._capacity(level):
+                    if level + 1 == len(self.compactors):
+                        self.compactors.append([])
+                    compactor.sort()
+                    odd = len(compactor) % 2
+                    kept = compactor[-1:] if odd else []
+                    offset = self._random.randrange(2)
+                    self.compactors[level + 1].extend(compactor[offset:len(compactor) - odd:2])
+                    self.compactors[level] = kept
+                    break
+
+    def add(self, value):
+        self.compactors[0].append(float(value))
+        self.count += 1
+        if len(self.compactors[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, compactor in enumerate(other.compactors):
+            self.compactors[level].extend(compactor)
+        self.count += other.count
+        self._compress()
+        return self
+
+    def _weighted(self):
+        items = [(value, 1 << level) for level, compactor in enumerate(self.compactors) for value in compactor]
+        items.sort()
+        return items
+
+    def quantiles(self, fractions):
+        """
+        Returns the estimated value at each fraction (0..1), or None for
+        every fraction if the sketch is empty.
+        """
+        items = self._weighted()
+        if not items:
+            return [None] * len(fractions)
+        total = sum(weight for _, weight in items)
+        results = []
+        for fraction in fractions:
+            target = fraction * total
+            cumulative = 0
+            for value, weight in items:
+                cumulative += weight
+                if cumulative >= target:
+                    break
+            results.append(value)
+        return results
+
+    def to_bytes(self):
+        parts = [struct.pack("<BHQH", KLL_FORMAT_VERSION, self.k, self.count, len(self.compactors))]
+        for compactor in self.compactors:
+            parts.append(struct.pack("<I", len(compactor)))
+            parts.append(array("d", compactor).tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, k, count, levels = struct.unpack_from("<BHQH", data)
+        if version != KLL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported KLL format version {version}")
+        sketch = cls(k)
+        sketch.count = count
+        sketch.compactors = []
+        offset = struct.calcsize("<BHQH")
+        for _ in range(levels):
+            (length,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            values = array("d")
+            values.frombytes(data[offset:offset + 8 * length])
+            offset += 8 * length
+            sketch.compactors.append(values.tolist())
+        return sketch
+
+def build_day_sketches(rows):
+    """
+    Builds {day: (order_count, HyperLogLog of customers, KLL of order values)}
+    from (day, customer_id, total_price) rows. Guest orders without a
+    customer count towards the order values but not the distinct customers.
+    """
+    sketches = {}
+    for day, customer_id, total_price in rows:
+        if day not in sketches:
+            sketches[day] = [0, HyperLogLog(), KLL(seed=day.toordinal())]
+        entry = sketches[day]
+        entry[0] += 1
+        if customer_id is not None:
+            entry[1].add(customer_id)
+        if total_price is not None:
+            entry[2].add(total_price)
+    return {day: tuple(entry) for day, entry in sketches.items()}
+
+def merge_day_sketches(rows):
+    """
+    Merges serialized (order_count, customers_hll, order_value_kll) rows into
+    one (order_count, HyperLogLog, KLL).
+    """
+    order_count, customers, order_values = 0, HyperLogLog(), KLL(seed=0)
+    for count, hll_bytes, kll_bytes in rows:
+        order_count += count
+        customers.merge(HyperLogLog.from_bytes(bytes(hll_bytes)))
+        order_values.merge(KLL.from_bytes(bytes(kll_bytes)))
+    return order_count, customers, order_values
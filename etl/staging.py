@@ -0,0 +1,336 @@
+"""
+Staging-table merge loads.
+
+Instead of upserting row by row into the live tables, a load COPYs its rows
+into an UNLOGGED "<table>_staging" copy of the table, then applies them with
+one set-based INSERT ... ON CONFLICT inside a short transaction. Readers of
+the live table only ever see the state before or after the merge, and its
+row locks are held for the merge alone rather than the whole load.
+
+A bad row costs only itself. stage_rows COPYs in batches under savepoints,
+and merge_staged_isolated merges in batches under savepoints: a failing
+batch is bisected down to the offending rows, which are moved to
+'etl_dead_letters' (see dead_letters_db.sql) while every other row is
+staged and merged. COPY catches values the column types or NOT NULL
+reject (an overflowing price, an over-long title), the merge catches keys
+and other constraints of the live table.
+
+For derived tables that nothing references, swap_in_staged replaces the
+whole table at once with a rename instead of merging.
+"""
+import io
+import json
+
+import psycopg2
+
+COPY_BATCH_SIZE = 10000
+MERGE_BATCH_SIZE = 5000
+
+# What to do with staged rows whose foreign key points at a missing parent
+MISSING_PARENT_MODES = ("dead_letter", "stub", "null")
+
+def staging_table(table):
+    return f"{table}_staging"
+
+def _copy_value(value):
+    """
+    Formats one value for COPY's text format.
+    """
+    if value is None:
+        return "\\N"
+    text = str(value)
+    return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def copy_rows(cur, table, columns, rows, batch_size=None):
+    """
+    COPYs row tuples into table in batches of batch_size (default
+    COPY_BATCH_SIZE). Returns the number of rows copied.
+    """
+    batch_size = batch_size or COPY_BATCH_SIZE
+    copy_sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    count = 0
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(value) for value in row))
+        buffer.write("\n")
+        count += 1
+        if count % batch_size == 0:
+            buffer.seek(0)
+            cur.copy_expert(copy_sql, buffer)
+            buffer = io.StringIO()
+    if buffer.tell():
+        buffer.seek(0)
+        cur.copy_expert(copy_sql, buffer)
+    return count
+
+def dead_letter_rows(cur, table, columns, rows, error, sqlstate=None):
+    """
+    Writes row tuples that never made it into staging to 'etl_dead_letters',
+    with the row as JSON. Returns the number of rows dead-lettered.
+    """
+    id_index = columns.index("id") if "id" in columns else None
+    for row in rows:
+        record_id = row[id_index] if id_index is not None else None
+        cur.execute("""
+        INSERT INTO etl_dead_letters (table_name, record_id, error, sqlstate, payload)
+        VALUES (%s, %s, %s, %s, %s);
+        """, (table, record_id, error, sqlstate, json.dumps(dict(zip(columns, row)), default=str)))
+    return len(rows)
+
+def _copy_bisecting(cur, table, staging, columns, rows):
+    cur.execute("SAVEPOINT staged_copy;")
+    try:
+        copy_rows(cur, staging, columns, rows, batch_size=len(rows))
+    except psycopg2.DatabaseError as error:
+        cur.execute("ROLLBACK TO SAVEPOINT staged_copy;")
+        cur.execute("RELEASE SAVEPOINT staged_copy;")
+        if len(rows) == 1:
+            return 0, dead_letter_rows(cur, table, columns, rows, str(error).strip(), error.pgcode)
+        middle = len(rows) // 2
+        left_copied, left_failed = _copy_bisecting(cur, table, staging, columns, rows[:middle])
+        right_copied, right_failed = _copy_bisecting(cur, table, staging, columns, rows[middle:])
+        return left_copied + right_copied, left_failed + right_failed
+    cur.execute("RELEASE SAVEPOINT staged_copy;")
+    return len(rows), 0
+
+def stage_rows(conn, table, columns, rows):
+    """
+    Replaces the contents of the staging table for `table` with `rows` and
+    commits. The live table is not touched. Rows COPY rejects are isolated
+    like in merge_staged_isolated and dead-lettered.
+    Returns (rows staged, rows dead-lettered).
+    """
+    staging = staging_table(table)
+    staged = failed = 0
+    with conn.cursor() as cur:
+        # Recreated on every load so it follows migrations of the live table.
+        # LIKE copies columns, defaults and NOT NULL, but no indexes or keys,
+        # so COPY into it is as cheap as it gets; UNLOGGED skips the WAL.
+        cur.execute(f"DROP TABLE IF EXISTS {staging};")
+        cur.execute(f"CREATE UNLOGGED TABLE {staging} (LIKE {table} INCLUDING DEFAULTS);")
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == COPY_BATCH_SIZE:
+                batch_staged, batch_failed = _copy_bisecting(cur, table, staging, columns, batch)
+                staged += batch_staged
+                failed += batch_failed
+                batch = []
+        if batch:
+            batch_staged, batch_failed = _copy_bisecting(cur, table, staging, columns, batch)
+            staged += batch_staged
+            failed += batch_failed
+        cur.execute(f"ANALYZE {staging};")
+    conn.commit()
+    return staged, failed
+
+def merge_staged(cur, table, columns, key_columns=("id",), extra_updates=None, ids=None,
+                 insert_only=()):
+    """
+    Applies the staged rows of `table` to the live table with one
+    INSERT ... ON CONFLICT DO UPDATE on the caller's cursor, so the caller
+    decides what else commits with it. Rows staged twice (e.g. a record
+    that moved between pages mid-fetch) are merged once.
+
+    Existing rows are only updated, and their last_synced_at only moved,
+    when a column (or one of the {column: SQL expression} extra_updates)
+    actually changes, so last_synced_at tells which rows changed since a
+    given time. Columns in `insert_only` are written for new rows and never
+    updated or compared, for values another step maintains. If `ids` is
+    given, only the staged rows with those ids are merged; otherwise dead
+    letters of earlier loads whose rows now merged are marked resolved.
+    Returns the number of rows inserted or changed.
+    """
+    staging = staging_table(table)
+    column_list = ", ".join(columns)
+    new_values = {column: f"EXCLUDED.{column}" for column in columns
+                  if column not in key_columns and column not in insert_only}
+    new_values.update(extra_updates or {})
+    updates = [f"{column} = {value}" for column, value in new_values.items()]
+    updates.append("last_synced_at = NOW()")
+    current = ", ".join(f"{table}.{column}" for column in new_values)
+
+    where = "WHERE id = ANY(%s)" if ids is not None else ""
+
+    cur.execute(f"""
+    INSERT INTO {table} ({column_list})
+    SELECT DISTINCT ON ({', '.join(key_columns)}) {column_list} FROM {staging} {where}
+    ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET
+        {', '.join(updates)}
+    WHERE ({current}) IS DISTINCT FROM ({', '.join(new_values.values())});
+    """, (list(ids),) if ids is not None else None)
+    merged = cur.rowcount
+    if ids is None:
+        resolve_dead_letters(cur, table)
+    return merged
+
+def resolve_dead_letters(cur, table):
+    """
+    Marks the unresolved dead letters of `table` whose record is staged now
+    as resolved.
+    """
+    cur.execute(f"""
+    UPDATE etl_dead_letters SET resolved_at = NOW()
+    WHERE table_name = %s AND resolved_at IS NULL
+      AND record_id IN (SELECT id FROM {staging_table(table)});
+    """, (table,))
+
+def dead_letter(cur, table, ids, error, sqlstate=None):
+    """
+    Copies the staged rows of `table` with the given ids into
+    'etl_dead_letters' along with the error, and removes them from staging
+    so later steps of the load treat them as not loaded.
+    Returns the number of rows dead-lettered.
+    """
+    staging = staging_table(table)
+    cur.execute(f"""
+    INSERT INTO etl_dead_letters (table_name, record_id, error, sqlstate, payload)
+    SELECT %s, id, %s, %s, to_jsonb(staged) FROM {staging} staged WHERE id = ANY(%s);
+    """, (table, error, sqlstate, list(ids)))
+    cur.execute(f"DELETE FROM {staging} WHERE id = ANY(%s);", (list(ids),))
+    return cur.rowcount
+
+def _merge_bisecting(cur, table, columns, extra_updates, ids):
+    cur.execute("SAVEPOINT staged_merge;")
+    try:
+        merged = merge_staged(cur, table, columns, extra_updates=extra_updates, ids=ids)
+    except psycopg2.DatabaseError as error:
+        cur.execute("ROLLBACK TO SAVEPOINT staged_merge;")
+        cur.execute("RELEASE SAVEPOINT staged_merge;")
+        if len(ids) == 1:
+            return 0, dead_letter(cur, table, ids, str(error).strip(), error.pgcode)
+        middle = len(ids) // 2
+        left_merged, left_failed = _merge_bisecting(cur, table, columns, extra_updates, ids[:middle])
+        right_merged, right_failed = _merge_bisecting(cur, table, columns, extra_updates, ids[middle:])
+        return left_merged + right_merged, left_failed + right_failed
+    cur.execute("RELEASE SAVEPOINT staged_merge;")
+    return merged, 0
+
+def merge_staged_isolated(cur, table, columns, extra_updates=None, batch_size=None):
+    """
+    Like merge_staged, but merges MERGE_BATCH_SIZE staged ids at a time, each
+    under a savepoint. A batch that fails is rolled back to its savepoint
+    and split in halves until the failing rows are found; those are
+    dead-lettered and everything else is merged. Dead letters of earlier
+    loads whose rows now merged are marked resolved.
+    Returns (rows merged, rows dead-lettered).
+    """
+    staging = staging_table(table)
+    batch_size = batch_size or MERGE_BATCH_SIZE
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {staging}_id_idx ON {staging} (id);")
+    cur.execute(f"SELECT DISTINCT id FROM {staging} ORDER BY id;")
+    ids = [row[0] for row in cur.fetchall()]
+
+    merged = failed = 0
+    for offset in range(0, len(ids), batch_size):
+        batch_merged, batch_failed = _merge_bisecting(cur, table, columns, extra_updates,
+                                                      ids[offset:offset + batch_size])
+        merged += batch_merged
+        failed += batch_failed
+
+    resolve_dead_letters(cur, table)
+    return merged, failed
+
+def resolve_missing_parents(cur, table, column, parent_table, mode="dead_letter", stub_values=None):
+    """
+    Handles staged rows of `table` whose `column` references a row missing
+    from `parent_table`, before they are merged:
+
+        dead_letter   moves them to 'etl_dead_letters'
+        stub          bulk-creates the missing parents from their ids plus
+                      stub_values ({column: value}), so the rows merge
+        null          clears `column`, so the rows merge without the link
+
+    Returns the number of rows (or stub parents) affected.
+    """
+    if mode not in MISSING_PARENT_MODES:
+        raise ValueError(f"Unknown missing-parent mode {mode!r}; expected one of {', '.join(MISSING_PARENT_MODES)}")
+    staging = staging_table(table)
+    missing = (f"staged.{column} IS NOT NULL AND NOT EXISTS "
+               f"(SELECT 1 FROM {parent_table} parent WHERE parent.id = staged.{column})")
+
+    if mode == "null":
+        cur.execute(f"UPDATE {staging} staged SET {column} = NULL WHERE {missing};")
+        return cur.rowcount
+
+    if mode == "stub":
+        stub_values = stub_values or {}
+        stub_columns = "".join(f", {name}" for name in stub_values)
+        stub_placeholders = "".join(", %s" for _ in stub_values)
+        cur.execute(f"""
+        INSERT INTO {parent_table} (id{stub_columns})
+        SELECT DISTINCT staged.{column}{stub_placeholders} FROM {staging} staged WHERE {missing}
+        ON CONFLICT (id) DO NOTHING;
+        """, tuple(stub_values.values()))
+        return cur.rowcount
+
+    cur.execute(f"SELECT id FROM {staging} staged WHERE {missing};")
+    ids = [row[0] for row in cur.fetchall()]
+    if not ids:
+        return 0
+    return dead_letter(cur, table, ids, f"{column} references a missing {parent_table} row", "23503")
+
+def delete_unstaged_children(cur, table, parent_table, parent_column):
+    """
+    Deletes rows of `table` that belong to a staged parent but were not
+    staged themselves, e.g. variants removed from a product since the last
+    sync. Rows with an unresolved dead letter were not staged because they
+    failed to load, not because they are gone, and are kept.
+    Runs on the caller's cursor. Returns the ids of the rows deleted.
+    """
+    cur.execute(f"""
+    DELETE FROM {table} child
+    USING {staging_table(parent_table)} parent
+    WHERE child.{parent_column} = parent.id
+      AND NOT EXISTS (SELECT 1 FROM {staging_table(table)} staged WHERE staged.id = child.id)
+      AND NOT EXISTS (SELECT 1 FROM etl_dead_letters dead
+                      WHERE dead.table_name = %s AND dead.record_id = child.id AND dead.resolved_at IS NULL)
+    RETURNING child.id;
+    """, (table,))
+    return [row[0] for row in cur.fetchall()]
+
+def _foreign_keys_involving(cur, table):
+    cur.execute("""
+        SELECT conname FROM pg_constraint
+        WHERE contype = 'f' AND (conrelid = %s::regclass OR confrelid = %s::regclass);
+    """, (table, table))
+    return [row[0] for row in cur.fetchall()]
+
+def swap_in_staged(conn, table, columns):
+    """
+    Full refresh: builds a complete new copy of `table` from its staging
+    table and swaps it in with two renames in one short transaction. Indexes,
+    defaults and grants are recreated; tables that take part in foreign keys
+    are refused, since the keys would keep pointing at the old table.
+    Returns the number of rows in the new table.
+    """
+    staging = staging_table(table)
+    new_table = f"{table}_new"
+    old_table = f"{table}_old"
+    column_list = ", ".join(columns)
+
+    with conn.cursor() as cur:
+        foreign_keys = _foreign_keys_involving(cur, table)
+        if foreign_keys:
+            raise ValueError(f"Cannot swap {table}: it is part of foreign keys {', '.join(foreign_keys)}; "
+                             f"use merge_staged instead.")
+
+        cur.execute(f"DROP TABLE IF EXISTS {new_table};")
+        cur.execute(f"CREATE TABLE {new_table} (LIKE {table} INCLUDING ALL);")
+        cur.execute(f"INSERT INTO {new_table} ({column_list}) SELECT {column_list} FROM {staging};")
+        count = cur.rowcount
+        cur.execute("""
+            SELECT grantee, privilege_type FROM information_schema.role_table_grants
+            WHERE table_schema = current_schema() AND table_name = %s;
+        """, (table,))
+        grants = cur.fetchall()
+    conn.commit()
+
+    with conn.cursor() as cur:
+        cur.execute(f"ALTER TABLE {table} RENAME TO {old_table};")
+        cur.execute(f"ALTER TABLE {new_table} RENAME TO {table};")
+        for grantee, privilege in grants:
+            cur.execute(f'GRANT {privilege} ON {table} TO "{grantee}";')
+        cur.execute(f"DROP TABLE {old_table};")
+    conn.commit()
+    return count
@@ -1,10 +1,19 @@
+import argparse
 import os
+import time
 import requests
 import psycopg2
 from dotenv import load_dotenv
 from datetime import datetime
 import json
 
+from product_catalog import ProductCatalog
+from records import RECORD_TYPES, missing_fields, projection
+from sketches import build_day_sketches
+from staging import (MISSING_PARENT_MODES, delete_unstaged_children, merge_staged, merge_staged_isolated,
+                     resolve_missing_parents, stage_rows)
+from sync_lock import LOCK_MODES, SyncLock, active_runs
+
 # Load environment variables from the .env file
 load_dotenv()
 
@@ -19,72 +28,210 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 
+# What to do with orders whose customer is not in the database (see
+# staging.resolve_missing_parents): 'dead_letter', 'stub' or 'null'
+ON_MISSING_CUSTOMER = os.getenv("ETL_ON_MISSING_CUSTOMER", "dead_letter")
+# Stub customers are recognisable by their state until a customer sync fills them in
+CUSTOMER_STUB_VALUES = {'state': 'stub'}
+
+# Channel on which each committed load announces the new data version
+DATA_VERSION_CHANNEL = "data_version"
+
+# Shopify requests answered with one of these statuses (rate limited or a
+# server error) are retried up to SHOPIFY_MAX_RETRIES times, waiting what the
+# Retry-After header asks for or else an exponential backoff.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SHOPIFY_MAX_RETRIES = int(os.getenv("SHOPIFY_MAX_RETRIES", "5"))
+RETRY_BACKOFF_SECONDS = 1.0
+MAX_RETRY_DELAY_SECONDS = 60.0
+
+# Endpoints already reported as returning fewer fields than their record type reads
+_reported_missing_fields = set()
+
+# Extra query parameters each entity is fetched with. Without status=any
+# Shopify returns open orders only; orders older than 60 days also need the
+# read_all_orders scope on the access token.
+SHOPIFY_PARAMS = {
+    'orders': {'status': 'any'},
+}
+
+# Column order of the rows built by product_row, variant_rows, customer_row,
+# order_row and line_item_rows
+PRODUCT_COLUMNS = ('id', 'title', 'vendor', 'product_type', 'created_at', 'handle', 'status', 'tags', 'variants')
+VARIANT_COLUMNS = ('id', 'product_id', 'title', 'sku', 'price', 'compare_at_price', 'inventory_quantity',
+                   'inventory_item_id', 'position', 'created_at', 'updated_at')
+CUSTOMER_COLUMNS = ('id', 'email', 'first_name', 'last_name', 'orders_count', 'total_spent', 'state', 'created_at')
+ORDER_COLUMNS = ('id', 'customer_id', 'total_price', 'financial_status', 'fulfillment_status',
+                 'number_of_items', 'created_at', 'cancelled_at')
+LINE_ITEM_COLUMNS = ('id', 'order_id', 'product_id', 'variant_id', 'title', 'sku', 'vendor', 'product_type',
+                     'quantity', 'price')
+
 # --- Shopify API Functions ---
 
-def get_shopify_data(endpoint, limit=250):
+def next_page_url(link_header):
     """
-    Generic function to fetch data from Shopify API with pagination support.
+    Extracts the rel="next" URL from a Shopify Link header, if there is one.
+    """
+    if not link_header or 'rel="next"' not in link_header:
+        return None
+    for link in link_header.split(','):
+        if 'rel="next"' in link:
+            return link.split('<')[1].split('>')[0]
+    return None
+
+def shopify_api_url(endpoint):
+    return f"https://{SHOPIFY_STORE_URL}/admin/api/{SHOPIFY_API_VERSION}/{endpoint}.json"
+
+def shopify_headers(compress=True):
+    """
+    Request headers for the Shopify Admin API. With compress=True the
+    responses are negotiated as gzip, which shrinks JSON pages several-fold.
     """
-    api_url = f"https://{SHOPIFY_STORE_URL}/admin/api/{SHOPIFY_API_VERSION}/{endpoint}.json"
-    headers = {
+    return {
         "X-Shopify-Access-Token": SHOPIFY_ACCESS_TOKEN,
-        "Content-Type": "application/json"
+        "Content-Type": "application/json",
+        "Accept-Encoding": "gzip" if compress else "identity"
     }
-    
+
+def retry_delay(response, attempt):
+    """
+    Seconds to wait before retrying a request after `response`: the
+    Retry-After header if it holds a number of seconds, otherwise an
+    exponential backoff from the attempt number, capped either way.
+    """
+    try:
+        delay = float(response.headers.get('Retry-After', ''))
+    except ValueError:
+        delay = RETRY_BACKOFF_SECONDS * 2 ** attempt
+    return min(max(delay, 0.0), MAX_RETRY_DELAY_SECONDS)
+
+def shopify_get(url, headers, params=None):
+    """
+    GETs a Shopify URL, retrying rate-limited and server-error responses
+    (RETRY_STATUSES) before giving up. Request errors are raised.
+    """
+    for attempt in range(SHOPIFY_MAX_RETRIES + 1):
+        response = requests.get(url, headers=headers, params=params)
+        if response.status_code not in RETRY_STATUSES or attempt == SHOPIFY_MAX_RETRIES:
+            break
+        delay = retry_delay(response, attempt)
+        print(f"Shopify answered {response.status_code}; retrying in {delay:.1f}s "
+              f"({attempt + 1}/{SHOPIFY_MAX_RETRIES})...")
+        time.sleep(delay)
+    response.raise_for_status()
+    return response
+
+def iter_shopify_responses(endpoint, limit=250, fields=None, params=None):
+    """
+    Yields the raw HTTP response for each page of a Shopify endpoint,
+    following the Link header pagination. Rate-limited requests are retried
+    (see shopify_get); other request errors are raised.
+    `params` are extra query parameters for the first page, e.g. filters;
+    the next-page URLs carry them on.
+    """
+    api_url = shopify_api_url(endpoint)
+    headers = shopify_headers()
+
+    params = {**(params or {}), "limit": limit}
+    if fields:
+        params["fields"] = fields
+
+    while True:
+        response = shopify_get(api_url, headers, params)
+        yield response
+
+        next_url = next_page_url(response.headers.get('Link'))
+        if not next_url:
+            return
+
+        api_url = next_url
+        params = {}  # URL already contains parameters
+        if fields and 'fields=' not in next_url:
+            params["fields"] = fields
+
+def decode_page(endpoint, body, record_type=None):
+    """
+    Decodes the JSON body of one page into its list of records.
+    With a record_type from records.py, each item is converted to that compact
+    type right away, so the decoded dicts can be freed with the page.
+    """
+    endpoint_key = endpoint.split('/')[-1]  # Get the last part of the endpoint
+    items = json.loads(body).get(endpoint_key, [])
+    if record_type is not None:
+        if items and endpoint not in _reported_missing_fields:
+            # Shopify silently drops fields it does not know (e.g. after an API
+            # version change), which would otherwise load as NULLs.
+            missing = missing_fields(record_type, items[0].keys())
+            if missing:
+                _reported_missing_fields.add(endpoint)
+                print(f"Warning: {endpoint} response has no {', '.join(missing)} "
+                      f"field(s) needed by {record_type.__name__}.")
+        items = [record_type.from_shopify(item) for item in items]
+    return items
+
+def iter_shopify_pages(endpoint, limit=250, fields=None, record_type=None, params=None):
+    """
+    Yields the records of a Shopify endpoint one page at a time.
+    Unlike get_shopify_data, request errors are raised to the caller so a
+    partial fetch can be told apart from a complete one.
+
+    With a record_type, only the fields it declares are requested unless
+    `fields` is given, in which case it must include all of them.
+    """
+    if record_type is not None:
+        if fields is None:
+            fields = projection(record_type)
+        else:
+            missing = missing_fields(record_type, fields)
+            if missing:
+                raise ValueError(f"fields= for {endpoint} is missing {', '.join(missing)}, "
+                                 f"which {record_type.__name__} needs")
+
+    for response in iter_shopify_responses(endpoint, limit=limit, fields=fields, params=params):
+        items = decode_page(endpoint, response.content, record_type)
+        if not items:
+            return
+        yield items
+
+def get_shopify_data(endpoint, limit=250, fields=None, record_type=None, params=None):
+    """
+    Generic function to fetch data from Shopify API with pagination support.
+    """
+    endpoint_key = endpoint.split('/')[-1]
     all_data = []
-    params = {"limit": limit}
-    
+
     print(f"Fetching {endpoint} from Shopify...")
-    
-    while True:
-        try:
-            response = requests.get(api_url, headers=headers, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Extract the data based on endpoint
-            endpoint_key = endpoint.split('/')[-1]  # Get the last part of the endpoint
-            items = data.get(endpoint_key, [])
-            
-            if not items:
-                break
-                
+
+    try:
+        for items in iter_shopify_pages(endpoint, limit=limit, fields=fields, record_type=record_type,
+                                        params=params):
             all_data.extend(items)
             print(f"Fetched {len(items)} {endpoint_key} (total: {len(all_data)})")
-            
-            # Check for pagination
-            link_header = response.headers.get('Link')
-            if not link_header or 'rel="next"' not in link_header:
-                break
-                
-            # Extract next page URL from Link header
-            next_url = None
-            for link in link_header.split(','):
-                if 'rel="next"' in link:
-                    next_url = link.split('<')[1].split('>')[0]
-                    break
-            
-            if not next_url:
-                break
-                
-            api_url = next_url
-            params = {}  # URL already contains parameters
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching data from Shopify API: {e}")
-            break
-    
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching data from Shopify API: {e}")
+
     print(f"Successfully fetched {len(all_data)} {endpoint_key}.")
     return all_data
 
+def shopify_request(entity):
+    """
+    Returns (endpoint, params, fields) to fetch an entity of RECORD_TYPES with,
+    so every caller requests the same records and fields the sync loads.
+    """
+    return entity, dict(SHOPIFY_PARAMS.get(entity, {})), projection(RECORD_TYPES[entity])
+
+def get_shopify_records(entity):
+    endpoint, params, fields = shopify_request(entity)
+    return get_shopify_data(endpoint, fields=fields, record_type=RECORD_TYPES[entity], params=params)
+
 def get_shopify_products():
-    return get_shopify_data("products")
+    return get_shopify_records("products")
 
 def get_shopify_customers():
-    return get_shopify_data("customers")
+    return get_shopify_records("customers")
 
 def get_shopify_orders():
-    return get_shopify_data("orders")
+    return get_shopify_records("orders")
 
 # --- PostgreSQL Database Functions ---
 
@@ -111,9 +258,149 @@ def get_db_connection():
         print(f"Error connecting to the database: {e}")
         return None
 
-def insert_products_into_db(products):
+def product_row(product):
+    """
+    Transforms a Product record into a row for the 'products' table.
+    """
+    return (
+        product.id,
+        product.title,
+        product.vendor,
+        product.product_type,
+        product.created_at,
+        product.handle,
+        product.status,
+        product.tags,
+        product.variants_json
+    )
+
+def customer_row(customer):
     """
-    Inserts a list of product records into the 'products' table.
+    Transforms a Customer record into a row for the 'customers' table.
+    """
+    return (
+        customer.id,
+        customer.email,
+        customer.first_name,
+        customer.last_name,
+        customer.orders_count,
+        customer.total_spent,
+        customer.state,
+        customer.created_at
+    )
+
+def order_row(order):
+    """
+    Transforms an Order record into a row for the 'orders' table.
+    """
+    return (
+        order.id,
+        order.customer_id,
+        order.total_price,
+        order.financial_status,
+        order.fulfillment_status,
+        order.number_of_items,
+        order.created_at,
+        order.cancelled_at
+    )
+
+def publish_data_version(cur, entity, row_count):
+    """
+    Records a completed load of `entity` in 'sync_runs' under a new data
+    version and announces it with pg_notify. Runs on the caller's cursor, so
+    the version only becomes visible (and the notification is only sent)
+    when the load itself commits. If the load runs under a SyncLock, its
+    running 'sync_runs' row is completed instead.
+    """
+    run_id = active_runs.get(entity)
+    if run_id is not None:
+        cur.execute("""
+        UPDATE sync_runs
+        SET status = 'completed', row_count = %s, data_version = nextval('sync_data_version_seq'), finished_at = NOW()
+        WHERE id = %s
+        RETURNING data_version;
+        """, (row_count, run_id))
+    else:
+        cur.execute("""
+        INSERT INTO sync_runs (shop, entity, status, row_count, data_version, finished_at)
+        VALUES (%s, %s, 'completed', %s, nextval('sync_data_version_seq'), NOW())
+        RETURNING data_version;
+        """, (SHOPIFY_STORE_URL, entity, row_count))
+    version = cur.fetchone()[0]
+    cur.execute("SELECT pg_notify(%s, %s);", (DATA_VERSION_CHANNEL, str(version)))
+    return version
+
+def variant_rows(products):
+    """
+    Flattens the variants of each product into rows for the 'product_variants' table.
+    """
+    rows = []
+    for product in products:
+        for variant in product.variants:
+            rows.append((
+                variant.id,
+                product.id,
+                variant.title,
+                variant.sku,
+                variant.price,
+                variant.compare_at_price,
+                variant.inventory_quantity,
+                variant.inventory_item_id,
+                variant.position,
+                variant.created_at,
+                variant.updated_at
+            ))
+    return rows
+
+def record_removed_variants(cur, variant_ids=(), product_ids=()):
+    """
+    Adds a final 'inventory_snapshots' row with a NULL quantity for each of
+    variant_ids and each variant of product_ids, so their history ends where
+    the variant was removed. Call it before the variants are deleted.
+    Returns the number of rows added.
+    """
+    cur.execute("""
+    INSERT INTO inventory_snapshots (variant_id, observed_at, inventory_quantity)
+    SELECT removed.id, NOW(), NULL FROM (
+        SELECT unnest(%s::bigint[]) AS id
+        UNION
+        SELECT id FROM product_variants WHERE product_id = ANY(%s)
+    ) removed
+    ON CONFLICT (variant_id, observed_at) DO NOTHING;
+    """, (list(variant_ids), list(product_ids)))
+    return cur.rowcount
+
+def record_inventory_changes(cur, removed_variant_ids=()):
+    """
+    Adds an 'inventory_snapshots' row for every staged variant whose
+    inventory_quantity differs from its latest snapshot (or that has none
+    yet), so the history stores changes only, and closes the history of
+    removed_variant_ids (see record_removed_variants). Runs on the caller's
+    cursor so the snapshots commit with the variants. Returns the number of
+    rows added.
+    """
+    cur.execute("""
+    INSERT INTO inventory_snapshots (variant_id, observed_at, inventory_quantity)
+    SELECT DISTINCT ON (staged.id) staged.id, NOW(), staged.inventory_quantity
+    FROM product_variants_staging staged
+    LEFT JOIN LATERAL (
+        SELECT inventory_quantity FROM inventory_snapshots snapshot
+        WHERE snapshot.variant_id = staged.id
+        ORDER BY snapshot.observed_at DESC
+        LIMIT 1
+    ) latest ON TRUE
+    WHERE latest.inventory_quantity IS DISTINCT FROM staged.inventory_quantity
+    ON CONFLICT (variant_id, observed_at) DO NOTHING;
+    """)
+    added = cur.rowcount
+    if removed_variant_ids:
+        added += record_removed_variants(cur, removed_variant_ids)
+    return added
+
+def insert_products_into_db(products, catalog=None):
+    """
+    Inserts a list of Product records into the 'products' table.
+    If a ProductCatalog is given, it is refreshed once the products are committed.
     """
     if not products:
         print("No products to insert.")
@@ -123,42 +410,28 @@ def insert_products_into_db(products):
     if not conn:
         return
 
-    insert_query = """
-    INSERT INTO products (id, title, vendor, product_type, created_at, handle, status, tags, variants)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (id) DO UPDATE SET
-        title = EXCLUDED.title,
-        vendor = EXCLUDED.vendor,
-        product_type = EXCLUDED.product_type,
-        created_at = EXCLUDED.created_at,
-        handle = EXCLUDED.handle,
-        status = EXCLUDED.status,
-        tags = EXCLUDED.tags,
-        variants = EXCLUDED.variants,
-        last_synced_at = NOW();
-    """
-
-    print("Inserting/updating products in the database...")
-    count = 0
+    print("Staging products...")
     try:
+        _, failed = stage_rows(conn, 'products', PRODUCT_COLUMNS, (product_row(product) for product in products))
+        _, failed_variants = stage_rows(conn, 'product_variants', VARIANT_COLUMNS, variant_rows(products))
+        failed += failed_variants
+
+        print("Merging products into the database...")
         with conn.cursor() as cur:
-            for product in products:
-                variants_json = json.dumps(product.get('variants', []))
-                
-                cur.execute(insert_query, (
-                    product['id'],
-                    product.get('title'),
-                    product.get('vendor'),
-                    product.get('product_type'),
-                    product.get('created_at'),
-                    product.get('handle'),
-                    product.get('status'),
-                    product.get('tags'),
-                    variants_json
-                ))
-                count += 1
+            count = merge_staged(cur, 'products', PRODUCT_COLUMNS, extra_updates={"deleted_at": "NULL"})
+            # Variants of a new product that could not be staged have nothing to merge into
+            failed += resolve_missing_parents(cur, 'product_variants', 'product_id', 'products')
+            variant_count = merge_staged(cur, 'product_variants', VARIANT_COLUMNS)
+            removed_variants = delete_unstaged_children(cur, 'product_variants', 'products', 'product_id')
+            inventory_changes = record_inventory_changes(cur, removed_variants)
+            publish_data_version(cur, 'products', count)
             conn.commit()
-            print(f"Successfully inserted/updated {count} products.")
+            print(f"Successfully inserted/updated {count} products ({variant_count} variants, "
+                  f"{inventory_changes} inventory changes).")
+            if failed:
+                print(f"{failed} rows could not be loaded and were moved to etl_dead_letters.")
+            if catalog is not None:
+                catalog.update_from_products(products)
     except (Exception, psycopg2.DatabaseError) as error:
         print(f"Error during database operation: {error}")
         conn.rollback()
@@ -168,7 +441,7 @@ def insert_products_into_db(products):
 
 def insert_customers_into_db(customers):
     """
-    Inserts a list of customer records into the 'customers' table.
+    Inserts a list of Customer records into the 'customers' table.
     """
     if not customers:
         print("No customers to insert.")
@@ -178,38 +451,22 @@ def insert_customers_into_db(customers):
     if not conn:
         return
 
-    insert_query = """
-    INSERT INTO customers (id, email, first_name, last_name, orders_count, total_spent, state, created_at)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (id) DO UPDATE SET
-        email = EXCLUDED.email,
-        first_name = EXCLUDED.first_name,
-        last_name = EXCLUDED.last_name,
-        orders_count = EXCLUDED.orders_count,
-        total_spent = EXCLUDED.total_spent,
-        state = EXCLUDED.state,
-        created_at = EXCLUDED.created_at,
-        last_synced_at = NOW();
-    """
-
-    print("Inserting/updating customers in the database...")
-    count = 0
+    print("Staging customers...")
     try:
+        _, failed = stage_rows(conn, 'customers', CUSTOMER_COLUMNS,
+                               (customer_row(customer) for customer in customers))
+
+        print("Merging customers into the database...")
         with conn.cursor() as cur:
-            for customer in customers:
-                cur.execute(insert_query, (
-                    customer['id'],
-                    customer.get('email'),
-                    customer.get('first_name'),
-                    customer.get('last_name'),
-                    customer.get('orders_count', 0),
-                    customer.get('total_spent', '0.00'),
-                    customer.get('state', 'enabled'),
-                    customer.get('created_at')
-                ))
-                count += 1
+            # orders_count and total_spent are Shopify's figures on insert only;
+            # after that recompute_customer_aggregates is their one writer
+            count = merge_staged(cur, 'customers', CUSTOMER_COLUMNS, extra_updates={"deleted_at": "NULL"},
+                                 insert_only=('orders_count', 'total_spent'))
+            publish_data_version(cur, 'customers', count)
             conn.commit()
             print(f"Successfully inserted/updated {count} customers.")
+            if failed:
+                print(f"{failed} rows could not be loaded and were moved to etl_dead_letters.")
     except (Exception, psycopg2.DatabaseError) as error:
         print(f"Error during database operation: {error}")
         conn.rollback()
@@ -217,86 +474,375 @@ def insert_customers_into_db(customers):
         if conn is not None:
             conn.close()
 
-def insert_orders_into_db(orders):
+def line_item_rows(orders, catalog=None):
+    """
+    Flattens the line items of each order into rows for the 'order_line_items'
+    table, enriched with vendor and product_type from the product catalog.
+    """
+    rows = []
+    for order in orders:
+        for item in order.line_items:
+            if catalog is not None:
+                vendor, product_type = catalog.enrich_line_item(item)
+            else:
+                vendor, product_type = item.vendor, None
+            rows.append((
+                item.id,
+                order.id,
+                item.product_id,
+                item.variant_id,
+                item.title,
+                item.sku,
+                vendor,
+                product_type,
+                item.quantity,
+                item.price
+            ))
+    return rows
+
+def load_product_catalog():
+    """
+    Creates a ProductCatalog preloaded from the 'products' table.
+    Returns an empty catalog if the database is unreachable.
+    """
+    catalog = ProductCatalog()
+    conn = get_db_connection()
+    if not conn:
+        return catalog
+
+    try:
+        loaded = catalog.preload(conn)
+        print(f"Preloaded {loaded} products into the product catalog.")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(f"Error preloading product catalog: {error}")
+        conn.rollback()
+    finally:
+        conn.close()
+    return catalog
+
+def insert_orders_into_db(orders, catalog=None, on_missing_customer=None):
     """
-    Inserts a list of order records into the 'orders' table.
+    Inserts a list of Order records into the 'orders' table, along with
+    their line items enriched from the product catalog. Rows that fail to
+    merge are isolated and dead-lettered rather than failing the load, and
+    orders whose customer is not in the database are handled according to
+    on_missing_customer (default ON_MISSING_CUSTOMER).
+    Returns the UTC days of the orders that were inserted or changed.
     """
     if not orders:
         print("No orders to insert.")
-        return
+        return set()
 
     conn = get_db_connection()
     if not conn:
-        return
+        return set()
+
+    changed_days = set()
+    print("Staging orders...")
+    try:
+        _, failed = stage_rows(conn, 'orders', ORDER_COLUMNS, (order_row(order) for order in orders))
+        _, failed_items = stage_rows(conn, 'order_line_items', LINE_ITEM_COLUMNS, line_item_rows(orders, catalog))
+        failed += failed_items
+
+        print("Merging orders into the database...")
+        with conn.cursor() as cur:
+            mode = on_missing_customer or ON_MISSING_CUSTOMER
+            missing = resolve_missing_parents(cur, 'orders', 'customer_id', 'customers', mode, CUSTOMER_STUB_VALUES)
+            if missing:
+                print(f"Orders with a missing customer: {missing} handled ({mode}).")
+                if mode == "dead_letter":
+                    failed += missing
+            count, failed_orders = merge_staged_isolated(cur, 'orders', ORDER_COLUMNS)
+            failed += failed_orders
+            # Before the line items are narrowed to those whose order merged,
+            # so a dead-lettered line item keeps its current row
+            delete_unstaged_children(cur, 'order_line_items', 'orders', 'order_id')
+            failed += resolve_missing_parents(cur, 'order_line_items', 'order_id', 'orders')
+            line_item_count, failed_items = merge_staged_isolated(cur, 'order_line_items', LINE_ITEM_COLUMNS)
+            failed += failed_items
+            changed_days = changed_order_days(cur)
+            publish_data_version(cur, 'orders', count)
+            conn.commit()
+            print(f"Successfully inserted/updated {count} orders ({line_item_count} line items).")
+            if failed:
+                print(f"{failed} rows could not be loaded and were moved to etl_dead_letters.")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(f"Error during database operation: {error}")
+        conn.rollback()
+        changed_days = set()
+    finally:
+        if conn is not None:
+            conn.close()
+    return changed_days
+
+def changed_order_days(cur):
+    """
+    Returns the UTC days of the staged orders this transaction inserted or
+    changed, i.e. whose last_synced_at is the transaction's NOW().
+    """
+    cur.execute("""
+    SELECT DISTINCT (o.created_at AT TIME ZONE 'UTC')::date
+    FROM orders o
+    WHERE o.id IN (SELECT id FROM orders_staging)
+      AND o.last_synced_at = NOW() AND o.created_at IS NOT NULL;
+    """)
+    return {row[0] for row in cur.fetchall()}
+
+def recompute_customer_aggregates(customer_ids):
+    """
+    Recomputes 'orders_count' and 'total_spent' for the given customers from
+    the 'orders' table in one set-based statement, instead of trusting the
+    values Shopify reported. Cancelled and voided orders are not counted.
+    This relies on 'orders' holding every order of the customer, which needs
+    the read_all_orders scope (see SHOPIFY_PARAMS). Returns the number of
+    customers whose stored values had drifted, or None on failure.
+    """
+    if not customer_ids:
+        print("No customers to recompute.")
+        return 0
 
-    insert_query = """
-    INSERT INTO orders (id, customer_id, total_price, financial_status, fulfillment_status, number_of_items, created_at)
-    VALUES (%s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (id) DO UPDATE SET
-        customer_id = EXCLUDED.customer_id,
-        total_price = EXCLUDED.total_price,
-        financial_status = EXCLUDED.financial_status,
-        fulfillment_status = EXCLUDED.fulfillment_status,
-        number_of_items = EXCLUDED.number_of_items,
-        created_at = EXCLUDED.created_at,
-        last_synced_at = NOW();
-    """
-
-    print("Inserting/updating orders in the database...")
-    count = 0
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    recompute_query = """
+    WITH totals AS (
+        SELECT c.id,
+               COUNT(o.id) AS orders_count,
+               COALESCE(SUM(o.total_price), 0) AS total_spent
+        FROM unnest(%s::bigint[]) AS c(id)
+        LEFT JOIN orders o ON o.customer_id = c.id
+            AND o.cancelled_at IS NULL
+            AND o.financial_status IS DISTINCT FROM 'voided'
+        GROUP BY c.id
+    ),
+    updated AS (
+        UPDATE customers
+        SET orders_count = totals.orders_count,
+            total_spent = totals.total_spent,
+            last_synced_at = NOW()
+        FROM totals
+        WHERE customers.id = totals.id
+          AND (customers.orders_count IS DISTINCT FROM totals.orders_count
+               OR customers.total_spent IS DISTINCT FROM totals.total_spent)
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM updated;
+    """
+
+    print("Recomputing customer aggregates from orders...")
     try:
         with conn.cursor() as cur:
-            for order in orders:
-                # Count line items
-                line_items = order.get('line_items', [])
-                number_of_items = sum(item.get('quantity', 0) for item in line_items)
-                
-                cur.execute(insert_query, (
-                    order['id'],
-                    order.get('customer', {}).get('id') if order.get('customer') else None,
-                    order.get('total_price', '0.00'),
-                    order.get('financial_status'),
-                    order.get('fulfillment_status'),
-                    number_of_items,
-                    order.get('created_at')
-                ))
-                count += 1
+            cur.execute(recompute_query, (sorted(customer_ids),))
+            drifted = cur.fetchone()[0]
+            if drifted:
+                publish_data_version(cur, 'customer_aggregates', drifted)
             conn.commit()
-            print(f"Successfully inserted/updated {count} orders.")
+            print(f"Recomputed aggregates for {len(customer_ids)} customers ({drifted} had drifted).")
+            return drifted
     except (Exception, psycopg2.DatabaseError) as error:
         print(f"Error during database operation: {error}")
         conn.rollback()
+        return None
     finally:
         if conn is not None:
             conn.close()
 
+def refresh_order_sketches(days):
+    """
+    Rebuilds the per-day sketches in 'order_day_sketches' for the given UTC
+    days from the 'orders' table. Sketches can be merged but not subtracted
+    from, so a touched day is rebuilt from all of its orders rather than
+    patched with the ones just loaded. Returns the number of days rebuilt,
+    or None on failure.
+    """
+    if not days:
+        print("No order days to refresh.")
+        return 0
+
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    print(f"Rebuilding order sketches for {len(days)} days...")
+    try:
+        with conn.cursor(name='order_sketch_source') as source:
+            source.itersize = 10000
+            source.execute("""
+            SELECT (created_at AT TIME ZONE 'UTC')::date, customer_id, total_price
+            FROM orders
+            WHERE (created_at AT TIME ZONE 'UTC')::date = ANY(%s)
+              AND cancelled_at IS NULL;
+            """, (sorted(days),))
+            sketches = build_day_sketches(source)
+
+        with conn.cursor() as cur:
+            for day, (order_count, customers, order_values) in sketches.items():
+                cur.execute("""
+                INSERT INTO order_day_sketches (day, order_count, customers_hll, order_value_kll)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (day) DO UPDATE SET
+                    order_count = EXCLUDED.order_count,
+                    customers_hll = EXCLUDED.customers_hll,
+                    order_value_kll = EXCLUDED.order_value_kll,
+                    updated_at = NOW();
+                """, (day, order_count, psycopg2.Binary(customers.to_bytes()),
+                      psycopg2.Binary(order_values.to_bytes())))
+            # Days whose orders have all gone no longer have a sketch
+            empty_days = sorted(set(days) - set(sketches))
+            if empty_days:
+                cur.execute("DELETE FROM order_day_sketches WHERE day = ANY(%s);", (empty_days,))
+            publish_data_version(cur, 'order_sketches', len(days))
+        conn.commit()
+        print(f"Rebuilt sketches for {len(sketches)} days.")
+        return len(days)
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(f"Error during database operation: {error}")
+        conn.rollback()
+        return None
+    finally:
+        if conn is not None:
+            conn.close()
+
+def run_locked(entity, sync, mode="exit", wait_timeout=1800):
+    """
+    Runs sync() - the fetch and load of one entity - under the entity's
+    advisory lock (see sync_lock.py), and again for as long as other runs
+    hand their sync off to this one. Returns what the last sync() returned,
+    or None if another run already had the lock.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    lock = SyncLock(conn, SHOPIFY_STORE_URL, entity)
+    result = None
+    try:
+        if not lock.acquire(mode, wait_timeout):
+            return None
+        while True:
+            started_at = lock.start_run()
+            try:
+                result = sync()
+            except Exception:
+                lock.end_run(failed=True)
+                raise
+            lock.end_run()
+            if lock.claim_handoffs(started_at):
+                print(f"Another run handed off {entity} while this one was syncing; syncing {entity} again...")
+                continue
+            # A hand-off can arrive between the claim and the unlock; the run
+            # that requested it has gone, so pick it up here.
+            lock.release()
+            if not lock.has_pending_handoffs() or not lock.try_acquire():
+                break
+        return result
+    finally:
+        lock.release()
+        conn.close()
+
+def backfill_derived_data():
+    """
+    Rebuilds the data derived from orders over their whole history - the
+    customer aggregates and the per-day order sketches - rather than only
+    for what the last sync touched, e.g. after restoring a backup.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM customers;")
+            customer_ids = {row[0] for row in cur.fetchall()}
+            cur.execute("""
+            SELECT DISTINCT (created_at AT TIME ZONE 'UTC')::date FROM orders WHERE created_at IS NOT NULL
+            UNION
+            SELECT day FROM order_day_sketches;
+            """)
+            days = {row[0] for row in cur.fetchall()}
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(f"Error during database operation: {error}")
+        return
+    finally:
+        conn.close()
+
+    print(f"\nBackfilling aggregates for {len(customer_ids)} customers...")
+    recompute_customer_aggregates(customer_ids)
+    print(f"\nBackfilling order sketches for {len(days)} days...")
+    refresh_order_sketches(days)
+
 # --- Main Execution ---
 
-if __name__ == "__main__":
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync products, customers and orders from Shopify.")
+    parser.add_argument("--if-running", choices=LOCK_MODES, default="exit",
+                        help="what to do when another run is syncing the same entity (default: %(default)s)")
+    parser.add_argument("--on-missing-customer", choices=MISSING_PARENT_MODES, default=ON_MISSING_CUSTOMER,
+                        help="orders whose customer is not in the database: dead-letter them, create stub "
+                             "customers, or load them without a customer (default: %(default)s)")
+    parser.add_argument("--wait-timeout", type=int, default=1800,
+                        help="seconds to wait for the other run with --if-running wait (default: %(default)s)")
+    args = parser.parse_args(argv)
+
     print("=" * 60)
     print("STARTING COMPREHENSIVE SHOPIFY DATA SYNC")
     print("=" * 60)
-    
+
+    catalog = load_product_catalog()
+
+    def sync_products():
+        products = get_shopify_products()
+        if products:
+            insert_products_into_db(products, catalog)
+        return products
+
+    def sync_customers():
+        customers = get_shopify_customers()
+        if customers:
+            insert_customers_into_db(customers)
+        return customers
+
+    def sync_orders():
+        orders = get_shopify_orders()
+        changed_days = set()
+        if orders:
+            changed_days = insert_orders_into_db(orders, catalog, args.on_missing_customer)
+            stats = catalog.stats()
+            print(f"Product catalog: {stats['hits']} hits, {stats['misses']} misses "
+                  f"({stats['hit_rate']:.1%} hit rate), {stats['size']} cached.")
+        return orders, changed_days
+
     # Sync products
     print("\n1. SYNCING PRODUCTS...")
-    shopify_products = get_shopify_products()
-    if shopify_products:
-        insert_products_into_db(shopify_products)
+    run_locked('products', sync_products, args.if_running, args.wait_timeout)
     
     # Sync customers
     print("\n2. SYNCING CUSTOMERS...")
-    shopify_customers = get_shopify_customers()
-    if shopify_customers:
-        insert_customers_into_db(shopify_customers)
+    shopify_customers = run_locked('customers', sync_customers, args.if_running, args.wait_timeout)
     
     # Sync orders
     print("\n3. SYNCING ORDERS...")
-    shopify_orders = get_shopify_orders()
-    if shopify_orders:
-        insert_orders_into_db(shopify_orders)
+    shopify_orders, changed_days = run_locked('orders', sync_orders, args.if_running,
+                                              args.wait_timeout) or (None, set())
+
+    # Recompute customer aggregates for every customer touched by this run
+    print("\n4. RECOMPUTING CUSTOMER AGGREGATES...")
+    touched_customer_ids = {customer.id for customer in shopify_customers or []}
+    touched_customer_ids.update(
+        order.customer_id for order in shopify_orders or [] if order.customer_id is not None
+    )
+    recompute_customer_aggregates(touched_customer_ids)
+
+    # Rebuild the analytics sketches of every day with an order this run inserted or changed
+    print("\n5. REFRESHING ORDER SKETCHES...")
+    refresh_order_sketches(changed_days)
     
     print("\n" + "=" * 60)
     print("SYNC COMPLETED SUCCESSFULLY!")
     print("=" * 60)
     print("\nYour database is now up-to-date with your Shopify store.")
-    print("Both your local frontend and Vercel deployment will show the latest data.")
\ No newline at end of file
+    print("Both your local frontend and Vercel deployment will show the latest data.")
+
+if __name__ == "__main__":
+    main()
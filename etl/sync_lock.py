@@ -0,0 +1,181 @@
+"""
+Advisory-lock guarded sync runs.
+
+Every sync of an entity holds a session-level Postgres advisory lock keyed on
+(shop, entity) for as long as it fetches and loads, and records itself in
+'sync_runs'. A second run that finds the lock taken does not redo the work;
+depending on its mode it:
+
+    exit      records a 'skipped' run and moves on
+    wait      waits for the lock, then skips the entity if a run that started
+              after it began waiting has completed in the meantime
+    handoff   records a 'handoff_requested' run and moves on; the holder sees
+              it when it finishes and syncs the entity once more
+
+The lock lives on its own autocommit connection, which must be a session
+connection (direct, or a session-mode pooler) for the lock to be held.
+If the process dies the lock is released with the connection, and the
+next holder marks the run rows it left behind as 'abandoned'.
+"""
+import time
+
+LOCK_MODES = ("exit", "wait", "handoff")
+WAIT_POLL_SECONDS = 5
+
+# Entity -> id of the 'sync_runs' row of the run in this process holding its
+# lock. publish_data_version completes that row instead of adding a new one.
+active_runs = {}
+
+class SyncLock:
+    """
+    The advisory lock and 'sync_runs' bookkeeping of one (shop, entity).
+    """
+
+    def __init__(self, conn, shop, entity):
+        self.conn = conn
+        self.conn.autocommit = True
+        self.shop = shop
+        self.entity = entity
+        self.run_id = None
+        self.held = False
+
+    def _execute(self, query, params=()):
+        with self.conn.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchall() if cur.description else None
+
+    def _now(self):
+        return self._execute("SELECT clock_timestamp();")[0][0]
+
+    def _record(self, status):
+        """
+        Records a run that did not take the lock and returns its id.
+        """
+        return self._execute("""
+            INSERT INTO sync_runs (shop, entity, status, backend_pid, finished_at)
+            VALUES (%s, %s, %s, pg_backend_pid(), CASE WHEN %s = 'skipped' THEN NOW() END)
+            RETURNING id;
+        """, (self.shop, self.entity, status, status))[0][0]
+
+    def holder(self):
+        """
+        Returns (id, started_at, backend_pid) of the latest running run, or None.
+        """
+        rows = self._execute("""
+            SELECT id, started_at, backend_pid FROM sync_runs
+            WHERE shop = %s AND entity = %s AND status = 'running'
+            ORDER BY id DESC LIMIT 1;
+        """, (self.shop, self.entity))
+        return rows[0] if rows else None
+
+    def try_acquire(self):
+        self.held = self._execute(
+            "SELECT pg_try_advisory_lock(hashtext(%s), hashtext(%s));", (self.shop or "", self.entity)
+        )[0][0]
+        return self.held
+
+    def acquire(self, mode="exit", wait_timeout=1800):
+        """
+        Takes the lock, or handles a run already holding it according to
+        `mode`. Returns True if this run should go ahead with the sync.
+        """
+        if mode not in LOCK_MODES:
+            raise ValueError(f"Unknown lock mode {mode!r}; expected one of {', '.join(LOCK_MODES)}")
+        if self.try_acquire():
+            return True
+
+        holder = self.holder()
+        described = f"run #{holder[0]} (pid {holder[2]}, started {holder[1]:%Y-%m-%d %H:%M:%S})" if holder else "another run"
+        if mode == "exit":
+            self._record("skipped")
+            print(f"Skipping {self.entity}: {described} is already syncing it.")
+            return False
+
+        if mode == "handoff":
+            request_id = self._record("handoff_requested")
+            # The holder may have finished between the two checks; if so
+            # nobody is left to serve the request, so run it here.
+            if self.try_acquire():
+                self._execute("UPDATE sync_runs SET status = 'handoff_served', finished_at = NOW() WHERE id = %s;",
+                              (request_id,))
+                return True
+            print(f"Handed {self.entity} off to {described}; it will sync again when it finishes.")
+            return False
+
+        print(f"Waiting up to {wait_timeout}s for {described} to finish syncing {self.entity}...")
+        waiting_since = self._now()
+        deadline = time.monotonic() + wait_timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                self._record("skipped")
+                print(f"Gave up waiting for the {self.entity} lock.")
+                return False
+            time.sleep(WAIT_POLL_SECONDS)
+
+        fresh = self._execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM sync_runs
+                WHERE shop = %s AND entity = %s AND status = 'completed' AND started_at >= %s
+            );
+        """, (self.shop, self.entity, waiting_since))[0][0]
+        if fresh:
+            self.release()
+            self._record("skipped")
+            print(f"Skipping {self.entity}: a run that started while waiting has already synced it.")
+            return False
+        return True
+
+    def start_run(self):
+        """
+        Records a new running run under the held lock and returns its start time.
+        """
+        # Holding the lock means no other run is live, so any 'running' rows
+        # were left behind by a run that died.
+        self._execute("""
+            UPDATE sync_runs SET status = 'abandoned', finished_at = NOW()
+            WHERE shop = %s AND entity = %s AND status = 'running';
+        """, (self.shop, self.entity))
+        self.run_id, started_at = self._execute("""
+            INSERT INTO sync_runs (shop, entity, status, backend_pid)
+            VALUES (%s, %s, 'running', pg_backend_pid())
+            RETURNING id, started_at;
+        """, (self.shop, self.entity))[0]
+        active_runs[self.entity] = self.run_id
+        return started_at
+
+    def end_run(self, failed=False):
+        """
+        Closes the current run if the load did not already complete it via
+        publish_data_version: as 'failed' after an exception, otherwise as
+        'unpublished' (nothing was loaded, or the loader reported an error).
+        """
+        active_runs.pop(self.entity, None)
+        self._execute("""
+            UPDATE sync_runs SET status = %s, finished_at = NOW()
+            WHERE id = %s AND status = 'running';
+        """, ("failed" if failed else "unpublished", self.run_id))
+
+    def claim_handoffs(self, started_at):
+        """
+        Marks pending hand-off requests as served. Returns True if one arrived
+        after `started_at`, i.e. after the run that just finished had already
+        begun, so the entity needs syncing again.
+        """
+        rows = self._execute("""
+            UPDATE sync_runs SET status = 'handoff_served', finished_at = NOW()
+            WHERE shop = %s AND entity = %s AND status = 'handoff_requested'
+            RETURNING started_at;
+        """, (self.shop, self.entity))
+        return any(requested_at >= started_at for (requested_at,) in rows)
+
+    def has_pending_handoffs(self):
+        return self._execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM sync_runs WHERE shop = %s AND entity = %s AND status = 'handoff_requested'
+            );
+        """, (self.shop, self.entity))[0][0]
+
+    def release(self):
+        if self.held:
+            self._execute("SELECT pg_advisory_unlock(hashtext(%s), hashtext(%s));", (self.shop or "", self.entity))
+            self.held = False
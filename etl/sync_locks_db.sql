@@ -0,0 +1,10 @@
+-- sync_locks_db.sql
+-- Lets sync runs guarded by advisory locks (see sync_lock.py) record which
+-- backend holds the lock, and find the running and pending hand-off runs
+-- of an entity quickly. Statuses used: 'running', 'completed', 'failed',
+-- 'unpublished', 'abandoned', 'skipped', 'handoff_requested',
+-- 'handoff_served'. Safe to run more than once.
+
+ALTER TABLE sync_runs ADD COLUMN IF NOT EXISTS backend_pid INT;
+
+CREATE INDEX IF NOT EXISTS sync_runs_shop_entity_status_idx ON sync_runs (shop, entity, status);
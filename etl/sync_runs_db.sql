@@ -0,0 +1,21 @@
+-- sync_runs_db.sql
+-- Records every committed ETL load and the data version it published.
+-- The API caches query results keyed on MAX(data_version) and recomputes
+-- them only after a new load lands. Safe to run more than once.
+
+CREATE SEQUENCE IF NOT EXISTS sync_data_version_seq;
+
+CREATE TABLE IF NOT EXISTS sync_runs (
+    id BIGSERIAL PRIMARY KEY,
+    shop VARCHAR(255),
+    entity VARCHAR(100) NOT NULL, -- e.g., 'products', 'customers', 'orders'
+    status VARCHAR(50) NOT NULL DEFAULT 'running', -- 'running', 'completed', 'failed'
+    row_count INT,
+    data_version BIGINT, -- Set from sync_data_version_seq when the load commits
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE sync_runs IS 'Stores one row per ETL load and the data version it published.';
+
+CREATE INDEX IF NOT EXISTS sync_runs_data_version_idx ON sync_runs (data_version);
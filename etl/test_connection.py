@@ -1,8 +1,20 @@
+import argparse
+import math
 import os
 import socket
+import ssl
+import statistics
+import struct
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
 import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
+from staging import copy_rows
+
 # Load environment variables
 load_dotenv()
 
@@ -12,6 +24,17 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
+# Probe settings
+SSL_REQUEST_CODE = 80877103  # Postgres SSLRequest message
+PROBE_SAMPLES = 20
+PROBE_ROWS = 20000
+SINGLE_ROW_INSERTS = 500
+EXECUTE_VALUES_PAGE_SIZES = (100, 500, 1000, 5000)
+COPY_BATCH_SIZES = (1000, 10000, 50000)
+# A batch size counts as good enough within this share of the best throughput
+BATCH_TOLERANCE = 0.1
+MAX_POOL_SIZE = 16
+
 def test_dns_resolution():
     """Test if we can resolve the hostname"""
     print(f"Testing DNS resolution for {DB_HOST}...")
@@ -98,7 +121,236 @@ def test_database_connection():
         print(f"Database connection failed: {e}")
         return False
 
-if __name__ == "__main__":
+# --- Performance Probe ---
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def summarize_ms(seconds):
+    values = sorted(seconds)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return f"median {statistics.median(values) * 1000:.2f} ms, p95 {p95 * 1000:.2f} ms"
+
+def resolve_addresses(family):
+    try:
+        return sorted({info[4] for info in socket.getaddrinfo(DB_HOST, DB_PORT, family, socket.SOCK_STREAM)})
+    except socket.gaierror:
+        return []
+
+def tcp_connect_time(family, address):
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(10)
+    try:
+        seconds, _ = timed(sock.connect, address)
+        return seconds
+    finally:
+        sock.close()
+
+def probe_paths(samples):
+    """
+    Measures TCP connect latency to every IPv4 and IPv6 address of DB_HOST.
+    Returns {family name: median seconds} for the families that connect.
+    """
+    print(f"\n-- IPv4/IPv6 path latency ({samples} TCP connects per address) --")
+    medians = {}
+    for family, name in ((socket.AF_INET, "IPv4"), (socket.AF_INET6, "IPv6")):
+        addresses = resolve_addresses(family)
+        if not addresses:
+            print(f"  {name}: no address")
+            continue
+        for address in addresses:
+            try:
+                times = [tcp_connect_time(family, address) for _ in range(samples)]
+            except OSError as e:
+                print(f"  {name} {address[0]}: unreachable ({e})")
+                continue
+            print(f"  {name} {address[0]}: {summarize_ms(times)}")
+            medians[name] = min(medians.get(name, math.inf), statistics.median(times))
+    if len(medians) == 2:
+        faster = min(medians, key=medians.get)
+        print(f"  {faster} is faster by {abs(medians['IPv4'] - medians['IPv6']) * 1000:.2f} ms")
+    return medians
+
+def tls_handshake_time(family, address):
+    """
+    Sends the Postgres SSLRequest and times the TLS handshake that follows.
+    Returns (seconds, TLS version), or None if the server does not offer TLS.
+    """
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(10)
+    try:
+        sock.connect(address)
+        sock.sendall(struct.pack("!ii", 8, SSL_REQUEST_CODE))
+        if sock.recv(1) != b"S":
+            return None
+        # Only the handshake cost is measured, so the certificate is not verified
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        seconds, tls_sock = timed(lambda: context.wrap_socket(sock, server_hostname=DB_HOST))
+        version = tls_sock.version()
+        tls_sock.close()
+        return seconds, version
+    finally:
+        sock.close()
+
+def probe_tls(samples):
+    print(f"\n-- TLS handshake ({samples} handshakes) --")
+    for family in (socket.AF_INET, socket.AF_INET6):
+        for address in resolve_addresses(family):
+            try:
+                results = [tls_handshake_time(family, address) for _ in range(samples)]
+            except OSError:
+                continue
+            if results[0] is None:
+                print("  Server does not offer TLS (typical for a local Postgres)")
+            else:
+                print(f"  {results[0][1]} via {address[0]}: {summarize_ms([seconds for seconds, _ in results])}")
+            return
+
+def probe_rows(count):
+    created_at = datetime.now(timezone.utc)
+    return [(i, f"Probe row {i}", Decimal("19.99"), created_at) for i in range(count)]
+
+def probe_database(connection_params, samples, row_count):
+    """
+    Times connects, query round trips and the three insert paths on a temp
+    table. Returns the measurements the recommendations are based on.
+    """
+    print("\n-- Connection setup (TCP + TLS + auth) --")
+    connect_times = []
+    for _ in range(min(samples, 5)):
+        seconds, conn = timed(psycopg2.connect, **connection_params)
+        connect_times.append(seconds)
+        conn.close()
+    print(f"  {summarize_ms(connect_times)}")
+
+    conn = psycopg2.connect(**connection_params)
+    try:
+        with conn.cursor() as cur:
+            print(f"\n-- Query round trip ({samples} x SELECT 1) --")
+            rtts = []
+            for _ in range(samples):
+                seconds, _ = timed(cur.execute, "SELECT 1;")
+                cur.fetchone()
+                rtts.append(seconds)
+            rtt = statistics.median(rtts)
+            print(f"  {summarize_ms(rtts)}")
+
+            cur.execute("""
+                CREATE TEMP TABLE connection_probe (
+                    id BIGINT PRIMARY KEY, title TEXT, price NUMERIC(10, 2), created_at TIMESTAMP WITH TIME ZONE
+                ) ON COMMIT DROP;
+            """)
+            rows = probe_rows(row_count)
+            insert_query = "INSERT INTO connection_probe (id, title, price, created_at) VALUES "
+
+            print("\n-- Insert throughput into a temp table --")
+            single_rows = rows[:SINGLE_ROW_INSERTS]
+            start = time.perf_counter()
+            for row in single_rows:
+                cur.execute(insert_query + "(%s, %s, %s, %s);", row)
+            single_rate = len(single_rows) / (time.perf_counter() - start)
+            print(f"  {'single-row INSERT':<28}{single_rate:>12,.0f} rows/s")
+
+            values_rates = {}
+            for page_size in EXECUTE_VALUES_PAGE_SIZES:
+                cur.execute("TRUNCATE connection_probe;")
+                seconds, _ = timed(execute_values, cur, insert_query + "%s", rows, page_size=page_size)
+                values_rates[page_size] = len(rows) / seconds
+                print(f"  {f'execute_values page={page_size}':<28}{values_rates[page_size]:>12,.0f} rows/s")
+
+            copy_rates = {}
+            for batch_size in COPY_BATCH_SIZES:
+                cur.execute("TRUNCATE connection_probe;")
+                seconds, _ = timed(copy_rows, cur, "connection_probe", ("id", "title", "price", "created_at"),
+                                   rows, batch_size)
+                copy_rates[batch_size] = len(rows) / seconds
+                print(f"  {f'COPY batch={batch_size}':<28}{copy_rates[batch_size]:>12,.0f} rows/s")
+
+            cur.execute("SELECT current_setting('max_connections')::int, COUNT(*) FROM pg_stat_activity;")
+            max_connections, in_use = cur.fetchone()
+        conn.rollback()
+    finally:
+        conn.close()
+
+    return {
+        "rtt": rtt,
+        "single_rate": single_rate,
+        "values_rates": values_rates,
+        "copy_rates": copy_rates,
+        "max_connections": max_connections,
+        "in_use": in_use,
+    }
+
+def smallest_good_batch(rates):
+    best = max(rates.values())
+    return min(size for size, rate in rates.items() if rate >= best * (1 - BATCH_TOLERANCE))
+
+def recommend(results):
+    """
+    Prints batch and pool sizes for the loaders. The batch size is the
+    smallest one within BATCH_TOLERANCE of the best measured throughput. The
+    pool size is how many connections it takes to keep the server busy
+    (again within BATCH_TOLERANCE) while each one waits a round trip between
+    batches, capped at a quarter of the free connection slots.
+    """
+    copy_batch = smallest_good_batch(results["copy_rates"])
+    page_size = smallest_good_batch(results["values_rates"])
+    best_copy = results["copy_rates"][copy_batch]
+
+    batch_seconds = copy_batch / best_copy
+    server_seconds = max(batch_seconds - results["rtt"], batch_seconds * 0.1)
+    pool_size = math.ceil(batch_seconds / server_seconds - BATCH_TOLERANCE)
+    headroom = (results["max_connections"] - results["in_use"]) // 4
+    pool_size = max(1, min(pool_size, headroom, MAX_POOL_SIZE))
+
+    print("\n-- Recommendations --")
+    print(f"  COPY is {best_copy / results['single_rate']:.0f}x single-row INSERT and "
+          f"{best_copy / max(results['values_rates'].values()):.1f}x execute_values on this link")
+    print(f"  COPY batch size (staging.COPY_BATCH_SIZE): {copy_batch}")
+    print(f"  execute_values page_size: {page_size}")
+    print(f"  Pool size: {pool_size} (RTT {results['rtt'] * 1000:.2f} ms, "
+          f"{results['max_connections'] - results['in_use']} free connection slots)")
+
+def run_probe(sslmode, samples, row_count):
+    print("=== Database Link Performance Probe ===")
+    print(f"Target: {DB_HOST}:{DB_PORT}/{DB_NAME} (sslmode={sslmode})")
+    probe_paths(samples)
+    if sslmode != "disable":
+        probe_tls(samples)
+    connection_params = {
+        'host': DB_HOST,
+        'port': DB_PORT,
+        'database': DB_NAME,
+        'user': DB_USER,
+        'password': DB_PASSWORD,
+        'sslmode': sslmode,
+        'connect_timeout': 30
+    }
+    try:
+        results = probe_database(connection_params, samples, row_count)
+    except psycopg2.Error as e:
+        print(f"Database probe failed: {e}")
+        return False
+    recommend(results)
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test the database connection, or probe its performance.")
+    parser.add_argument("--probe", action="store_true",
+                        help="measure TLS, round trip, insert throughput and path latency, and recommend batch/pool sizes")
+    parser.add_argument("--sslmode", default="prefer",
+                        help="sslmode for --probe; 'prefer' also works against a local Postgres (default: %(default)s)")
+    parser.add_argument("--samples", type=int, default=PROBE_SAMPLES, help="samples per latency measurement (default: %(default)s)")
+    parser.add_argument("--rows", type=int, default=PROBE_ROWS, help="rows per throughput measurement (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        raise SystemExit(0 if run_probe(args.sslmode, args.samples, args.rows) else 1)
+
     print("=== Supabase Connection Test ===\n")
     
     dns_ok = test_dns_resolution()
@@ -117,4 +369,7 @@ if __name__ == "__main__":
     print("2. Verify the hostname in your .env file")
     print("3. Check if the project is paused or deleted")
     print("4. Try using a different DNS server (like 8.8.8.8)")
-    print("5. Check your IPv6 internet connectivity")
\ No newline at end of file
+    print("5. Check your IPv6 internet connectivity")
+
+if __name__ == "__main__":
+    main()
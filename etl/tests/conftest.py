@@ -0,0 +1,105 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# The ETL scripts import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class RecordingCursor:
+    """
+    Stands in for a psycopg2 cursor: records every statement with its
+    parameters and answers fetches from a queue of result sets.
+    """
+
+    def __init__(self, results=None):
+        self.statements = []
+        self.results = list(results or [])
+        self.rowcount = 0
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def execute(self, sql, params=None):
+        self.statements.append((" ".join(sql.split()), params))
+
+    def copy_expert(self, sql, buffer):
+        self.statements.append((sql, buffer.getvalue()))
+
+    def fetchall(self):
+        return self.results.pop(0) if self.results else []
+
+    def fetchmany(self, size):
+        if not self.results:
+            return []
+        rows, self.results[0] = self.results[0][:size], self.results[0][size:]
+        if not rows:
+            self.results.pop(0)
+        return rows
+
+    def fetchone(self):
+        rows = self.fetchall()
+        return rows[0] if rows else None
+
+    def sql(self):
+        return [statement for statement, _ in self.statements]
+
+class RecordingConnection:
+    def __init__(self, results=None):
+        self.cur = RecordingCursor(results)
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    def cursor(self, name=None):
+        return self.cur
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def db():
+    return RecordingConnection()
+
+def shopify_response(status=200, headers=None, body=b'{}'):
+    import requests
+
+    response = requests.models.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = body
+    response.url = "https://shop.example/admin/api/orders.json"
+    return response
+
+@pytest.fixture
+def shopify(monkeypatch):
+    """
+    Serves queued responses (built with shopify.response) to requests.get
+    and records the requests made and the sleeps between them.
+    """
+    import sync_all_data
+
+    served = SimpleNamespace(responses=[], sleeps=[], calls=[], response=shopify_response)
+
+    def get(url, headers=None, params=None):
+        served.calls.append((url, params))
+        return served.responses.pop(0)
+
+    monkeypatch.setattr(sync_all_data.requests, "get", get)
+    monkeypatch.setattr(sync_all_data.time, "sleep", served.sleeps.append)
+    return served
@@ -0,0 +1,34 @@
+"""
+Tests for the regression benchmark of bench_etl.py.
+"""
+import bench_etl
+
+
+BASELINE = {"orders": {"records_per_sec": 20000.0, "reference_per_sec": 25000.0, "relative": 0.8,
+                       "peak_bytes": 8 * 2**20}}
+
+def _result(relative, peak_bytes=8 * 2**20, records_per_sec=1000.0):
+    return {"orders": {"records_per_sec": records_per_sec, "reference_per_sec": records_per_sec / relative,
+                       "relative": relative, "peak_bytes": peak_bytes}}
+
+def test_compare_ignores_absolute_slowdown_of_the_machine():
+    # 20x slower in absolute terms, but so was the reference workload
+    assert bench_etl.compare(_result(0.78, records_per_sec=1000.0), BASELINE, 0.2) == []
+
+def test_compare_flags_relative_throughput_regression():
+    failures = bench_etl.compare(_result(0.6), BASELINE, 0.2)
+    assert len(failures) == 1 and "reference workload" in failures[0]
+
+def test_compare_flags_memory_growth():
+    failures = bench_etl.compare(_result(0.8, peak_bytes=10 * 2**20), BASELINE, 0.2)
+    assert len(failures) == 1 and "peak memory" in failures[0]
+
+def test_compare_falls_back_to_absolute_for_old_baselines():
+    old = {"orders": {"records_per_sec": 20000.0, "peak_bytes": 8 * 2**20}}
+    assert bench_etl.compare(_result(0.8, records_per_sec=17000.0), old, 0.2) == []
+    assert len(bench_etl.compare(_result(0.8, records_per_sec=15000.0), old, 0.2)) == 1
+
+def test_measure_reports_the_relative_throughput():
+    result = bench_etl.measure("customers", 250, repeat=3)
+    assert result["relative"] > 0
+    assert result["records_per_sec"] > 0 and result["peak_bytes"] > 0
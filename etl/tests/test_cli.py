@@ -0,0 +1,56 @@
+"""
+Tests for the lazy-loading entry point cli.py.
+"""
+import inspect
+import subprocess
+import sys
+
+import pytest
+
+import cli
+
+
+@pytest.fixture
+def configured(monkeypatch):
+    """
+    Runs subcommands without configuration checks, recording each call.
+    """
+    calls = []
+
+    def load_command(name):
+        return lambda *args: calls.append((name, *args))
+
+    monkeypatch.setattr(cli, "load_config", lambda settings: [])
+    monkeypatch.setattr(cli, "load_command", load_command)
+    return calls
+
+def test_importing_cli_loads_no_heavy_dependencies():
+    code = "import sys, cli; print(sorted({'requests', 'psycopg2', 'numpy', 'dotenv'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=cli.ETL_DIR, capture_output=True, text=True,
+                            check=True)
+    assert result.stdout.strip() == "[]"
+
+@pytest.mark.parametrize("name", cli.COMMANDS)
+def test_every_command_resolves_to_a_function_of_the_right_shape(name):
+    command = cli.load_command(name)
+    takes_argv = cli.COMMANDS[name][3] is not None
+    assert len(inspect.signature(command).parameters) >= (1 if takes_argv else 0)
+
+def test_arguments_are_passed_on_after_the_prefix(configured):
+    cli.main(["probe", "--samples", "3"])
+    cli.main(["summary"])
+    assert configured == [("probe", ["--probe", "--samples", "3"]), ("summary",)]
+
+def test_commands_without_arguments_refuse_them(configured):
+    with pytest.raises(SystemExit):
+        cli.main(["summary", "--verbose"])
+    assert configured == []
+
+def test_missing_settings_stop_the_command(monkeypatch, configured, capsys):
+    monkeypatch.setattr(cli, "load_config", lambda settings: ["DB_HOST"])
+    with pytest.raises(SystemExit):
+        cli.main(["sync"])
+    assert "sync needs DB_HOST" in capsys.readouterr().err
+    # --help needs no configuration
+    cli.main(["sync", "--help"])
+    assert configured == [("sync", ["--help"])]
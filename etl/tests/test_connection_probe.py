@@ -0,0 +1,38 @@
+"""
+Tests for the recommendations of the database link probe in test_connection.py.
+"""
+import re
+
+import test_connection as probe
+
+
+def _results(rtt, copy_rates, max_connections=100, in_use=20):
+    return {"rtt": rtt, "single_rate": 1000.0, "values_rates": {100: 20000.0, 500: 30000.0, 1000: 30500.0},
+            "copy_rates": copy_rates, "max_connections": max_connections, "in_use": in_use}
+
+def _recommendation(capsys, name):
+    return int(re.search(rf"{name}: (\d+)", capsys.readouterr().out).group(1))
+
+def test_smallest_good_batch_is_within_the_tolerance_of_the_best():
+    assert probe.smallest_good_batch({1000: 50000.0, 10000: 95000.0, 50000: 100000.0}) == 10000
+    assert probe.smallest_good_batch({1000: 50000.0, 10000: 80000.0, 50000: 100000.0}) == 50000
+
+def test_a_fast_link_needs_a_single_connection(capsys):
+    # 10000 rows at 100k rows/s take 100 ms; a 0.5 ms round trip is noise
+    probe.recommend(_results(0.0005, {1000: 50000.0, 10000: 100000.0, 50000: 100000.0}))
+    out = capsys.readouterr().out
+    assert "COPY batch size (staging.COPY_BATCH_SIZE): 10000" in out
+    assert "execute_values page_size: 500" in out
+    assert "Pool size: 1 " in out
+
+def test_a_slow_link_is_filled_with_more_connections(capsys):
+    # 1000 rows at 100k rows/s take 10 ms, of which 5 ms is the round trip
+    probe.recommend(_results(0.005, {1000: 100000.0, 10000: 100000.0}))
+    assert _recommendation(capsys, "Pool size") == 2
+
+def test_pool_size_is_capped_by_free_connection_slots(capsys):
+    probe.recommend(_results(0.5, {1000: 100000.0}, max_connections=30, in_use=22))
+    assert _recommendation(capsys, "Pool size") == 2
+
+def test_summarize_ms_reports_median_and_p95():
+    assert probe.summarize_ms([0.001 * i for i in range(1, 101)]) == "median 50.50 ms, p95 96.00 ms"
@@ -0,0 +1,62 @@
+"""
+Tests for the incremental Parquet export of export_parquet.py.
+"""
+import os
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+export_parquet = pytest.importorskip("export_parquet")
+
+
+def order_export_row(order_id, created_at, synced_at, cancelled_at=None, total="10.00"):
+    """
+    A row as the export query returns it for 'orders': the partition date,
+    then the schema's columns.
+    """
+    return (created_at.date(), order_id, 42, Decimal(total), "paid", None, 1,
+            created_at, cancelled_at, synced_at)
+
+def export_orders(db, export_dir, rows, run_id="run1"):
+    db.cur.results = [rows]
+    return export_parquet.export_table(db, "orders", str(export_dir), export_parquet.EPOCH, run_id)
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+def test_build_query_selects_the_schema_after_the_watermark():
+    sql = export_parquet.build_query(export_parquet.EXPORT_TABLES["products"])
+    assert "variants::text AS variants" in sql
+    assert "WHERE last_synced_at > %s" in sql
+    assert "(created_at AT TIME ZONE 'UTC')::date AS partition_date" in sql
+
+def test_orders_export_carries_cancelled_at():
+    assert "cancelled_at" in export_parquet.EXPORT_TABLES["orders"]["schema"].names
+
+def test_export_table_writes_one_part_per_partition(db, tmp_path):
+    rows = [
+        order_export_row(1, utc(2025, 6, 1, 9), utc(2025, 6, 2)),
+        order_export_row(2, utc(2025, 6, 1, 17), utc(2025, 6, 4), cancelled_at=utc(2025, 6, 3)),
+        order_export_row(3, utc(2025, 6, 2, 8), utc(2025, 6, 3)),
+    ]
+    assert export_orders(db, tmp_path, rows) == (3, utc(2025, 6, 4))
+
+    first_day = tmp_path / "orders" / "date=2025-06-01" / "part-run1.parquet"
+    assert sorted(os.listdir(tmp_path / "orders")) == ["date=2025-06-01", "date=2025-06-02"]
+    table = pq.read_table(first_day)
+    assert table.column("id").to_pylist() == [1, 2]
+    assert table.column("cancelled_at").to_pylist() == [None, utc(2025, 6, 3)]
+    assert table.column("total_price").to_pylist() == [Decimal("10.00"), Decimal("10.00")]
+
+def test_export_table_without_changes_keeps_the_watermark(db, tmp_path):
+    since = utc(2025, 6, 1)
+    db.cur.results = [[]]
+    assert export_parquet.export_table(db, "orders", str(tmp_path), since, "run1") == (0, since)
+    assert not (tmp_path / "orders").exists()
+
+def test_rows_without_a_partition_date_go_to_the_default_partition(db, tmp_path):
+    row = (None,) + order_export_row(1, utc(2025, 6, 1), utc(2025, 6, 2))[1:]
+    export_orders(db, tmp_path, [row])
+    assert os.listdir(tmp_path / "orders") == [f"date={export_parquet.NULL_PARTITION}"]
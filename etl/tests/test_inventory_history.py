@@ -0,0 +1,98 @@
+"""
+Tests for the delta-encoded inventory history: the snapshots a sync writes
+(sync_all_data.py) and the levels read back from them (inventory_history.py
+and the inventory_level_at() SQL function).
+
+The SQL-level tests need a Postgres to run against; point
+ETL_TEST_DATABASE_URL at one (e.g. postgresql://localhost/postgres) to run
+them. They work in a scratch schema inside a transaction that is rolled back.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import inventory_history
+import sync_all_data
+
+TEST_DATABASE_URL = os.getenv("ETL_TEST_DATABASE_URL")
+ETL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATION = os.path.join(ETL_DIR, "inventory_snapshots_db.sql")
+
+
+def test_only_changed_variants_get_a_snapshot(db):
+    db.cur.rowcount = 4
+    assert sync_all_data.record_inventory_changes(db.cur) == 4
+    (sql, params), = db.cur.statements
+    assert "FROM product_variants_staging staged" in sql
+    assert "WHERE latest.inventory_quantity IS DISTINCT FROM staged.inventory_quantity" in sql
+
+def test_removed_variants_get_a_closing_snapshot(db):
+    db.cur.rowcount = 2
+    assert sync_all_data.record_inventory_changes(db.cur, [1001, 1002]) == 4
+    sql, params = db.cur.statements[1]
+    assert "SELECT removed.id, NOW(), NULL" in sql and params == ([1001, 1002], [])
+
+def test_variants_of_removed_products_get_a_closing_snapshot(db):
+    sync_all_data.record_removed_variants(db.cur, product_ids=[101])
+    sql, params = db.cur.statements[0]
+    assert "SELECT id FROM product_variants WHERE product_id = ANY(%s)" in sql and params == ([], [101])
+
+def test_stock_levels_at_can_be_limited_to_variants(db):
+    at = datetime(2025, 7, 1, tzinfo=timezone.utc)
+    db.cur.results = [[(1001, 4, at)], [(1001, 4, at)]]
+    assert inventory_history.stock_levels_at(db.cur, at) == {1001: (4, at)}
+    assert inventory_history.stock_levels_at(db.cur, at, [1001]) == {1001: (4, at)}
+    (all_sql, all_params), (some_sql, some_params) = db.cur.statements
+    assert "variant_id = ANY" not in all_sql and all_params == (at,)
+    assert "AND variant_id = ANY(%s)" in some_sql and some_params == (at, [1001])
+
+def test_times_without_an_offset_are_utc():
+    assert inventory_history.parse_time("2025-07-01") == datetime(2025, 7, 1, tzinfo=timezone.utc)
+    assert inventory_history.parse_time("2025-07-01T02:00:00+02:00").utcoffset() == timedelta(hours=2)
+
+
+# --- Against Postgres ---
+
+T0 = datetime(2025, 7, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def pg():
+    if not TEST_DATABASE_URL:
+        pytest.skip("set ETL_TEST_DATABASE_URL to run the inventory SQL against Postgres")
+    psycopg2 = pytest.importorskip("psycopg2")
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("CREATE SCHEMA etl_inventory_test; SET LOCAL search_path TO etl_inventory_test;")
+            cur.execute("CREATE TABLE product_variants (id BIGINT PRIMARY KEY, sku TEXT);")
+            with open(MIGRATION) as f:
+                cur.execute(f.read())
+            cur.execute("INSERT INTO product_variants VALUES (1001, 'MUG-R');")
+            # Variant 1001: 5, sold out on day 2, -1 on day 3, restocked to 8 on day 4, removed on day 6
+            cur.executemany(
+                "INSERT INTO inventory_snapshots VALUES (%s, %s, %s);",
+                [(1001, T0, 5), (1001, T0 + timedelta(days=2), 0), (1001, T0 + timedelta(days=3), -1),
+                 (1001, T0 + timedelta(days=4), 8), (1001, T0 + timedelta(days=6), None)],
+            )
+            yield cur
+    finally:
+        conn.rollback()
+        conn.close()
+
+@pytest.mark.parametrize("at, expected", [
+    (T0 - timedelta(seconds=1), None),  # not seen yet
+    (T0, 5),
+    (T0 + timedelta(days=1), 5),  # unchanged days have no row
+    (T0 + timedelta(days=3, hours=12), -1),
+    (T0 + timedelta(days=5), 8),
+    (T0 + timedelta(days=7), None),  # removed
+])
+def test_inventory_level_at(pg, at, expected):
+    pg.execute("SELECT inventory_level_at(%s, %s);", (1001, at))
+    assert pg.fetchone()[0] == expected
+
+def test_stock_levels_and_stockouts_from_the_history(pg):
+    assert inventory_history.stock_levels_at(pg, T0 + timedelta(days=5)) == {1001: (8, T0 + timedelta(days=4))}
+    assert inventory_history.stockout_periods(pg) == [
+        (1001, 'MUG-R', T0 + timedelta(days=2), T0 + timedelta(days=4))]
@@ -0,0 +1,89 @@
+"""
+Tests for the sparse co-occurrence counts of product_affinity.py.
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+import product_affinity  # noqa: E402
+from product_affinity import AffinityState, top_associations  # noqa: E402
+
+
+def test_top_associations_match_brute_force():
+    baskets = {1: [10, 20], 2: [10, 20, 30], 3: [10, 20], 4: [20, 30], 5: [30], 6: [10, 20, 30]}
+    pairs = [(order, product) for order, products in baskets.items() for product in products]
+    state = AffinityState()
+    state.add_orders(np.array([p[0] for p in pairs]), np.array([p[1] for p in pairs]))
+
+    top = top_associations(state, top_n=1, min_pair_count=2)
+    best = dict(zip(top['product_id'].tolist(), top['related_product_id'].tolist()))
+    # 10 is always bought with 20; 30 appears with 20 in 3 of its 4 orders
+    assert best[10] == 20 and best[30] == 20
+
+    row = top['product_id'].tolist().index(10)
+    with_10 = sum(1 for products in baskets.values() if 10 in products)
+    with_20 = sum(1 for products in baskets.values() if 20 in products)
+    both = sum(1 for products in baskets.values() if 10 in products and 20 in products)
+    assert top['pair_count'][row] == both
+    assert top['support'][row] == pytest.approx(both / len(baskets))
+    assert top['confidence'][row] == pytest.approx(both / with_10)
+    assert top['lift'][row] == pytest.approx(both * len(baskets) / (with_10 * with_20))
+    assert set(top['rank'].tolist()) == {1}
+
+def test_affinity_state_skips_counted_orders():
+    state = AffinityState()
+    assert state.add_orders(np.array([5, 5, 6, 6]), np.array([1, 2, 1, 2])) == 2
+    # Order 5 again (re-read in the lookback) and a late order 3 with a lower id
+    assert state.add_orders(np.array([5, 5, 3, 3]), np.array([1, 2, 1, 2])) == 1
+    assert state.order_count == 3
+    assert state.counts.toarray().tolist() == [[3, 3], [3, 3]]
+
+def test_affinity_state_round_trips(tmp_path):
+    state = AffinityState(synced_until=1750000000.5)
+    state.add_orders(np.array([5, 5, 6]), np.array([1, 2, 1]))
+    path = str(tmp_path / "affinity_state.npz")
+    state.save(path)
+
+    loaded = AffinityState.load(path)
+    assert loaded.product_ids.tolist() == state.product_ids.tolist()
+    assert loaded.counts.toarray().tolist() == state.counts.toarray().tolist()
+    assert loaded.counted_orders.tolist() == [5, 6] and loaded.synced_until == 1750000000.5
+
+def test_state_without_counted_orders_is_recounted(tmp_path):
+    path = str(tmp_path / "affinity_state.npz")
+    np.savez(path, product_ids=np.array([1]))
+    assert AffinityState.load(path).order_count == 0
+
+class _CopyCursor:
+    def __init__(self, output):
+        self.output = output
+        self.sql = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchone(self):
+        return (1750000000.0,)
+
+    def mogrify(self, sql, params=None):
+        return (sql % tuple(params) if params else sql).encode()
+
+    def copy_expert(self, sql, buffer):
+        self.sql = " ".join(sql.split())
+        buffer.write(self.output)
+
+def test_fetch_order_products_reads_live_orders_synced_after_the_watermark(db):
+    cur = _CopyCursor("5\t1\n5\t2\n6\t1\n")
+    db.cursor = lambda: cur
+
+    order_ids, product_ids, read_at = product_affinity.fetch_order_products(db, 1749990000.0)
+    assert order_ids.tolist() == [5, 5, 6] and product_ids.tolist() == [1, 2, 1]
+    assert read_at == 1750000000.0
+    assert "o.cancelled_at IS NULL" in cur.sql
+    assert "li.last_synced_at > to_timestamp(1749990000.0)" in cur.sql
@@ -0,0 +1,66 @@
+"""
+Tests for the LRU product catalog of product_catalog.py.
+"""
+import pytest
+
+from product_catalog import CatalogEntry, ProductCatalog
+from records import LineItem
+
+
+def _line_item(product_id, vendor="Shopify vendor"):
+    return LineItem(1, product_id, None, "Mug", None, vendor, 1, "12.00")
+
+def test_catalog_evicts_the_least_recently_used_product():
+    catalog = ProductCatalog(max_entries=2)
+    catalog.put(1, "Mug", "Acme", "Kitchen")
+    catalog.put(2, "Cup", "Acme", "Kitchen")
+    catalog.get(1)  # 1 is now more recently used than 2
+    catalog.put(3, "Bowl", "Acme", "Kitchen")
+
+    assert 1 in catalog and 3 in catalog and 2 not in catalog
+    assert len(catalog) == 2 and catalog.evictions == 1
+
+def test_catalog_put_refreshes_an_existing_product():
+    catalog = ProductCatalog(max_entries=2)
+    catalog.put(1, "Mug", "Acme", "Kitchen")
+    catalog.put(2, "Cup", "Acme", "Kitchen")
+    catalog.put(1, "Mug", "Globex", "Kitchen")
+    catalog.put(3, "Bowl", "Acme", "Kitchen")
+
+    assert catalog.get(1) == CatalogEntry("Mug", "Globex", "Kitchen")
+    assert 2 not in catalog
+
+def test_catalog_stats_count_hits_and_misses():
+    catalog = ProductCatalog()
+    assert catalog.stats()["hit_rate"] == 0.0
+    catalog.put(1, "Mug", "Acme", "Kitchen")
+    catalog.get(1)
+    catalog.get(1)
+    catalog.get(2)
+
+    stats = catalog.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+def test_enrich_line_item_falls_back_to_the_line_item_vendor():
+    catalog = ProductCatalog()
+    catalog.put(1, "Mug", "Acme", "Kitchen")
+    catalog.put(2, "Cup", None, "Kitchen")
+
+    assert catalog.enrich_line_item(_line_item(1)) == ("Acme", "Kitchen")
+    assert catalog.enrich_line_item(_line_item(2)) == ("Shopify vendor", "Kitchen")
+    assert catalog.enrich_line_item(_line_item(3)) == ("Shopify vendor", None)
+    # A custom line item without a product is not a lookup
+    assert catalog.enrich_line_item(_line_item(None)) == ("Shopify vendor", None)
+    assert catalog.misses == 1
+
+def test_preload_keeps_the_most_recently_synced_products(db):
+    # Rows arrive oldest first, as the preload query orders them
+    db.cur.results = [[(1, "Mug", "Acme", "Kitchen"), (2, "Cup", "Acme", "Kitchen")]]
+    catalog = ProductCatalog(max_entries=2)
+
+    assert catalog.preload(db) == 2
+    sql, params = db.cur.statements[0]
+    assert "deleted_at IS NULL" in sql and params == (2,)
+    catalog.put(3, "Bowl", "Acme", "Kitchen")
+    assert 1 not in catalog and 2 in catalog
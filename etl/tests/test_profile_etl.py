@@ -0,0 +1,38 @@
+"""
+Tests for the stage profiling harness of profile_etl.py.
+"""
+import json
+import os
+
+import profile_etl
+
+
+def test_fetch_bodies_requests_pages_like_the_sync(shopify):
+    body = json.dumps({"orders": []}).encode()
+    shopify.responses = [shopify.response(200, body=body)]
+
+    assert profile_etl.fetch_bodies("orders") == [body]
+    _, params = shopify.calls[0]
+    assert params["status"] == "any"
+    assert params["fields"] == profile_etl.sync_all_data.shopify_request("orders")[2]
+
+def test_fetch_bodies_reads_saved_pages(tmp_path):
+    page = tmp_path / "orders-1.json"
+    page.write_bytes(b'{"orders": []}')
+    assert profile_etl.fetch_bodies("orders", [str(page)]) == [b'{"orders": []}']
+
+def test_every_stage_is_reported(tmp_path, capsys):
+    page = tmp_path / "customers-1.json"
+    page.write_text(json.dumps({"customers": [{"id": i, "email": f"c{i}@example.com"} for i in range(50)]}))
+    profiler = profile_etl.StageProfiler(str(tmp_path / "report"))
+
+    profile_etl.profile_entity(profiler, "customers", [str(page)], load=False)
+    profiler.write_summary()
+
+    stages = {result["stage"]: result for result in profiler.results}
+    assert list(stages) == ["customers.fetch", "customers.decode", "customers.transform"]
+    assert stages["customers.decode"]["records"] == 50 and stages["customers.transform"]["records"] == 50
+    assert all(result["peak_bytes"] >= 0 for result in profiler.results)
+    reports = set(os.listdir(tmp_path / "report"))
+    assert {"summary.json", "customers.decode.prof", "customers.decode.txt"} <= reports
+    assert "customers.transform" in capsys.readouterr().out
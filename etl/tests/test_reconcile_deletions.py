@@ -0,0 +1,66 @@
+"""
+Tests for the id diffing and batched removal of reconcile_deletions.py.
+"""
+import json
+from array import array
+
+import pytest
+
+import reconcile_deletions
+from reconcile_deletions import fetch_shopify_ids, missing_ids, remove_rows
+
+
+@pytest.mark.parametrize("db_ids, shopify_ids, expected", [
+    ([], [], []),
+    ([1, 2, 3], [], [1, 2, 3]),
+    ([1, 2, 3], [1, 2, 3], []),
+    ([1, 3, 5, 7], [2, 3, 4, 7, 8], [1, 5]),
+    ([10, 20], [1, 2, 3], [10, 20]),
+])
+def test_missing_ids(db_ids, shopify_ids, expected):
+    assert missing_ids(array('q', db_ids), array('q', shopify_ids)).tolist() == expected
+
+def _page(ids, next_url=None):
+    headers = {"Link": f'<{next_url}>; rel="next"'} if next_url else {}
+    return json.dumps({"products": [{"id": i} for i in ids]}).encode(), headers
+
+def test_fetch_shopify_ids_requests_ids_only_and_sorts(shopify):
+    first, first_headers = _page([30, 10], next_url="https://shop.example/products.json?page_info=abc")
+    second, _ = _page([20, 10])
+    shopify.responses = [shopify.response(200, first_headers, first), shopify.response(200, body=second)]
+
+    assert fetch_shopify_ids("products").tolist() == [10, 20, 30]
+    assert shopify.calls[0][1]["fields"] == "id"
+
+def test_hard_delete_unlinks_orders_before_deleting_customers(db, monkeypatch):
+    monkeypatch.setattr(reconcile_deletions, "UPDATE_BATCH_SIZE", 4)
+    db.cur.rowcount = 1
+    assert remove_rows(db, "customers", array('q', range(6)), hard_delete=True) == 2
+
+    statements = db.cur.statements
+    assert [sql.split()[0] for sql, _ in statements] == ["UPDATE", "DELETE", "UPDATE", "DELETE"]
+    assert statements[0] == ("UPDATE orders SET customer_id = NULL WHERE customer_id = ANY(%s);", ([0, 1, 2, 3],))
+    assert statements[3][1] == ([4, 5],)
+
+def test_tombstone_moves_last_synced_at(db):
+    remove_rows(db, "customers", array('q', [7]))
+    (sql, params), = db.cur.statements
+    assert "deleted_at = NOW(), last_synced_at = NOW()" in sql and params == ([7],)
+
+def test_reconcile_refuses_to_remove_most_of_a_table(db, monkeypatch):
+    monkeypatch.setattr(reconcile_deletions, "fetch_shopify_ids", lambda endpoint: array('q', [1]))
+    monkeypatch.setattr(reconcile_deletions, "fetch_db_ids",
+                        lambda conn, table, include_sample: array('q', [1, 2, 3]))
+    monkeypatch.setattr(reconcile_deletions, "get_db_connection", lambda: db)
+
+    assert reconcile_deletions.reconcile("customers") is None
+    assert db.cur.statements == [] and db.commits == 0 and db.closed
+
+def test_removed_products_close_the_inventory_history_of_their_variants(db, monkeypatch):
+    monkeypatch.setattr(reconcile_deletions, "UPDATE_BATCH_SIZE", 2)
+    remove_rows(db, "products", array('q', [101, 102, 103]), hard_delete=True)
+
+    statements = db.cur.sql()
+    assert [sql.split()[0] for sql in statements] == ["INSERT", "DELETE", "INSERT", "DELETE"]
+    assert statements[0].startswith("INSERT INTO inventory_snapshots")
+    assert db.cur.statements[0][1] == ([], [101, 102])
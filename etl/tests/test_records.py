@@ -0,0 +1,59 @@
+"""
+Tests for the compact record types of records.py.
+"""
+import pytest
+
+from records import RECORD_TYPES, Customer, LineItem, Order, Product, missing_fields, projection
+
+ORDER = {
+    "id": 5001, "customer": {"id": 42, "email": "a@example.com"}, "total_price": "36.00",
+    "financial_status": "paid", "fulfillment_status": None, "created_at": "2025-06-02T09:30:00Z",
+    "cancelled_at": None, "note": "leave at the door", "shipping_address": {"city": "Oslo"},
+    "line_items": [
+        {"id": 9001, "product_id": 101, "variant_id": 1001, "title": "Mug", "sku": "", "vendor": "Acme",
+         "quantity": 2, "price": "12.00", "properties": []},
+        {"id": 9002, "product_id": 102, "variant_id": 1003, "title": "Cup", "sku": "CUP", "vendor": "Acme",
+         "quantity": 1, "price": "12.00"},
+    ],
+}
+
+
+def test_order_from_shopify_keeps_only_what_the_loaders_read():
+    order = Order.from_shopify(ORDER)
+    assert order.customer_id == 42
+    assert order.number_of_items == 3
+    assert order.line_items[0] == LineItem(9001, 101, 1001, "Mug", None, "Acme", 2, "12.00")
+    assert not hasattr(order, "__dict__") and not hasattr(order, "note")
+
+def test_order_without_customer_or_line_items():
+    order = Order.from_shopify({"id": 1})
+    assert order.customer_id is None and order.line_items == () and order.total_price == "0.00"
+
+def test_customer_defaults():
+    customer = Customer.from_shopify({"id": 7, "email": "b@example.com"})
+    assert (customer.orders_count, customer.total_spent, customer.state) == (0, "0.00", "enabled")
+
+def test_low_cardinality_strings_are_interned():
+    vendor = "".join(["Ac", "me"])  # built at runtime, so not interned already
+    first = Product.from_shopify({"id": 1, "vendor": vendor})
+    second = Product.from_shopify({"id": 2, "vendor": "".join(["Ac", "me"])})
+    assert first.vendor is second.vendor
+
+def test_records_compare_and_print_by_their_fields():
+    assert Customer.from_shopify({"id": 7}) == Customer.from_shopify({"id": 7})
+    assert Customer.from_shopify({"id": 7}) != Customer.from_shopify({"id": 8})
+    assert repr(Customer.from_shopify({"id": 7})).startswith("Customer(id=7, email=None")
+
+@pytest.mark.parametrize("record_type", RECORD_TYPES.values())
+def test_shopify_fields_are_everything_from_shopify_reads(record_type):
+    # An item projected to SHOPIFY_FIELDS must build the same record
+    item = {**ORDER, "title": "Mug", "vendor": "Acme", "variants": [{"id": 1, "sku": "M"}],
+            "email": "a@example.com", "state": "enabled", "orders_count": 3}
+    projected = {field: value for field, value in item.items() if field in record_type.SHOPIFY_FIELDS}
+    assert record_type.from_shopify(projected) == record_type.from_shopify(item)
+
+def test_projection_and_missing_fields():
+    assert projection(Customer).split(",") == list(Customer.SHOPIFY_FIELDS)
+    assert missing_fields(Order, "id, customer,total_price") == [
+        "financial_status", "fulfillment_status", "created_at", "cancelled_at", "line_items"]
+    assert missing_fields(Order, ORDER.keys()) == []
@@ -0,0 +1,190 @@
+"""
+Tests for the staging-table loads of staging.py.
+"""
+import pytest
+
+import staging
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, "\\N"),
+    (42, "42"),
+    ("plain", "plain"),
+    ("back\\slash", "back\\\\slash"),
+    ("tab\there", "tab\\there"),
+    ("two\nlines", "two\\nlines"),
+    ("carriage\rreturn", "carriage\\rreturn"),
+    ("\\N", "\\\\N"),  # the literal text, not NULL
+])
+def test_copy_value_escapes_copy_text_format(value, expected):
+    assert staging._copy_value(value) == expected
+
+def test_copy_rows_copies_in_batches(db):
+    rows = [(i, f"order {i}") for i in range(5)]
+    assert staging.copy_rows(db.cur, 'orders_staging', ('id', 'title'), rows, batch_size=2) == 5
+    copies = [text for sql, text in db.cur.statements if sql.startswith("COPY")]
+    assert copies == ["0\torder 0\n1\torder 1\n", "2\torder 2\n3\torder 3\n", "4\torder 4\n"]
+
+def test_stage_rows_recreates_the_staging_table_and_commits(db):
+    assert staging.stage_rows(db, 'orders', ('id',), [(1,), (2,)]) == (2, 0)
+    sql = db.cur.sql()
+    assert sql[:2] == ["DROP TABLE IF EXISTS orders_staging;",
+                       "CREATE UNLOGGED TABLE orders_staging (LIKE orders INCLUDING DEFAULTS);"]
+    assert sql[-1] == "ANALYZE orders_staging;" and db.commits == 1
+
+def test_merge_staged_merges_each_key_once_and_only_changed_rows(db):
+    db.cur.rowcount = 3
+    assert staging.merge_staged(db.cur, 'orders', ('id', 'total_price', 'financial_status')) == 3
+    sql, params = db.cur.statements[0]
+    assert "SELECT DISTINCT ON (id) id, total_price, financial_status FROM orders_staging" in sql
+    assert "last_synced_at = NOW()" in sql
+    assert ("WHERE (orders.total_price, orders.financial_status) IS DISTINCT FROM "
+            "(EXCLUDED.total_price, EXCLUDED.financial_status)") in sql
+    assert params is None
+
+def test_merge_staged_can_be_limited_to_ids(db):
+    staging.merge_staged(db.cur, 'orders', ('id', 'total_price'), ids=[3, 1])
+    sql, params = db.cur.statements[0]
+    assert "FROM orders_staging WHERE id = ANY(%s)" in sql and params == ([3, 1],)
+
+def test_delete_unstaged_children_returns_the_deleted_ids(db):
+    db.cur.results = [[(1001,), (1002,)]]
+    assert staging.delete_unstaged_children(db.cur, 'product_variants', 'products', 'product_id') == [1001, 1002]
+    sql, params = db.cur.statements[0]
+    assert "USING products_staging parent" in sql and params == ('product_variants',)
+
+def test_swap_refuses_tables_with_foreign_keys(db):
+    db.cur.results = [[("orders_customer_id_fkey",)]]
+    with pytest.raises(ValueError, match="orders_customer_id_fkey"):
+        staging.swap_in_staged(db, 'orders', ('id',))
+    assert db.commits == 0
+
+def test_swap_renames_the_new_copy_in(db):
+    db.cur.results = [[], [("reporting", "SELECT")]]
+    db.cur.rowcount = 10
+    assert staging.swap_in_staged(db, 'product_affinities', ('product_id',)) == 10
+    assert db.cur.sql()[-4:] == [
+        "ALTER TABLE product_affinities RENAME TO product_affinities_old;",
+        "ALTER TABLE product_affinities_new RENAME TO product_affinities;",
+        'GRANT SELECT ON product_affinities TO "reporting";',
+        "DROP TABLE product_affinities_old;",
+    ]
+
+def test_merge_staged_writes_insert_only_columns_for_new_rows_only(db):
+    staging.merge_staged(db.cur, 'customers', ('id', 'email', 'orders_count', 'total_spent'),
+                         extra_updates={"deleted_at": "NULL"}, insert_only=('orders_count', 'total_spent'))
+    sql, _ = db.cur.statements[0]
+    insert, update = sql.split("ON CONFLICT")
+    assert "orders_count, total_spent" in insert
+    assert "orders_count" not in update and "total_spent" not in update
+    assert "WHERE (customers.email, customers.deleted_at) IS DISTINCT FROM (EXCLUDED.email, NULL)" in update
+
+
+# --- Failure isolation ---
+
+class _CopyCursor:
+    """
+    Records COPYed lines and dead letters, rejecting lines containing 'BAD'
+    the way Postgres rejects a value the column type cannot hold.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.dead_letters = []
+        self.savepoint = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        if sql.startswith("SAVEPOINT"):
+            self.savepoint = len(self.lines)
+        elif sql.startswith("ROLLBACK TO"):
+            del self.lines[self.savepoint:]
+        elif "etl_dead_letters" in sql:
+            self.dead_letters.append(params)
+
+    def copy_expert(self, sql, buffer):
+        lines = buffer.getvalue().splitlines()
+        if any("BAD" in line for line in lines):
+            raise staging.psycopg2.DataError("value too long for type character varying(255)")
+        self.lines.extend(lines)
+
+class _CopyConnection:
+    def __init__(self):
+        self.cur = _CopyCursor()
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        pass
+
+def test_stage_rows_dead_letters_only_rejected_rows():
+    bad_ids = {3, 4000, 12345}
+    rows = [(i, "BAD" if i in bad_ids else f"order {i}") for i in range(15000)]
+    conn = _CopyConnection()
+    assert staging.stage_rows(conn, 'orders', ('id', 'title'), rows) == (15000 - len(bad_ids), len(bad_ids))
+    assert len(conn.cur.lines) == 15000 - len(bad_ids)
+    assert sorted(params[1] for params in conn.cur.dead_letters) == sorted(bad_ids)
+
+class _MergeCursor:
+    """
+    Merges staged ids, failing any merge that includes one of bad_ids the
+    way a constraint violation fails the whole statement.
+    """
+
+    def __init__(self, staged_ids, bad_ids):
+        self.staged_ids = staged_ids
+        self.bad_ids = bad_ids
+        self.merged = []
+        self.dead_lettered = []
+        self.statements = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.statements.append(" ".join(sql.split()))
+        if sql.lstrip().startswith("INSERT INTO orders "):
+            ids = params[0]
+            if self.bad_ids & set(ids):
+                raise staging.psycopg2.IntegrityError("null value in column \"total_price\"")
+            self.merged.extend(ids)
+            self.rowcount = len(ids)
+        elif "INSERT INTO etl_dead_letters" in sql:
+            self.dead_lettered.extend(params[-1])
+        elif sql.startswith("DELETE"):
+            self.rowcount = len(params[0])
+
+    def fetchall(self):
+        return [(record_id,) for record_id in self.staged_ids]
+
+def test_merge_staged_isolated_dead_letters_only_failing_rows():
+    cur = _MergeCursor(list(range(1, 101)), bad_ids={7, 8, 64})
+    assert staging.merge_staged_isolated(cur, 'orders', ('id', 'total_price'), batch_size=32) == (97, 3)
+    assert sorted(cur.dead_lettered) == [7, 8, 64]
+    assert sorted(cur.merged) == [i for i in range(1, 101) if i not in (7, 8, 64)]
+    assert cur.statements[-1].startswith("UPDATE etl_dead_letters SET resolved_at = NOW()")
+
+@pytest.mark.parametrize("mode, expected", [
+    ("null", "UPDATE orders_staging staged SET customer_id = NULL WHERE staged.customer_id IS NOT NULL"),
+    ("stub", "INSERT INTO customers (id, state) SELECT DISTINCT staged.customer_id, %s FROM orders_staging"),
+    ("dead_letter", "SELECT id FROM orders_staging staged WHERE staged.customer_id IS NOT NULL"),
+])
+def test_resolve_missing_parents_modes(db, mode, expected):
+    staging.resolve_missing_parents(db.cur, 'orders', 'customer_id', 'customers', mode, {'state': 'stub'})
+    assert db.cur.statements[0][0].startswith(expected)
+
+def test_missing_parents_are_dead_lettered_with_a_foreign_key_error(db):
+    db.cur.results = [[(5,), (6,)]]
+    db.cur.rowcount = 2
+    assert staging.resolve_missing_parents(db.cur, 'orders', 'customer_id', 'customers') == 2
+    _, (dead_letter_sql, dead_letter_params), (delete_sql, _) = db.cur.statements
+    assert dead_letter_params == ('orders', "customer_id references a missing customers row", "23503", [5, 6])
+    assert delete_sql == "DELETE FROM orders_staging WHERE id = ANY(%s);"
+
+def test_unknown_missing_parent_mode_is_refused(db):
+    with pytest.raises(ValueError, match="Unknown missing-parent mode"):
+        staging.resolve_missing_parents(db.cur, 'orders', 'customer_id', 'customers', "ignore")
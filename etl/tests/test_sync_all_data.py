@@ -0,0 +1,175 @@
+"""
+Tests for the Shopify fetch and row-building helpers of sync_all_data.py.
+"""
+import json
+
+import pytest
+import requests
+
+import sync_all_data
+from product_catalog import ProductCatalog
+from records import RECORD_TYPES, Customer, Order, Product, projection
+
+
+# --- Rate-limit retries ---
+
+def test_shopify_get_honours_retry_after(shopify):
+    shopify.responses = [shopify.response(429, {"Retry-After": "2.0"}), shopify.response(503),
+                         shopify.response(200)]
+    assert sync_all_data.shopify_get("https://shop.example", {}).status_code == 200
+    assert shopify.sleeps == [2.0, 2 * sync_all_data.RETRY_BACKOFF_SECONDS]
+
+def test_shopify_get_gives_up_after_max_retries(shopify, monkeypatch):
+    monkeypatch.setattr(sync_all_data, "SHOPIFY_MAX_RETRIES", 2)
+    shopify.responses = [shopify.response(429), shopify.response(429), shopify.response(429)]
+    with pytest.raises(requests.exceptions.HTTPError):
+        sync_all_data.shopify_get("https://shop.example", {})
+    assert len(shopify.sleeps) == 2
+
+def test_shopify_get_does_not_retry_client_errors(shopify):
+    shopify.responses = [shopify.response(404)]
+    with pytest.raises(requests.exceptions.HTTPError):
+        sync_all_data.shopify_get("https://shop.example", {})
+    assert shopify.sleeps == []
+
+
+# --- Row building ---
+
+PRODUCT = {
+    "id": 101, "title": "Mug", "vendor": "Acme", "product_type": "Kitchen", "created_at": "2025-06-01T10:00:00Z",
+    "handle": "mug", "status": "active", "tags": "ceramic",
+    "variants": [
+        {"id": 1001, "title": "Red", "sku": "MUG-R", "price": "12.00", "inventory_quantity": 4, "position": 1},
+        {"id": 1002, "title": "Blue", "sku": "", "price": "12.00", "inventory_quantity": 0, "position": 2},
+    ],
+}
+
+def test_variant_rows_flatten_variants_with_their_product():
+    rows = sync_all_data.variant_rows([Product.from_shopify(PRODUCT)])
+    assert all(len(row) == len(sync_all_data.VARIANT_COLUMNS) for row in rows)
+    red, blue = (dict(zip(sync_all_data.VARIANT_COLUMNS, row)) for row in rows)
+    assert (red["id"], red["product_id"], red["sku"], red["inventory_quantity"]) == (1001, 101, "MUG-R", 4)
+    assert blue["sku"] is None  # empty SKUs load as NULL, not ''
+    assert blue["position"] == 2
+
+def test_product_row_keeps_the_variants_json():
+    row = dict(zip(sync_all_data.PRODUCT_COLUMNS, sync_all_data.product_row(Product.from_shopify(PRODUCT))))
+    assert json.loads(row["variants"]) == PRODUCT["variants"]
+
+ORDER = {
+    "id": 5001, "customer": {"id": 42}, "total_price": "36.00", "financial_status": "paid",
+    "fulfillment_status": None, "created_at": "2025-06-02T09:30:00Z", "cancelled_at": None,
+    "line_items": [
+        {"id": 9001, "product_id": 101, "variant_id": 1001, "title": "Mug", "vendor": "Shopify", "quantity": 2,
+         "price": "12.00"},
+        {"id": 9002, "product_id": 999, "variant_id": None, "title": "Gift wrap", "vendor": "Shopify",
+         "quantity": 1, "price": "12.00"},
+    ],
+}
+
+def test_line_item_rows_are_enriched_from_the_catalog():
+    catalog = ProductCatalog()
+    catalog.update_from_products([Product.from_shopify(PRODUCT)])
+    rows = sync_all_data.line_item_rows([Order.from_shopify(ORDER)], catalog)
+    mug, wrap = (dict(zip(sync_all_data.LINE_ITEM_COLUMNS, row)) for row in rows)
+
+    assert (mug["order_id"], mug["vendor"], mug["product_type"]) == (5001, "Acme", "Kitchen")
+    assert (wrap["vendor"], wrap["product_type"]) == ("Shopify", None)
+    assert catalog.stats()["hits"] == 1 and catalog.stats()["misses"] == 1
+
+
+def test_orders_are_fetched_in_every_status_with_cancelled_at(shopify):
+    body = json.dumps({"orders": [{**ORDER, "cancelled_at": "2025-06-03T08:00:00Z"}]}).encode()
+    shopify.responses = [shopify.response(200, body=body)]
+
+    order, = sync_all_data.get_shopify_orders()
+    params = shopify.calls[0][1]
+    assert params["status"] == "any"
+    assert "cancelled_at" in params["fields"].split(",")
+    row = dict(zip(sync_all_data.ORDER_COLUMNS, sync_all_data.order_row(order)))
+    assert row["cancelled_at"] == "2025-06-03T08:00:00Z" and row["number_of_items"] == 3
+
+
+# --- Customer aggregates ---
+
+def test_recompute_counts_live_orders_and_publishes_drift(db, monkeypatch):
+    monkeypatch.setattr(sync_all_data, "get_db_connection", lambda: db)
+    db.cur.results = [[(2,)], [(17,)]]
+
+    assert sync_all_data.recompute_customer_aggregates({42, 7}) == 2
+    (recompute_sql, recompute_params), (publish_sql, publish_params), _ = db.cur.statements
+    assert "o.cancelled_at IS NULL" in recompute_sql
+    assert "financial_status IS DISTINCT FROM 'voided'" in recompute_sql
+    assert recompute_params == ([7, 42],)
+    assert "customer_aggregates" in publish_params and db.commits == 1
+
+def test_recompute_without_drift_publishes_nothing(db, monkeypatch):
+    monkeypatch.setattr(sync_all_data, "get_db_connection", lambda: db)
+    db.cur.results = [[(0,)]]
+
+    assert sync_all_data.recompute_customer_aggregates([42]) == 0
+    assert len(db.cur.statements) == 1
+
+
+# --- Data versions ---
+
+def test_publish_data_version_records_and_announces_the_load(db):
+    db.cur.results = [[(17,)]]
+    assert sync_all_data.publish_data_version(db.cur, 'orders', 250) == 17
+
+    (record_sql, record_params), (notify_sql, notify_params) = db.cur.statements
+    assert record_sql.startswith("INSERT INTO sync_runs") and record_params[1:] == ('orders', 250)
+    assert notify_params == (sync_all_data.DATA_VERSION_CHANNEL, "17")
+    assert db.commits == 0  # visible only when the caller's load commits
+
+def test_publish_data_version_completes_the_locked_run(db, monkeypatch):
+    monkeypatch.setitem(sync_all_data.active_runs, 'orders', 8)
+    db.cur.results = [[(18,)]]
+    sync_all_data.publish_data_version(db.cur, 'orders', 3)
+
+    record_sql, record_params = db.cur.statements[0]
+    assert record_sql.startswith("UPDATE sync_runs SET status = 'completed'") and record_params == (3, 8)
+
+
+# --- Page decoding ---
+
+def test_decode_page_builds_records_so_the_dicts_can_be_freed():
+    body = json.dumps({"orders": [ORDER]}).encode()
+    order, = sync_all_data.decode_page("orders", body, Order)
+    assert isinstance(order, Order) and order.id == 5001
+    assert sync_all_data.decode_page("orders", body) == [ORDER]
+
+
+# --- Field projection ---
+
+def test_shopify_request_matches_the_sync_for_every_entity():
+    for entity, record_type in RECORD_TYPES.items():
+        endpoint, params, fields = sync_all_data.shopify_request(entity)
+        assert endpoint == entity and fields == projection(record_type)
+    assert sync_all_data.shopify_request("orders")[1] == {"status": "any"}
+
+def test_next_pages_keep_the_projection(shopify):
+    first = json.dumps({"customers": [{"id": 1}]}).encode()
+    link = {"Link": '<https://shop.example/customers.json?page_info=abc&limit=250>; rel="next"'}
+    shopify.responses = [shopify.response(200, link, first), shopify.response(200, body=b'{"customers": []}')]
+
+    pages = list(sync_all_data.iter_shopify_pages("customers", record_type=Customer))
+    assert len(pages) == 1
+    (_, first_params), (next_url, next_params) = shopify.calls
+    assert first_params["fields"] == next_params["fields"] == projection(Customer)
+    assert "page_info=abc" in next_url and "limit" not in next_params
+
+def test_fields_that_leave_out_a_read_field_are_refused():
+    with pytest.raises(ValueError, match="total_spent"):
+        next(sync_all_data.iter_shopify_pages("customers", fields="id,email", record_type=Customer))
+
+def test_a_response_missing_a_field_is_reported_once(monkeypatch, capsys):
+    monkeypatch.setattr(sync_all_data, "_reported_missing_fields", set())
+    body = json.dumps({"customers": [{"id": 1, "email": "a@example.com"}]}).encode()
+    sync_all_data.decode_page("customers", body, Customer)
+    sync_all_data.decode_page("customers", body, Customer)
+    assert capsys.readouterr().out.count("Warning: customers response has no first_name") == 1
+
+def test_responses_are_negotiated_as_gzip():
+    assert sync_all_data.shopify_headers()["Accept-Encoding"] == "gzip"
+    assert sync_all_data.shopify_headers(compress=False)["Accept-Encoding"] == "identity"
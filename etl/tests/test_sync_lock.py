@@ -0,0 +1,164 @@
+"""
+Tests for the advisory-lock guarded sync runs of sync_lock.py, against an
+in-memory stand-in for the lock and the 'sync_runs' table.
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import sync_all_data
+from sync_lock import SyncLock, active_runs
+
+
+class LockServer:
+    """
+    The advisory locks and 'sync_runs' rows shared by every connection,
+    answering exactly the statements SyncLock sends.
+    """
+
+    def __init__(self):
+        self.owner = None
+        self.runs = []  # dicts with id, status, started_at
+        self.ticks = 0
+
+    def connect(self):
+        return LockConnection(self)
+
+    def now(self):
+        self.ticks += 1
+        return datetime(2025, 6, 1, tzinfo=timezone.utc) + timedelta(seconds=self.ticks)
+
+    def statuses(self):
+        return [run["status"] for run in self.runs]
+
+    def _add(self, status):
+        run = {"id": len(self.runs) + 1, "status": status, "started_at": self.now()}
+        self.runs.append(run)
+        return run
+
+    def _with_status(self, status):
+        return [run for run in self.runs if run["status"] == status]
+
+    def answer(self, conn, sql, params):
+        if "pg_try_advisory_lock" in sql:
+            if self.owner in (None, conn):
+                self.owner = conn
+                return [(True,)]
+            return [(False,)]
+        if "pg_advisory_unlock" in sql:
+            self.owner = None
+            return [(True,)]
+        if "clock_timestamp" in sql:
+            return [(self.now(),)]
+        if "SET status = 'abandoned'" in sql:
+            for run in self._with_status("running"):
+                run["status"] = "abandoned"
+            return None
+        if "'running', pg_backend_pid()" in sql:
+            run = self._add("running")
+            return [(run["id"], run["started_at"])]
+        if sql.lstrip().startswith("INSERT INTO sync_runs"):
+            return [(self._add(params[2])["id"],)]
+        if "RETURNING started_at" in sql:
+            claimed = self._with_status("handoff_requested")
+            for run in claimed:
+                run["status"] = "handoff_served"
+            return [(run["started_at"],) for run in claimed]
+        if "status = 'handoff_served'" in sql:
+            self.runs[params[0] - 1]["status"] = "handoff_served"
+            return None
+        if "WHERE id = %s AND status = 'running'" in sql:
+            run = self.runs[params[1] - 1]
+            if run["status"] == "running":
+                run["status"] = params[0]
+            return None
+        if "'handoff_requested'" in sql:
+            return [(bool(self._with_status("handoff_requested")),)]
+        if "'completed'" in sql:
+            return [(any(run["started_at"] >= params[2] for run in self._with_status("completed")),)]
+        if "SELECT id, started_at, backend_pid" in sql:
+            running = self._with_status("running")
+            return [(running[-1]["id"], running[-1]["started_at"], 4242)] if running else []
+        raise AssertionError(f"unexpected statement: {sql}")
+
+class LockConnection:
+    def __init__(self, server):
+        self.server = server
+        self.autocommit = False
+        self.closed = False
+
+    def cursor(self):
+        return LockCursor(self)
+
+    def close(self):
+        self.closed = True
+
+class LockCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def description(self):
+        return None if self.rows is None else [("column",)]
+
+    def execute(self, sql, params=()):
+        self.rows = self.conn.server.answer(self.conn, sql, params)
+
+    def fetchall(self):
+        return self.rows
+
+@pytest.fixture
+def server(monkeypatch):
+    server = LockServer()
+    monkeypatch.setattr(sync_all_data, "get_db_connection", server.connect)
+    monkeypatch.setattr(sync_all_data, "SHOPIFY_STORE_URL", "shop.example")
+    yield server
+    active_runs.clear()
+
+def test_a_second_run_skips_a_locked_entity(server):
+    holder = SyncLock(server.connect(), "shop.example", "orders")
+    assert holder.acquire()
+    holder.start_run()
+
+    assert not SyncLock(server.connect(), "shop.example", "orders").acquire("exit")
+    assert server.statuses() == ["running", "skipped"]
+
+def test_unknown_lock_mode_is_refused(server):
+    with pytest.raises(ValueError, match="Unknown lock mode"):
+        SyncLock(server.connect(), "shop.example", "orders").acquire("queue")
+
+def test_a_handoff_makes_the_holder_sync_again(server):
+    calls = []
+
+    def sync():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            # Another process asks for orders while this run is loading them
+            assert not SyncLock(server.connect(), "shop.example", "orders").acquire("handoff")
+        return f"result {len(calls)}"
+
+    assert sync_all_data.run_locked("orders", sync) == "result 2"
+    assert calls == [0, 1]
+    assert server.statuses() == ["unpublished", "handoff_served", "unpublished"]
+    assert server.owner is None and not active_runs
+
+def test_a_failed_sync_is_recorded_and_releases_the_lock(server):
+    def sync():
+        raise RuntimeError("Shopify went away")
+
+    with pytest.raises(RuntimeError):
+        sync_all_data.run_locked("orders", sync)
+    assert server.statuses() == ["failed"]
+    assert server.owner is None and not active_runs
+
+def test_run_locked_returns_none_when_another_run_holds_the_lock(server):
+    SyncLock(server.connect(), "shop.example", "orders").try_acquire()
+    assert sync_all_data.run_locked("orders", lambda: "synced") is None
+    assert server.statuses() == ["skipped"]
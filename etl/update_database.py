@@ -11,6 +11,22 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 
+# Incremental schema changes applied after update_db.sql, in order.
+# Every file is idempotent, so re-running them against an up-to-date
+# database is harmless.
+MIGRATION_FILES = [
+    'reconcile_db.sql',
+    'variants_db.sql',
+    'line_items_db.sql',
+    'customer_aggregates_db.sql',
+    'sync_runs_db.sql',
+    'order_sketches_db.sql',
+    'sync_locks_db.sql',
+    'dead_letters_db.sql',
+    'product_affinities_db.sql',
+    'inventory_snapshots_db.sql',
+]
+
 def update_database():
     """
     Creates the customers and orders tables using the update_db.sql file.
@@ -54,6 +70,40 @@ def update_database():
         print(f"Error updating database: {e}")
         return False
 
+def apply_migrations():
+    """
+    Applies the incremental schema files listed in MIGRATION_FILES.
+    """
+    print("\nApplying schema migrations...")
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    try:
+        conn = psycopg2.connect(
+            dbname=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            host=DB_HOST,
+            port=DB_PORT,
+            sslmode='require'
+        )
+
+        with conn.cursor() as cur:
+            for filename in MIGRATION_FILES:
+                with open(os.path.join(script_dir, filename), 'r') as file:
+                    migration_sql = file.read()
+                print(f"Executing {filename}...")
+                cur.execute(migration_sql)
+            conn.commit()
+            print("✅ Migrations applied")
+
+        conn.close()
+        return True
+
+    except Exception as e:
+        print(f"Error applying migrations: {e}")
+        return False
+
 def check_tables():
     """
     Check what tables exist in the database.
@@ -91,8 +141,8 @@ def check_tables():
     except Exception as e:
         print(f"Error checking tables: {e}")
 
-if __name__ == "__main__":
-    success = update_database()
+def main():
+    success = update_database() and apply_migrations()
     check_tables()
     
     if success:
@@ -102,4 +152,7 @@ if __name__ == "__main__":
         print("  - customers (for Shopify customers)")
         print("  - orders (for Shopify orders)")
     else:
-        print("\n❌ Please check the error and try again.")
\ No newline at end of file
+        print("\n❌ Please check the error and try again.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+-- variants_db.sql
+-- Normalizes product variants into their own table so SKU, price and
+-- inventory lookups are index scans instead of unpacking products.variants.
+-- Safe to run more than once.
+
+CREATE TABLE IF NOT EXISTS product_variants (
+    id BIGINT PRIMARY KEY, -- Using the Shopify variant ID as the primary key
+    product_id BIGINT NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    title VARCHAR(255),
+    sku VARCHAR(255),
+    price NUMERIC(10, 2),
+    compare_at_price NUMERIC(10, 2),
+    inventory_quantity INT,
+    inventory_item_id BIGINT,
+    position INT,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    last_synced_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE product_variants IS 'Stores product variants synced from Shopify, one row per variant.';
+
+CREATE INDEX IF NOT EXISTS product_variants_product_id_idx ON product_variants (product_id);
+CREATE INDEX IF NOT EXISTS product_variants_sku_idx ON product_variants (sku);
+
+-- jsonb_path_ops keeps the index small and serves @> containment queries such as
+-- SELECT id FROM products WHERE variants @> '[{"sku": "ABC-1"}]';
+CREATE INDEX IF NOT EXISTS products_variants_gin_idx ON products USING GIN (variants jsonb_path_ops);
@@ -10,7 +10,7 @@ echo.
 cd /d "d:\Coding\shopify\etl"
 
 echo Running comprehensive data sync...
-python sync_all_data.py
+python cli.py sync
 
 echo.
 echo ========================================
@@ -15,7 +15,7 @@ Set-Location "d:\Coding\shopify\etl"
 
 # Run the sync script
 try {
-    python sync_all_data.py
+    python cli.py sync
     
     Write-Host ""
     Write-Host "========================================" -ForegroundColor Green